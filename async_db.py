@@ -0,0 +1,390 @@
+"""Асинхронный фасад над database.py.
+
+Все запросы выполняются вне event loop: записи идут через один
+поток-писатель, чтения — через небольшой пул потоков-читателей.
+У каждого потока своё долгоживущее соединение в режиме WAL.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, List, AsyncIterator
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_readers = ThreadPoolExecutor(max_workers=database.READER_POOL_SIZE, thread_name_prefix="db-reader")
+
+async def _timed(executor, kind: str, name: str, call):
+    """Выполняет call в executor и пишет время и ошибки в метрики под именем name"""
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+    except Exception:
+        metrics.DB_ERRORS.inc(name)
+        raise
+    finally:
+        metrics.DB_SECONDS.observe(time.perf_counter() - start, name, kind)
+
+async def _read(func, *args, **kwargs):
+    """Выполняет читающий запрос в пуле читателей"""
+    return await _timed(_readers, "read", func.__name__, functools.partial(func, *args, **kwargs))
+
+async def _write(func, *args, **kwargs):
+    """Выполняет пишущий запрос в потоке-писателе"""
+    return await _timed(_writer, "write", func.__name__, functools.partial(func, *args, **kwargs))
+
+async def _write_user(telegram_id: int, cached: tuple, func, *args, **kwargs):
+    """Пишущий запрос по пользователю: сбрасывает кэш чтений cached и оповещает подписчиков"""
+    loop = asyncio.get_running_loop()
+    future = _writer.submit(functools.partial(func, *args, **kwargs))
+    # Кэш сбрасывается по завершении записи в потоке-писателе, даже если
+    # ожидающую задачу отменили; колбэк добавлен раньше wrap_future,
+    # поэтому сброс происходит до возврата из этой функции
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_invalidate, telegram_id, *cached))
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wrap_future(future)
+    except Exception:
+        metrics.DB_ERRORS.inc(func.__name__)
+        raise
+    finally:
+        metrics.DB_SECONDS.observe(time.perf_counter() - start, func.__name__, "write")
+    _changed(telegram_id)
+    return result
+
+# ==================== ПОДПИСКА НА ИЗМЕНЕНИЯ ====================
+
+_change_listeners = []
+
+def add_change_listener(callback):
+    """callback(telegram_id) вызывается в event loop после каждой записи по пользователю"""
+    _change_listeners.append(callback)
+
+def remove_change_listener(callback):
+    """Отписывает callback, добавленный add_change_listener"""
+    if callback in _change_listeners:
+        _change_listeners.remove(callback)
+
+def _changed(telegram_id: int):
+    for callback in _change_listeners:
+        try:
+            callback(telegram_id)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика изменений для {telegram_id}: {e}")
+
+# ==================== КЭШ ЧТЕНИЙ ПО ПОЛЬЗОВАТЕЛЮ ====================
+# LRU-кэш для get_user / get_medical / get_checks / get_vacation. Живёт
+# в event loop, поэтому блокировки не нужны. Каждая запись сбрасывает
+# ровно те ключи, которые меняет, и увеличивает их поколение: чтение,
+# начатое до записи и закончившееся после, не положит в кэш старые данные.
+# Поколение хранится, только пока по ключу идёт чтение, — иначе словарь
+# поколений рос бы с каждой записью и импортом без ограничения.
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 4096))
+
+_cache: "OrderedDict[Tuple[str, int], Optional[Tuple]]" = OrderedDict()
+# Ключ -> [поколение, чтений в работе]
+_cache_generations: Dict[Tuple[str, int], List[int]] = {}
+_cache_counters = {"hits": 0, "misses": 0, "invalidations": 0}
+_USER_READS = (database.get_user, database.get_medical, database.get_checks, database.get_vacation)
+
+async def _cached_read(func, telegram_id: int):
+    """Чтение по пользователю через кэш"""
+    key = (func.__name__, telegram_id)
+    if key in _cache:
+        _cache.move_to_end(key)
+        _cache_counters["hits"] += 1
+        return _cache[key]
+
+    _cache_counters["misses"] += 1
+    entry = _cache_generations.setdefault(key, [0, 0])
+    generation = entry[0]
+    entry[1] += 1
+    try:
+        value = await _read(func, telegram_id)
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _cache_generations[key]
+    if entry[0] == generation:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        if len(_cache) > USER_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+def _invalidate(telegram_id: int, *funcs):
+    """Сбрасывает кэш заданных чтений пользователя"""
+    for func in funcs:
+        key = (func.__name__, telegram_id)
+        entry = _cache_generations.get(key)
+        if entry is not None:
+            entry[0] += 1
+        _cache.pop(key, None)
+        _cache_counters["invalidations"] += 1
+
+def cache_stats() -> dict:
+    """Счётчики кэша: hits, misses, invalidations и текущий размер"""
+    return dict(_cache_counters, size=len(_cache), capacity=USER_CACHE_SIZE)
+
+def close():
+    """Дожидается незавершённых запросов и закрывает соединения"""
+    _writer.shutdown(wait=True)
+    _readers.shutdown(wait=True)
+    database.close_connections()
+
+# ==================== СХЕМА ====================
+
+async def init_db():
+    """Создаёт все таблицы"""
+    await _write(database.init_db)
+
+async def backfill_day_columns(chunk_size: int = database.BACKFILL_CHUNK_SIZE) -> int:
+    """Фоново заполняет целочисленные даты порциями. Каждая порция — отдельная
+    задача писателя, так что записи бота проходят между ними. Возвращает число строк"""
+    position = None
+    total = 0
+    while True:
+        position, updated = await _write(database.backfill_day_columns, position, chunk_size)
+        total += updated
+        if position is None:
+            return total
+
+# ==================== USERS ====================
+
+async def add_user(telegram_id: int, surname: str, name: str, patronymic: str, rank: str) -> bool:
+    """Добавляет нового пользователя"""
+    return await _write_user(telegram_id, (database.get_user,), database.add_user,
+                             telegram_id, surname, name, patronymic, rank)
+
+async def get_user(telegram_id: int) -> Optional[Tuple]:
+    """Получает данные пользователя"""
+    return await _cached_read(database.get_user, telegram_id)
+
+async def update_user(telegram_id: int, surname: str = None, name: str = None,
+                      patronymic: str = None, rank: str = None) -> bool:
+    """Обновляет данные пользователя"""
+    return await _write_user(telegram_id, (database.get_user,), database.update_user, telegram_id,
+                             surname=surname, name=name, patronymic=patronymic, rank=rank)
+
+async def delete_user(telegram_id: int) -> bool:
+    """Удаляет пользователя и все связанные данные"""
+    return await _write_user(telegram_id, _USER_READS, database.delete_user, telegram_id)
+
+async def get_all_users() -> List[Tuple]:
+    """Получает всех пользователей (для админа)"""
+    return await _read(database.get_all_users)
+
+# ==================== MEDICAL (ВЛК/УМО) ====================
+
+async def add_medical(telegram_id: int, vlk_date: str, umo_date: str = None) -> bool:
+    """Добавляет или обновляет медицинские данные"""
+    return await _write_user(telegram_id, (database.get_medical,), database.add_medical,
+                             telegram_id, vlk_date, umo_date)
+
+async def get_medical(telegram_id: int) -> Optional[Tuple]:
+    """Получает медицинские данные пользователя"""
+    return await _cached_read(database.get_medical, telegram_id)
+
+# ==================== CHECKS (КБП) ====================
+
+async def get_checks(telegram_id: int) -> Optional[Tuple]:
+    """Получает проверки КБП пользователя"""
+    return await _cached_read(database.get_checks, telegram_id)
+
+async def add_check(telegram_id: int, exercise: int, check_date: str) -> bool:
+    """Добавляет или обновляет проверку КБП"""
+    return await _write_user(telegram_id, (database.get_checks,), database.add_check,
+                             telegram_id, exercise, check_date)
+
+# ==================== VACATION (Отпуск) ====================
+
+async def add_vacation(telegram_id: int, start_date: str, end_date: str) -> bool:
+    """Добавляет или обновляет отпуск"""
+    return await _write_user(telegram_id, (database.get_vacation,), database.add_vacation,
+                             telegram_id, start_date, end_date)
+
+async def add_vacation_days(telegram_id: int, start_day: int, end_day: int) -> int:
+    """Добавляет или обновляет отпуск по номерам дней; возвращает его длину"""
+    return await _write_user(telegram_id, (database.get_vacation,), database.add_vacation_days,
+                             telegram_id, start_day, end_day)
+
+async def get_vacation(telegram_id: int) -> Optional[Tuple]:
+    """Получает данные об отпуске пользователя"""
+    return await _cached_read(database.get_vacation, telegram_id)
+
+# ==================== ИМПОРТ СПИСКА ====================
+
+async def import_roster(rows: List[Tuple]) -> int:
+    """Записывает пачку строк списка одной транзакцией (database.import_roster),
+    сбрасывает кэш и оповещает подписчиков по каждому пользователю"""
+    imported = await _write(database.import_roster, rows)
+    for row in rows:
+        _invalidate(row[0], *_USER_READS)
+        _changed(row[0])
+    return imported
+
+# ==================== СНИМОК ДЛЯ РАССЫЛКИ ====================
+
+async def _iter_chunks(chunks) -> AsyncIterator[List]:
+    """Прокручивает синхронный генератор пачек через пул читателей"""
+    try:
+        while True:
+            # В метриках — имя генератора, например iter_due_snapshot
+            rows = await _timed(_readers, "read", chunks.__name__, functools.partial(next, chunks, None))
+            if rows is None:
+                break
+            yield rows
+    finally:
+        await _timed(_readers, "read", chunks.__name__, chunks.close)
+
+def iter_snapshot(chunk_size: int = 500) -> AsyncIterator[List]:
+    """Отдаёт пачками строки database.iter_snapshot, не держа весь список в памяти"""
+    return _iter_chunks(database.iter_snapshot(chunk_size))
+
+def iter_due_snapshot(horizon_days: int = database.REMINDER_HORIZON_DAYS,
+                      chunk_size: int = 500, shard: int = None) -> AsyncIterator[List]:
+    """Только пользователи со сроками в окне напоминаний (database.iter_due_snapshot)"""
+    return _iter_chunks(database.iter_due_snapshot(horizon_days, chunk_size, shard))
+
+async def get_snapshot_page(cursor_id: int = 0, limit: int = 10, backward: bool = False) -> Tuple[List, bool]:
+    """Страница снимка по ключу telegram_id (keyset-пагинация)"""
+    return await _read(database.get_snapshot_page, cursor_id, limit, backward)
+
+def iter_snapshot_rows(telegram_ids: List[int], chunk_size: int = 500) -> AsyncIterator[List]:
+    """Строки снимка для заданных пользователей (database.iter_snapshot_rows)"""
+    return _iter_chunks(database.iter_snapshot_rows(telegram_ids, chunk_size))
+
+# ==================== СРОКИ ПО КАТЕГОРИЯМ (/due) ====================
+
+async def get_due_page(categories: List[str], horizon_days: Optional[int], rank: str = None,
+                       cursor: Tuple[int, int, int] = None, limit: int = 10,
+                       backward: bool = False) -> Tuple[List, bool]:
+    """Страница позиций со сроками (database.get_due_page)"""
+    return await _read(database.get_due_page, categories, horizon_days, rank, cursor, limit, backward)
+
+async def get_ranks() -> List[str]:
+    """Все звания, что есть в базе"""
+    return await _read(database.get_ranks)
+
+# ==================== ПОИСК ====================
+
+async def search_users(terms: List[str], limit: int) -> Tuple[List, bool]:
+    """Поиск по ФИО и званию (database.search_users)"""
+    return await _read(database.search_users, terms, limit)
+
+# ==================== НАЧАЛО НАПОМИНАНИЙ ====================
+
+async def get_reminder_starts(telegram_ids: List[int] = None) -> List[Tuple[int, Optional[int]]]:
+    """(telegram_id, первый день напоминаний) — см. database.get_reminder_starts"""
+    return await _read(database.get_reminder_starts, telegram_ids)
+
+# ==================== ЖУРНАЛ НАПОМИНАНИЙ ====================
+
+async def start_reminder_run(run_day: int) -> bool:
+    """Открывает прогон за день и его шарды"""
+    return await _write(database.start_reminder_run, run_day)
+
+async def get_reminder_run(run_day: int) -> Optional[Tuple]:
+    """Прогон за день"""
+    return await _read(database.get_reminder_run, run_day)
+
+async def claim_shard(run_day: int, owner: str, lease_seconds: float) -> Optional[Tuple[int, int]]:
+    """Берёт в аренду свободный шард"""
+    return await _write(database.claim_shard, run_day, owner, lease_seconds)
+
+async def next_shard_expiry(run_day: int) -> Optional[float]:
+    """Когда истекает ближайшая аренда незавершённого шарда; None — прогон готов"""
+    return await _read(database.next_shard_expiry, run_day)
+
+async def renew_shard(run_day: int, shard: int, owner: str, lease_seconds: float) -> bool:
+    """Продлевает аренду шарда"""
+    return await _write(database.renew_shard, run_day, shard, owner, lease_seconds)
+
+async def complete_shard(run_day: int, shard: int, owner: str) -> bool:
+    """Отмечает шард готовым"""
+    return await _write(database.complete_shard, run_day, shard, owner)
+
+async def get_sent_reminders(run_day: int, telegram_ids: List[int]) -> set:
+    """Уже отправленные за день напоминания"""
+    return await _read(database.get_sent_reminders, run_day, telegram_ids)
+
+async def record_sent_reminders(run_day: int, entries: List[Tuple[int, str, str]],
+                                shard: int = None, last_telegram_id: int = None) -> bool:
+    """Записывает отправленные напоминания и сдвигает точку продолжения шарда"""
+    return await _write(database.record_sent_reminders, run_day, entries, shard, last_telegram_id)
+
+# ==================== МЕНЮ НА МЕСТЕ ====================
+
+async def get_menu_render(chat_id: int, message_id: int) -> Optional[str]:
+    """Хэш последнего показанного в сообщении меню"""
+    return await _read(database.get_menu_render, chat_id, message_id)
+
+async def save_menu_render(chat_id: int, message_id: int, digest: str) -> bool:
+    """Запоминает хэш показанного меню"""
+    return await _write(database.save_menu_render, chat_id, message_id, digest)
+
+# ==================== СОСТОЯНИЯ FSM ====================
+
+async def get_fsm_record(key: str, not_before: float) -> Optional[Tuple]:
+    """Состояние и данные FSM по ключу"""
+    return await _read(database.get_fsm_record, key, not_before)
+
+async def get_fsm_state_keys(not_before: float) -> List[str]:
+    """Ключи записей с незаконченной анкетой"""
+    return await _read(database.get_fsm_state_keys, not_before)
+
+async def has_fsm_state(key_prefix: str, not_before: float) -> bool:
+    """Есть ли незаконченная анкета у записей с ключом на key_prefix"""
+    return await _read(database.has_fsm_state, key_prefix, not_before)
+
+async def save_fsm_records(records: List[Tuple], updated_at: float) -> bool:
+    """Записывает пачку изменений FSM"""
+    return await _write(database.save_fsm_records, records, updated_at)
+
+async def evict_fsm_records(older_than: float) -> int:
+    """Удаляет устаревшие состояния FSM"""
+    return await _write(database.evict_fsm_records, older_than)
+
+# ==================== ВЕДУЩИЙ ПРОЦЕСС ====================
+
+async def acquire_leadership(name: str, owner: str, lease_seconds: float) -> bool:
+    """Берёт или продлевает аренду роли"""
+    return await _write(database.acquire_leadership, name, owner, lease_seconds)
+
+async def release_leadership(name: str, owner: str) -> bool:
+    """Отдаёт роль"""
+    return await _write(database.release_leadership, name, owner)
+
+# ==================== ЛЕНТА ИЗМЕНЕНИЙ ====================
+
+# Как часто смотреть в ленту изменений, которые сделали другие процессы
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', 1.0))
+
+async def watch_changes(interval: float = CHANGES_POLL_INTERVAL):
+    """Читает ленту user_changes: сбрасывает кэш и оповещает подписчиков об изменениях
+    из других процессов (свои записи тоже приходят сюда — повтор безвреден)"""
+    last_seq = await _read(database.get_last_change_seq)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changes = await _read(database.get_user_changes, last_seq)
+            while changes:
+                last_seq = changes[-1][0]
+                for telegram_id in {change[1] for change in changes}:
+                    _invalidate(telegram_id, *_USER_READS)
+                    _changed(telegram_id)
+                changes = await _read(database.get_user_changes, last_seq)
+        except Exception as e:
+            logger.error(f"Ошибка чтения ленты изменений: {e}")
+
+async def prune_user_changes() -> int:
+    """Удаляет старые записи ленты изменений"""
+    return await _write(database.prune_user_changes)
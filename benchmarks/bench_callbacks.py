@@ -0,0 +1,87 @@
+"""Микробенчмарк маршрутизации нажатий: цепочка lambda-фильтров против CallbackRoutes.
+
+Для каждого числа кнопок собирает два диспетчера aiogram (без FSM, чтобы
+мерить только выбор обработчика): в одном N обработчиков
+`lambda c: c.data == "btnI"`, как раньше в bot.py, в другом — одна
+таблица callback_router.CallbackRoutes. Обработчики ничего не делают.
+Нажатия равномерно распределены по всем кнопкам, плюс в каждом
+десятом — кнопка с параметрами ("page:next:2:123"). Время — на одно
+обновление через Dispatcher.feed_update.
+
+Запуск из корня репозитория (нужен aiogram):
+    python benchmarks/bench_callbacks.py --buttons 10 50 200 --updates 20000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+from callback_router import CallbackRoutes  # noqa: E402
+
+async def _noop(callback_query, *args):
+    return True
+
+def lambda_dispatcher(buttons: int) -> Dispatcher:
+    """Как было: по фильтру на кнопку, параметрические — через startswith"""
+    dp = Dispatcher(disable_fsm=True)
+    for i in range(buttons):
+        dp.callback_query.register(_noop, lambda c, data=f"btn{i}": c.data == data)
+    dp.callback_query.register(_noop, lambda c: c.data and c.data.startswith("page:"))
+    return dp
+
+def table_dispatcher(buttons: int) -> Dispatcher:
+    dp = Dispatcher(disable_fsm=True)
+    routes = CallbackRoutes()
+    for i in range(buttons):
+        routes.button(f"btn{i}")(_noop)
+    routes.prefix("page")(_noop)
+    dp.callback_query.register(routes.dispatch)
+    return dp
+
+def make_updates(buttons: int, count: int):
+    updates = []
+    for update_id in range(count):
+        data = CallbackRoutes.pack("page", "next", 2, 123) if update_id % 10 == 9 else f"btn{update_id % buttons}"
+        updates.append(Update.model_validate({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": "1",
+                "from": {"id": 1_000_000 + update_id % 500, "is_bot": False, "first_name": "Tap"},
+                "data": data,
+            },
+        }))
+    return updates
+
+async def _measure(dp: Dispatcher, bot: Bot, updates) -> float:
+    start = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - start) / len(updates)
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buttons", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    bot = Bot(token="42:FAKE")
+    print(f"Нажатий на замер: {args.updates}, мкс на обновление (feed_update)")
+    print(f"{'кнопок':>7} {'lambda':>9} {'таблица':>9} {'ускорение':>10}")
+    for buttons in args.buttons:
+        updates = make_updates(buttons, args.updates)
+        chain = await _measure(lambda_dispatcher(buttons), bot, updates)
+        table = await _measure(table_dispatcher(buttons), bot, updates)
+        print(f"{buttons:>7} {chain * 1e6:>9.1f} {table * 1e6:>9.1f} {chain / table:>9.1f}x")
+    await bot.session.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
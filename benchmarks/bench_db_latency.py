@@ -0,0 +1,122 @@
+"""Бенчмарк задержки обработчиков /profile и /vlk: до и после async_db.
+
+"before" — прежняя схема: sqlite3.connect на каждый вызов прямо в event loop.
+"after"  — async_db: один писатель и пул читателей вне event loop.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_db_latency.py --users 5000 --requests 4000 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_db  # noqa: E402
+import database  # noqa: E402
+
+def _legacy_fetchone(query: str, params: tuple):
+    conn = sqlite3.connect(database.DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    result = cursor.fetchone()
+    conn.close()
+    return result
+
+def _legacy_add_medical(telegram_id: int, vlk_date: str):
+    conn = sqlite3.connect(database.DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR REPLACE INTO medical (telegram_id, vlk_date, umo_date) VALUES (?, ?, NULL)",
+                   (telegram_id, vlk_date))
+    conn.commit()
+    conn.close()
+
+async def _before_profile(telegram_id: int):
+    _legacy_fetchone("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+    _legacy_fetchone("SELECT * FROM medical WHERE telegram_id = ?", (telegram_id,))
+    _legacy_fetchone("SELECT * FROM checks WHERE telegram_id = ?", (telegram_id,))
+    _legacy_fetchone("SELECT * FROM vacation WHERE telegram_id = ?", (telegram_id,))
+    await asyncio.sleep(0)
+
+async def _before_vlk(telegram_id: int):
+    _legacy_add_medical(telegram_id, "2025-02-19")
+    _legacy_fetchone("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+    await asyncio.sleep(0)
+
+async def _after_profile(telegram_id: int):
+    await async_db.get_user(telegram_id)
+    await asyncio.gather(
+        async_db.get_medical(telegram_id),
+        async_db.get_checks(telegram_id),
+        async_db.get_vacation(telegram_id)
+    )
+    await asyncio.sleep(0)
+
+async def _after_vlk(telegram_id: int):
+    await async_db.add_medical(telegram_id, "2025-02-19")
+    await async_db.get_user(telegram_id)
+    await asyncio.sleep(0)
+
+def _populate(users: int):
+    database.init_db()
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (telegram_id, surname, name, patronymic, rank) VALUES (?, ?, ?, ?, ?)",
+            [(i, f"Фамилия{i}", f"Имя{i}", None, "капитан") for i in range(1, users + 1)]
+        )
+        conn.executemany(
+            "INSERT INTO medical (telegram_id, vlk_date, umo_date) VALUES (?, ?, NULL)",
+            [(i, "2025-01-01") for i in range(1, users + 1)]
+        )
+
+async def _run(handlers, users: int, requests: int, concurrency: int, write_share: float) -> list:
+    profile, vlk = handlers
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    rng = random.Random(42)
+
+    async def one():
+        async with semaphore:
+            telegram_id = rng.randint(1, users)
+            handler = vlk if rng.random() < write_share else profile
+            started = time.perf_counter()
+            await handler(telegram_id)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+def _percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--write-share", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, "users.db")
+        _populate(args.users)
+        for label, handlers in (("before", (_before_profile, _before_vlk)),
+                                ("after", (_after_profile, _after_vlk))):
+            started = time.perf_counter()
+            latencies = asyncio.run(_run(handlers, args.users, args.requests,
+                                         args.concurrency, args.write_share))
+            elapsed = time.perf_counter() - started
+            print(f"{label:>6}: {args.requests / elapsed:8.0f} req/s  "
+                  f"p50={_percentile(latencies, 0.50):7.2f} ms  "
+                  f"p99={_percentile(latencies, 0.99):7.2f} ms")
+        database.close_connections()
+
+if __name__ == "__main__":
+    main()
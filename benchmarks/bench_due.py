@@ -0,0 +1,96 @@
+"""Бенчмарк /due: страница сроков по индексам против перебора всего списка.
+
+"перебор" — как отвечал бы обработчик без get_due_page: читает весь
+снимок (async_db.iter_snapshot), считает статусы batch_row_statuses,
+отбирает ВЛК, упражнения и отпуск в окне, сортирует и берёт страницу.
+"индекс" — async_db.get_due_page по тем же категориям: первая страница
+и последовательный проход по всем страницам («Далее»). Время — мс на
+страницу (медиана).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_due.py --users 2000 20000 --window 30
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_db  # noqa: E402
+import database  # noqa: E402
+from roster import generate  # noqa: E402
+
+PAGE_SIZE = 10
+CATEGORIES = ["vlk", "ex4", "ex7", "vacation"]
+
+def _remaining(statuses: dict):
+    """(категория, дней до срока) по статусам строки; истёкшие — с отрицательными днями"""
+    if statuses['vlk']:
+        yield "vlk", statuses['vlk']['days_remaining']
+    for key in ("ex4", "ex7"):
+        # days_remaining упражнения на день меньше (считается от текущего момента)
+        if statuses[key]:
+            yield key, statuses[key]['days_remaining'] + 1
+    if statuses['vacation']:
+        yield "vacation", statuses['vacation']['days_until_next']
+
+async def _scan_page(window):
+    items = []
+    async for rows in async_db.iter_snapshot():
+        for row, statuses in zip(rows, database.batch_row_statuses(rows)):
+            for category, days in _remaining(statuses):
+                if days <= (0 if window is None else window):
+                    items.append((days, row['telegram_id'], category, row))
+    items.sort(key=lambda item: item[:2])
+    return items[:PAGE_SIZE], len(items)
+
+async def _index_pages(window):
+    timings, cursor, total = [], None, 0
+    while True:
+        start = time.perf_counter()
+        rows, has_more = await async_db.get_due_page(CATEGORIES, window, None, cursor, PAGE_SIZE)
+        timings.append(time.perf_counter() - start)
+        total += len(rows)
+        if not has_more:
+            return timings, total
+        cursor = (rows[-1]['due_day'], rows[-1]['telegram_id'], rows[-1]['item'])
+
+async def _run(window, repeat: int):
+    scan = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, found = await _scan_page(window)
+        scan.append(time.perf_counter() - start)
+    first = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await async_db.get_due_page(CATEGORIES, window, None, None, PAGE_SIZE)
+        first.append(time.perf_counter() - start)
+    pages, total = await _index_pages(window)
+    return found, total, statistics.median(scan), statistics.median(first), statistics.median(pages), len(pages)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--window", type=int, default=30, help="окно, дней; 0 — только истёкшие")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    window = args.window or None
+
+    print(f"{'польз.':>7} {'позиций':>8} {'перебор, мс':>12} {'индекс, мс':>11} {'стр. N, мс':>11} {'страниц':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for users in args.users:
+            generate(os.path.join(tmp, f"{users}.db"), users, args.seed)
+            found, total, scan, first, page, pages = asyncio.run(_run(window, args.repeat))
+            if found != total:
+                print(f"расхождение: перебор {found}, индекс {total}")
+            print(f"{users:>7} {total:>8} {scan * 1e3:>12.1f} {first * 1e3:>11.2f} {page * 1e3:>11.2f} {pages:>8}")
+    async_db.close()
+
+if __name__ == "__main__":
+    main()
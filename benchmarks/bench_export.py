@@ -0,0 +1,66 @@
+"""Бенчмарк /export: потоковый ReportFile против файла, собранного в памяти.
+
+Для каждого размера списка генерирует базу (benchmarks/roster.py) и
+дважды строит отчёт: "поток" — читает ReportFile.read(), как это делает
+aiohttp при загрузке, "в памяти" — склеивает тот же отчёт в bytes для
+BufferedInputFile. Пиковая память — по tracemalloc (только объекты Python,
+без кэша SQLite), время — на весь отчёт.
+
+Запуск из корня репозитория (нужен aiogram):
+    python benchmarks/bench_export.py --users 2000 20000 --format csv html
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_db  # noqa: E402
+from aiogram.types import BufferedInputFile  # noqa: E402
+from report_export import ReportFile  # noqa: E402
+from roster import generate  # noqa: E402
+
+async def _streamed(fmt: str) -> int:
+    size = 0
+    async for chunk in ReportFile(fmt).read(None):
+        size += len(chunk)
+    return size
+
+async def _buffered(fmt: str) -> int:
+    data = b"".join([chunk async for chunk in ReportFile(fmt).read(None)])
+    return len(BufferedInputFile(data, filename=f"report.{fmt}").data)
+
+def _measure(func, fmt: str):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = asyncio.run(func(fmt))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--format", nargs="+", default=["csv", "html"], choices=["csv", "html"])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'польз.':>7} {'формат':>6} {'размер':>9} {'поток, с':>9} {'пик, МБ':>8} "
+          f"{'в памяти, с':>12} {'пик, МБ':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for users in args.users:
+            generate(os.path.join(tmp, f"{users}.db"), users, args.seed)
+            for fmt in args.format:
+                size, streamed, streamed_peak = _measure(_streamed, fmt)
+                _, buffered, buffered_peak = _measure(_buffered, fmt)
+                print(f"{users:>7} {fmt:>6} {size / 2 ** 20:>7.1f}МБ {streamed:>9.2f} "
+                      f"{streamed_peak / 2 ** 20:>8.1f} {buffered:>12.2f} {buffered_peak / 2 ** 20:>8.1f}")
+    async_db.close()
+
+if __name__ == "__main__":
+    main()
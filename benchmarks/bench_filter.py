@@ -0,0 +1,91 @@
+"""Бенчмарк раннего отсева обновлений (update_filter.py).
+
+Прогоняет через настоящий диспетчер бота (bot.dp) поток обновлений, которые
+бот не обрабатывает: болтовню в группе, edited_message, channel_post, —
+с фильтром и без него. Без фильтра каждое такое обновление читает состояние
+FSM из базы и перебирает обработчики сообщений. Разбор JSON в Update в замер
+не входит (он одинаков в обоих случаях). База — свежая, во временном каталоге.
+
+Запуск из корня репозитория (нужен aiogram):
+    python benchmarks/bench_filter.py --updates 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def make_updates(count: int):
+    """Смесь необрабатываемых обновлений: 80% болтовни в группе, остальное — ненужные типы"""
+    from aiogram.types import Update
+
+    updates = []
+    for update_id in range(1, count + 1):
+        user = {"id": 1_000_000 + update_id % 500, "is_bot": False, "first_name": "Chat"}
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": -100500, "type": "supergroup", "title": "Эскадрилья"},
+            "from": user,
+            "text": "кто сегодня дежурит?",
+        }
+        kind = update_id % 10
+        if kind == 8:
+            body = {"edited_message": message}
+        elif kind == 9:
+            body = {"channel_post": dict(message, chat={"id": -100600, "type": "channel", "title": "Канал"})}
+        else:
+            body = {"message": message}
+        updates.append(Update.model_validate(dict(body, update_id=update_id)))
+    return updates
+
+async def _run(bot_module, updates) -> float:
+    start = time.perf_counter()
+    for update in updates:
+        await bot_module.dp.feed_update(bot_module.bot, update)
+    return time.perf_counter() - start
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        import bot as bot_module
+        from aiogram.types import User
+
+        await bot_module.init_db()
+        updates = make_updates(args.updates)
+        update_filter = bot_module.update_filter
+
+        # Без фильтра: allowed не задан — пропускается всё
+        off = await _run(bot_module, updates)
+
+        # С фильтром: то же, что делает setup(), без обращения к Bot API
+        update_filter.me = User(id=42, is_bot=True, first_name="Fake", username="fake_bot")
+        update_filter.allowed = set(bot_module.dp.resolve_used_update_types())
+        update_filter.counters = dict.fromkeys(update_filter.counters, 0)
+        update_filter.check_time = 0.0
+        on = await _run(bot_module, updates)
+
+        await bot_module.dp.fsm.close()
+        bot_module.async_db.close()
+
+    stats = update_filter.stats()
+    print(f"Обновлений: {args.updates}, обрабатываемые типы: {', '.join(sorted(update_filter.allowed))}")
+    print(f"без фильтра: {off / args.updates * 1e6:8.1f} мкс/обновл. ({args.updates / off:8.0f} обновл./с)")
+    print(f"с фильтром:  {on / args.updates * 1e6:8.1f} мкс/обновл. ({args.updates / on:8.0f} обновл./с), x{off / on:.1f}")
+    print(f"отброшено: {stats['dropped']} (типы: {stats['dropped_type']}, группа: {stats['dropped_group']}), "
+          f"пропущено: {stats['passed']}, проверка: {stats['check_us_per_update']} мкс/обновл.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
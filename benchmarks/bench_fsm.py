@@ -0,0 +1,89 @@
+"""Бенчмарк FSM-хранилищ: задержка get/set состояния и данных.
+
+Сравнивает MemoryStorage (aiogram по умолчанию) и storage.SQLiteStorage
+на одинаковой нагрузке: каждый «пользователь» проходит анкету —
+set_state, update_data, get_state, get_data — как в обработчиках бота.
+Между шагами пауза --think (человек печатает ответ), за это время буфер
+SQLiteStorage успевает уйти в базу, и чтения идут уже из SQLite.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_fsm.py --users 1000 --concurrency 64 --think 0.1
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+import async_db  # noqa: E402
+import database  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+STEPS = ["Form:surname", "Form:name", "Form:patronymic", "Form:rank"]
+
+async def _walk(storage, user_id: int, timings: dict, think: float):
+    """Одна анкета: на каждом шаге пишем ответ и читаем состояние"""
+    key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+    for step, state in enumerate(STEPS):
+        await asyncio.sleep(think)
+        for op, call in (
+            ("set_state", lambda: storage.set_state(key, state)),
+            ("update_data", lambda: storage.update_data(key, {f"field{step}": f"value{step}"})),
+            ("get_state", lambda: storage.get_state(key)),
+            ("get_data", lambda: storage.get_data(key)),
+        ):
+            start = time.perf_counter()
+            await call()
+            timings[op].append(time.perf_counter() - start)
+    await storage.set_state(key, None)
+    await storage.set_data(key, {})
+
+async def _run(storage, users: int, concurrency: int, think: float) -> dict:
+    timings = {op: [] for op in ("set_state", "update_data", "get_state", "get_data")}
+    pending = iter(range(1, users + 1))
+
+    async def worker():
+        for user_id in pending:
+            await _walk(storage, user_id, timings, think)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await storage.close()
+    return {"elapsed": elapsed, "timings": timings}
+
+def _report(name: str, result: dict):
+    print(f"{name}: {result['elapsed']:.2f} с всего")
+    for op, values in result["timings"].items():
+        values.sort()
+        p50 = statistics.median(values) * 1e6
+        p99 = values[int(len(values) * 0.99)] * 1e6
+        print(f"  {op:<12} p50 {p50:8.1f} мкс   p99 {p99:8.1f} мкс")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--think", type=float, default=0.1, help="пауза между шагами анкеты, с")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, "bench.db")
+        await async_db.init_db()
+
+        _report("MemoryStorage", await _run(MemoryStorage(), args.users, args.concurrency, args.think))
+        _report("SQLiteStorage", await _run(SQLiteStorage(), args.users, args.concurrency, args.think))
+
+        left = database.get_connection().execute("SELECT COUNT(*) FROM fsm_states").fetchone()[0]
+        print(f"Осталось записей в fsm_states после завершения анкет: {left}")
+        async_db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
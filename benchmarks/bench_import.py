@@ -0,0 +1,102 @@
+"""Бенчмарк /import: пакетный импорт списка против записи по одному.
+
+Строит CSV (и XLSX, если есть openpyxl) из тех же строк, что
+benchmarks/roster.py, и портит в нём каждую сотую строку. "по одному" —
+roster.generate: add_user/add_medical/add_check/add_vacation на каждую
+запись, как это делает анкета в чате. "импорт" — roster_import.import_file
+в чистую базу. После замера снимки обеих баз сравниваются по
+неиспорченным строкам: производные столбцы должны совпасть.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_import.py --users 10000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_db  # noqa: E402
+import database  # noqa: E402
+import roster_import  # noqa: E402
+from roster import generate, roster_rows  # noqa: E402
+
+HEADER = ("telegram_id", "фамилия", "имя", "отчество", "звание", "влк", "умо",
+          "упр4", "упр7", "отпуск с", "отпуск по")
+
+def _records(users: int, seed: int):
+    """Строки файла; каждая сотая — с ошибкой в дате ВЛК"""
+    for telegram_id, user, vlk, umo, ex4, ex7, vacation in roster_rows(users, seed):
+        if telegram_id % 100 == 0:
+            vlk = "31.02.2024"
+        yield (telegram_id, *user, vlk, umo, ex4, ex7, *(vacation or (None, None)))
+
+def write_csv(path: str, users: int, seed: int):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(HEADER)
+        writer.writerows(_records(users, seed))
+
+def write_xlsx(path: str, users: int, seed: int) -> bool:
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        return False
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    for record in _records(users, seed):
+        sheet.append(record)
+    workbook.save(path)
+    return True
+
+def _snapshot(path: str):
+    """Все таблицы анкет, включая производные столбцы, без испорченных строк"""
+    database.DB_NAME = path
+    conn = database.get_connection()
+    return [
+        conn.execute(f"SELECT * FROM {table} WHERE telegram_id % 100 != 0 ORDER BY telegram_id").fetchall()
+        for table in ("medical", "checks", "vacation")
+    ] + [conn.execute("SELECT telegram_id, surname, name, patronymic, rank FROM users "
+                      "WHERE telegram_id % 100 != 0 ORDER BY telegram_id").fetchall()]
+
+async def _import(path: str, source: str):
+    database.DB_NAME = path
+    await async_db.init_db()
+    with open(source, "rb") as f:
+        return await roster_import.import_file(f, source)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        one_by_one = generate(os.path.join(tmp, "one_by_one.db"), args.users, args.seed)
+        expected = _snapshot(os.path.join(tmp, "one_by_one.db"))
+        print(f"{args.users} строк, пачка {roster_import.IMPORT_BATCH_SIZE}")
+        print(f"{'по одному':>14}: {one_by_one:7.2f} с")
+
+        sources = [os.path.join(tmp, "roster.csv")]
+        write_csv(sources[0], args.users, args.seed)
+        if write_xlsx(os.path.join(tmp, "roster.xlsx"), args.users, args.seed):
+            sources.append(os.path.join(tmp, "roster.xlsx"))
+
+        for source in sources:
+            db_path = source + ".db"
+            start = time.perf_counter()
+            result = asyncio.run(_import(db_path, source))
+            elapsed = time.perf_counter() - start
+            same = _snapshot(db_path) == expected
+            print(f"{'импорт ' + os.path.splitext(source)[1]:>14}: {elapsed:7.2f} с "
+                  f"({one_by_one / elapsed:.0f}x), записано {result.imported}, "
+                  f"ошибок {len(result.errors)}, совпадает с записью по одному: {'да' if same else 'НЕТ'}")
+    async_db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Бенчмарк поиска по составу: набор запроса в inline-режиме по буквам.
+
+Для случайных пользователей синтетической базы (benchmarks/roster.py)
+«набирает» фамилию и имя по одной букве и на каждое нажатие вызывает
+search.find, как это делает inline-обработчик. Три варианта:
+"LIKE" — полный перебор users через LIKE '%…%' по четырём столбцам,
+"индекс" — users_fts без кэша, "индекс+кэш" — как в боте.
+Время — мс на одно нажатие (p50 / p95).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_search.py --users 10000 --people 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_db  # noqa: E402
+import database  # noqa: E402
+import search  # noqa: E402
+from roster import generate  # noqa: E402
+
+def _like(terms):
+    where = " AND ".join(
+        "(surname LIKE ? OR name LIKE ? OR patronymic LIKE ? OR rank LIKE ?)" for _ in terms
+    )
+    params = [f"%{term}%" for term in terms for _ in range(4)]
+    return database.get_connection().execute(
+        f"SELECT telegram_id FROM users WHERE {where} LIMIT ?", (*params, search.SEARCH_CANDIDATES + 1)
+    ).fetchall()
+
+async def _keystrokes(queries, mode: str):
+    timings = []
+    for query in queries:
+        search.cache.on_user_changed(0)
+        for cut in range(1, len(query) + 1):
+            if mode == "index":
+                search.cache.on_user_changed(0)
+            start = time.perf_counter()
+            if mode == "like":
+                terms = search.terms(query[:cut])
+                if terms:
+                    await async_db._read(_like, terms)
+            else:
+                await search.find(query[:cut], 20)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--people", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generate(os.path.join(tmp, "users.db"), args.users, args.seed)
+        rng = random.Random(args.seed)
+        users = database.get_connection().execute("SELECT surname, name FROM users").fetchall()
+        queries = [f"{surname} {name}" for surname, name in rng.sample(users, min(args.people, len(users)))]
+
+        print(f"{args.users} пользователей, {len(queries)} запросов по буквам, мс на нажатие")
+        for mode, title in (("like", "LIKE"), ("index", "индекс"), ("cached", "индекс+кэш")):
+            p50, p95 = asyncio.run(_keystrokes(queries, mode))
+            print(f"{title:>11}: p50 {p50 * 1e3:6.2f}  p95 {p95 * 1e3:6.2f}")
+        print(f"Кэш: {search.cache.stats()}")
+    async_db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Пропускная способность рассылки: последовательный send_message против MessageSender.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_sender.py --messages 600 --chats 300 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI, make_bot  # noqa: E402
+from sender import MessageSender  # noqa: E402
+
+async def _sequential(bot, messages):
+    ok = 0
+    for chat_id, text in messages:
+        try:
+            await bot.send_message(chat_id, text)
+            ok += 1
+        except Exception:
+            pass
+    return ok
+
+async def _queued(bot, messages, rate, concurrency):
+    sender = MessageSender(bot, concurrency=concurrency, rate=rate)
+    results = await sender.send_many(messages)
+    return sum(1 for result in results if result.ok)
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=600)
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--server-limit", type=int, default=30, help="429 сверх N сообщений/с")
+    parser.add_argument("--rate", type=float, default=28)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    messages = [(1000 + i % args.chats, f"Напоминание #{i}") for i in range(args.messages)]
+
+    for label, run in (("sequential", lambda bot: _sequential(bot, messages)),
+                       ("sender", lambda bot: _queued(bot, messages, args.rate, args.concurrency))):
+        api = FakeBotAPI(latency=args.latency, rate_limit=args.server_limit)
+        bot = make_bot(await api.start())
+        started = time.perf_counter()
+        ok = await run(bot)
+        elapsed = time.perf_counter() - started
+        print(f"{label:>10}: {ok}/{len(messages)} доставлено за {elapsed:6.2f} с "
+              f"({ok / elapsed:6.1f} msg/s), 429 от сервера: {api.floods}, "
+              f"вызовов API: {sum(api.calls.values())}")
+        await bot.session.close()
+        await api.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
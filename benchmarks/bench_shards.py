@@ -0,0 +1,153 @@
+"""Несколько процессов-обработчиков делят прогон напоминаний по шардам.
+
+Скрипт создаёт синтетическую базу, запускает N процессов с _run_reminders
+и фиктивной отправкой (каждая доставка пишется в отдельную таблицу),
+при --crash убивает один процесс посреди работы (его шард после истечения
+аренды доделывают остальные), а затем проверяет, что каждое ожидаемое
+напоминание и сводка доставлены ровно один раз (кроме последней пачки
+убитого процесса: её он отправил, но не успел записать) и прогон закрыт.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_shards.py --users 5000 --workers 4 --crash
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+class _RecordingSender:
+    """Вместо Telegram пишет каждую доставку в таблицу deliveries"""
+
+    def __init__(self, db_path: str, worker: int, delay: float):
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.worker = worker
+        self.delay = delay
+
+    def _record(self, chat_id: int, text: str):
+        self.conn.execute("INSERT INTO deliveries (worker, chat_id, text) VALUES (?, ?, ?)",
+                          (self.worker, chat_id, text))
+
+    async def send(self, chat_id, text, **kwargs):
+        from sender import SendResult
+        await asyncio.sleep(self.delay)
+        self._record(chat_id, text)
+        return SendResult(chat_id, True, 1)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        return await self.send(chat_id, "<digest file>")
+
+    async def send_many(self, messages, **kwargs):
+        return [await self.send(chat_id, text) for chat_id, text in messages]
+
+def _worker(db_path: str, worker: int, delay: float, lease: float):
+    import database
+    database.DB_NAME = db_path
+    import scheduler
+    scheduler.LEASE_SECONDS = lease
+    asyncio.run(scheduler._run_reminders(_RecordingSender(db_path, worker, delay)))
+
+def _populate(users: int):
+    import database
+    database.init_db()
+    rng = random.Random(7)
+    today = date.today()
+
+    def some_date(max_days: int) -> str:
+        return (today - timedelta(days=rng.randint(0, max_days))).isoformat()
+
+    for telegram_id in range(1, users + 1):
+        database.add_user(telegram_id, f"Фамилия{telegram_id}", "Имя", None, "капитан")
+        database.add_medical(telegram_id, some_date(420))
+        database.add_check(telegram_id, 4, some_date(220))
+        database.add_check(telegram_id, 7, some_date(400))
+        database.add_vacation(telegram_id, "2025-01-01", some_date(400))
+    database.get_connection().execute(
+        "CREATE TABLE deliveries (worker INTEGER, chat_id INTEGER, text TEXT)"
+    )
+
+def _expected(db_path: str) -> Counter:
+    import database
+    import scheduler
+    expected = Counter()
+    for rows in database.iter_due_snapshot():
+        for row in rows:
+            for chat_id, _, _, text in scheduler.build_reminders(row)[0]:
+                expected[(chat_id, text)] += 1
+    return expected
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.0005, help="задержка одной «отправки», с")
+    parser.add_argument("--crash", action="store_true", help="убить один процесс посреди прогона")
+    args = parser.parse_args()
+
+    import database
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "users.db")
+        database.DB_NAME = db_path
+        _populate(args.users)
+        expected = _expected(db_path)
+        database.close_connections()
+
+        lease = 2.0 if args.crash else 300
+        ctx = multiprocessing.get_context("spawn")
+        started = time.perf_counter()
+        procs = [ctx.Process(target=_worker, args=(db_path, n, args.delay, lease))
+                 for n in range(args.workers)]
+        for proc in procs:
+            proc.start()
+        if args.crash:
+            # Убиваем, когда процесс 0 точно держит шард: после первой его доставки
+            conn = sqlite3.connect(db_path, timeout=30)
+            while not conn.execute("SELECT 1 FROM deliveries WHERE worker = 0 LIMIT 1").fetchone():
+                time.sleep(0.05)
+            conn.close()
+            procs[0].kill()
+            print("процесс 0 убит")
+        # Шард убитого процесса после истечения аренды должны доделать выжившие
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - started
+
+        conn = sqlite3.connect(db_path)
+        delivered = Counter()
+        first_worker = {}
+        per_worker = Counter()
+        digests = 0
+        for worker, chat_id, text in conn.execute("SELECT worker, chat_id, text FROM deliveries ORDER BY rowid"):
+            per_worker[worker] += 1
+            if text.startswith("📊") or text == "<digest file>":
+                digests += 1
+            else:
+                delivered[(chat_id, text)] += 1
+                first_worker.setdefault((chat_id, text), worker)
+        finished_at = conn.execute("SELECT finished_at FROM reminder_runs").fetchone()[0]
+        conn.close()
+
+        missing = sum((expected - delivered).values())
+        duplicates = delivered - expected
+        # Допустимы только повторы последней пачки убитого процесса: её он
+        # отправил, но не успел записать в журнал
+        unexpected = sum(count for key, count in duplicates.items()
+                         if not (args.crash and first_worker[key] == 0))
+        print(f"ожидалось {sum(expected.values())}, доставлено {sum(delivered.values())} "
+              f"за {elapsed:.2f} с; по процессам: {dict(sorted(per_worker.items()))}")
+        print(f"пропущено {missing}, повторов после падения {sum(duplicates.values()) - unexpected}, "
+              f"лишних повторов {unexpected}, частей сводки {digests}, "
+              f"прогон {'завершён' if finished_at else 'НЕ завершён'}")
+        sys.exit(0 if missing == 0 and unexpected == 0 and digests >= 1 and finished_at else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Бенчмарк проверки сроков: check_*_status по одной дате против batch_row_statuses.
+
+batch_row_statuses меряется дважды: по текстовым датам (строки, до которых
+не дошло фоновое заполнение *_day) и по целочисленным столбцам *_day.
+Время — процессорное (time.process_time), то есть CPU на один прогон
+напоминаний по всем пользователям.
+
+Строки генерируются в памяти в формате снимка (как iter_due_snapshot), база не нужна.
+Заодно проверяется, что все способы дают одинаковый результат.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_status.py --users 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+def make_rows(count: int, seed: int = 1):
+    """Синтетический снимок: у части пользователей нет тех или иных дат"""
+    rng = random.Random(seed)
+    today = date.today()
+
+    def maybe_date(max_age: int):
+        if rng.random() < 0.1:
+            return None
+        return (today - timedelta(days=rng.randint(-30, max_age))).isoformat()
+
+    rows = []
+    for telegram_id in range(1, count + 1):
+        vacation_end = maybe_date(500)
+        row = {
+            'telegram_id': telegram_id,
+            'vlk_date': maybe_date(500),
+            'umo_date': None,
+            'exercise_4_date': maybe_date(250),
+            'exercise_7_date': maybe_date(450),
+            'vacation_end': vacation_end,
+            'vacation_days': 30 if vacation_end else None,
+        }
+        row.update(
+            vlk_day=database.to_day(row['vlk_date']),
+            ex4_day=database.to_day(row['exercise_4_date']),
+            ex7_day=database.to_day(row['exercise_7_date']),
+            vacation_end_day=database.to_day(vacation_end),
+        )
+        rows.append(row)
+    return rows
+
+def text_only(rows):
+    """Те же строки без целочисленных столбцов — как до фонового заполнения"""
+    return [dict(row, vlk_day=None, ex4_day=None, ex7_day=None, vacation_end_day=None) for row in rows]
+
+def scalar_statuses(rows):
+    """Прежний способ: strptime и datetime.now() на каждую дату"""
+    result = []
+    for row in rows:
+        result.append({
+            "vlk": database.check_vlk_status(row['vlk_date']) if row['vlk_date'] else None,
+            "ex4": database.check_exercise_status(row['exercise_4_date'], 6) if row['exercise_4_date'] else None,
+            "ex7": database.check_exercise_status(row['exercise_7_date'], 12) if row['exercise_7_date'] else None,
+            "vacation": database.check_vacation_status(row['vacation_end']) if row['vacation_end'] else None,
+        })
+    return result
+
+def _best_of(func, rows, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = func(rows)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.users)
+    scalar_time, scalar = _best_of(scalar_statuses, rows, args.repeat)
+    text_time, text_batch = _best_of(database.batch_row_statuses, text_only(rows), args.repeat)
+    day_time, day_batch = _best_of(database.batch_row_statuses, rows, args.repeat)
+
+    for name, batch in (("текст", text_batch), ("*_day", day_batch)):
+        if scalar != batch:
+            mismatches = sum(1 for a, b in zip(scalar, batch) if a != b)
+            print(f"РАСХОЖДЕНИЕ ({name}): {mismatches} строк из {len(rows)}")
+            sys.exit(1)
+
+    print(f"Пользователей: {args.users}, CPU на прогон, лучший из {args.repeat}")
+    print(f"check_*_status:              {scalar_time * 1000:8.1f} мс")
+    print(f"batch_row_statuses (текст):  {text_time * 1000:8.1f} мс  (x{scalar_time / text_time:.1f})")
+    print(f"batch_row_statuses (*_day):  {day_time * 1000:8.1f} мс  (x{scalar_time / day_time:.1f})")
+    print(f"Сэкономлено целыми датами:   {(text_time - day_time) * 1000:8.1f} мс против текста, "
+          f"{(scalar_time - day_time) * 1000:.1f} мс против check_*_status")
+
+if __name__ == "__main__":
+    main()
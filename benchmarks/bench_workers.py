@@ -0,0 +1,146 @@
+"""Нагрузочный тест webhook: пропускная способность в зависимости от числа воркеров.
+
+Для каждого числа воркеров поднимает заглушку Bot API (fake_bot_api.py) и
+gunicorn с bot:app, как в start.sh, во временном каталоге со свежей базой.
+Затем шлёт в /webhook поток обновлений «/help» от разных пользователей и
+ждёт, пока заглушка получит столько же ответов sendMessage. Результат —
+обработанных обновлений в секунду.
+
+Заодно проверяет, что роль ведущего (и планировщик) досталась ровно одному воркеру.
+
+Запуск из корня репозитория (нужны aiogram, aiohttp и gunicorn):
+    python benchmarks/bench_workers.py --workers 1 2 4 --updates 5000 --concurrency 128
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "text": "/help",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+        },
+    }
+
+async def _wait_http(session: aiohttp.ClientSession, url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status < 500:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не поднялся за {timeout} с")
+
+async def _sent(session: aiohttp.ClientSession, api_url: str) -> int:
+    async with session.get(f"{api_url}/stats") as response:
+        return (await response.json())["calls"].get("sendMessage", 0)
+
+async def _measure(workers: int, updates: int, concurrency: int) -> float:
+    api_port, web_port = _free_port(), _free_port()
+    api_url = f"http://127.0.0.1:{api_port}"
+    web_url = f"http://127.0.0.1:{web_port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+            BOT_TOKEN="42:FAKE",
+            WEBHOOK_URL=f"{web_url}/webhook",
+            TELEGRAM_API_URL=api_url,
+            WEB_WORKERS=str(workers),
+        )
+        api = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "fake_bot_api.py"),
+             "--port", str(api_port), "--latency", "0"],
+            env=env, stdout=subprocess.DEVNULL,
+        )
+        log_path = os.path.join(tmp, "gunicorn.log")
+        log = open(log_path, "w")
+        web = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "bot:app",
+             "--bind", f"127.0.0.1:{web_port}",
+             "--worker-class", "aiohttp.GunicornWebWorker",
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=tmp, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            async with aiohttp.ClientSession() as session:
+                await _wait_http(session, f"{api_url}/stats")
+                await _wait_http(session, f"{web_url}/webhook")
+                # Даём всем воркерам пройти on_startup
+                await asyncio.sleep(2)
+
+                before = await _sent(session, api_url)
+                pending = iter(range(1, updates + 1))
+
+                async def client():
+                    for update_id in pending:
+                        user_id = 1_000_000 + update_id % 5000
+                        async with session.post(f"{web_url}/webhook", json=_update(update_id, user_id)) as response:
+                            await response.read()
+
+                start = time.perf_counter()
+                await asyncio.gather(*(client() for _ in range(concurrency)))
+                while await _sent(session, api_url) - before < updates:
+                    await asyncio.sleep(0.05)
+                elapsed = time.perf_counter() - start
+
+            leaders = sqlite3.connect(os.path.join(tmp, "users.db")).execute(
+                "SELECT COUNT(*) FROM leader_leases WHERE name = 'scheduler'"
+            ).fetchone()[0]
+            print(f"  воркеров {workers}: {updates / elapsed:8.0f} обновл./с "
+                  f"({elapsed:.2f} с), ведущих: {leaders}")
+            return updates / elapsed
+        except Exception:
+            with open(log_path) as f:
+                print(f.read()[-4000:])
+            raise
+        finally:
+            # Сначала воркеры: при остановке они ещё обращаются к Bot API
+            web.terminate()
+            web.wait(timeout=30)
+            api.terminate()
+            api.wait(timeout=30)
+            log.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=128)
+    args = parser.parse_args()
+
+    print(f"Обновлений: {args.updates}, параллельных клиентов: {args.concurrency}, ядер: {os.cpu_count()}")
+    results = {}
+    for workers in args.workers:
+        results[workers] = await _measure(workers, args.updates, args.concurrency)
+    base = results[args.workers[0]]
+    for workers, rate in results.items():
+        print(f"  x{rate / base:.2f} при {workers} воркерах")
+
+if __name__ == "__main__":
+    asyncio.run(main())
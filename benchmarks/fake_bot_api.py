@@ -0,0 +1,122 @@
+"""Локальная заглушка Telegram Bot API для бенчмарков.
+
+Отвечает на sendMessage, editMessageText, answerCallbackQuery и служебные
+методы, добавляет задержку и может отвечать 429 с retry_after — случайно
+или при превышении собственного лимита сообщений в секунду.
+
+Можно запустить отдельным процессом (счётчики вызовов — GET /stats):
+    python benchmarks/fake_bot_api.py --port 8081 --latency 0
+
+В том же процессе на каждый вызов можно подписаться через listeners —
+так load_webhook.py узнаёт, когда бот ответил пользователю.
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, deque
+
+from aiohttp import web
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.05, flood_rate: float = 0.0,
+                 rate_limit: int = 0, retry_after: int = 1):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.floods = 0
+        self._recent = deque()
+        self._message_id = 0
+        self._runner = None
+        # listener(method, data) вызывается при получении запроса, до задержки
+        self.listeners = []
+
+    def _flooded(self) -> bool:
+        if self.flood_rate and random.random() < self.flood_rate:
+            return True
+        if self.rate_limit:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate_limit:
+                return True
+            self._recent.append(now)
+        return False
+
+    def _message(self, data) -> dict:
+        self._message_id += 1
+        return {
+            "message_id": int(data.get("message_id") or self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": int(data.get("chat_id") or 0), "type": "private"},
+            "text": data.get("text", ""),
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post()
+        self.calls[method] += 1
+        for listener in self.listeners:
+            listener(method, data)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in ("sendMessage", "editMessageText", "sendDocument") and self._flooded():
+            self.floods += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        if method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        elif method in ("sendMessage", "editMessageText", "sendDocument"):
+            result = self._message(data)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": dict(self.calls), "floods": self.floods})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/stats", self.stats)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+def make_bot(base_url: str):
+    """Bot, который ходит в заглушку вместо api.telegram.org"""
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    return Bot(token="42:FAKE", session=session)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    args = parser.parse_args()
+
+    async def _serve():
+        api = FakeBotAPI(latency=args.latency, flood_rate=args.flood_rate, rate_limit=args.rate_limit)
+        print(await api.start(args.host, args.port), flush=True)
+        await asyncio.Event().wait()
+
+    asyncio.run(_serve())
@@ -0,0 +1,366 @@
+"""Сквозной нагрузочный тест: поток реалистичных обновлений в /webhook бота.
+
+Поднимает заглушку Bot API (fake_bot_api.py) в этом процессе и бота
+(bot:app под gunicorn, как в start.sh) во временном каталоге с базой из
+roster.py. Затем --concurrency виртуальных пользователей по кругу
+выполняют сценарии в пропорциях --mix:
+- register — /start, фамилия, имя, отчество, звание (новый пользователь);
+- profile  — /profile у пользователя из базы;
+- button   — нажатие кнопки главного меню;
+- mention  — упоминание бота в группе;
+- chatter  — болтовня в группе без обращения к боту (ответа не ждём).
+
+Каждый шаг ждёт ответа бота: задержка — от отправки обновления до
+прихода в заглушку ответного sendMessage / editMessageText в тот же чат
+или answerCallbackQuery на это нажатие. У каждого виртуального
+пользователя свои чаты, поэтому ответы не путаются.
+
+Итог: обновлений в секунду за --duration после --warmup, перцентили
+задержки по сценариям, таймауты и 503 от очереди, число исходящих
+вызовов по методам и ответов 429, счётчики очереди и фильтра бота.
+
+Запуск из корня репозитория (нужны aiogram, aiohttp и gunicorn):
+    python benchmarks/load_webhook.py --users 1000 --concurrency 50 --duration 30
+    python benchmarks/load_webhook.py --latency 0.1 --rate-limit 30 --mix profile=1,button=1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+BOT_ID = 42
+BOT_USERNAME = "fake_bot"
+DEFAULT_MIX = "register=1,profile=4,button=4,mention=1,chatter=3"
+MENU_BUTTONS = ("profile", "help", "vlk", "checks", "vacation", "update", "delete")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentile(samples: List[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+class LoadDriver:
+    """Виртуальные пользователи, ожидание ответов и статистика"""
+
+    def __init__(self, session: aiohttp.ClientSession, webhook_url: str, users: int,
+                 concurrency: int, mix: Dict[str, int], timeout: float):
+        self.session = session
+        self.webhook_url = webhook_url
+        self.users = users
+        self.concurrency = concurrency
+        self.scenarios, self.weights = zip(*mix.items())
+        self.timeout = timeout
+        self._update_id = 0
+        self._callback_id = 0
+        self._next_new_user = users + 1
+        # ("chat", id) / ("callback", id) -> ожидающий ответа шаг
+        self._waiters: Dict[tuple, asyncio.Future] = {}
+        self.recording = False
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.counters = defaultdict(int)
+
+    # ---------- ответы бота (из заглушки) ----------
+
+    def on_api_call(self, method: str, data):
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            key = ("chat", int(data.get("chat_id") or 0))
+        elif method == "answerCallbackQuery":
+            key = ("callback", data.get("callback_query_id"))
+        else:
+            return
+        waiter = self._waiters.pop(key, None)
+        if waiter and not waiter.done():
+            waiter.set_result(time.perf_counter())
+
+    # ---------- обновления ----------
+
+    def _next_update_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    def _message(self, user_id: int, text: str, chat: dict = None, entities: list = None) -> dict:
+        message = {
+            "message_id": self._next_update_id(),
+            "date": int(time.time()),
+            "chat": chat or {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Нагрузка"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if entities:
+            message["entities"] = entities
+        return {"update_id": self._update_id, "message": message}
+
+    def _callback(self, user_id: int, data: str) -> dict:
+        self._callback_id += 1
+        return {
+            "update_id": self._next_update_id(),
+            "callback_query": {
+                "id": str(self._callback_id),
+                "chat_instance": str(user_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": "Нагрузка"},
+                "data": data,
+                # Меню живёт в одном сообщении на пользователя
+                "message": {
+                    "message_id": 1, "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": BOT_ID, "is_bot": True, "first_name": "Fake"},
+                    "text": "Меню",
+                },
+            },
+        }
+
+    async def _step(self, scenario: str, update: dict, reply_key: Optional[tuple]) -> bool:
+        """Отправляет обновление и ждёт ответа по reply_key; False — шаг не удался"""
+        loop = asyncio.get_running_loop()
+        waiter = None
+        if reply_key:
+            waiter = self._waiters[reply_key] = loop.create_future()
+        start = time.perf_counter()
+        try:
+            async with self.session.post(self.webhook_url, json=update) as response:
+                await response.read()
+                status = response.status
+        except aiohttp.ClientError:
+            status = 0
+        if status != 200:
+            self._waiters.pop(reply_key, None)
+            if self.recording:
+                self.counters["rejected" if status == 503 else "http_errors"] += 1
+            # Telegram повторил бы доставку позже
+            await asyncio.sleep(0.5)
+            return False
+
+        if self.recording:
+            self.counters["updates"] += 1
+        if waiter is None:
+            return True
+        try:
+            replied = await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self._waiters.pop(reply_key, None)
+            if self.recording:
+                self.counters["timeouts"] += 1
+            return False
+        if self.recording:
+            self.latencies[scenario].append(replied - start)
+        return True
+
+    # ---------- сценарии ----------
+
+    async def register(self, user_id: int):
+        new_id = self._next_new_user
+        self._next_new_user += 1
+        key = ("chat", new_id)
+        for text in ("/start", "Нагрузкин", "Тест", "нет", "капитан"):
+            if not await self._step("register", self._message(new_id, text), key):
+                return
+
+    async def profile(self, user_id: int):
+        await self._step("profile", self._message(user_id, "/profile"), ("chat", user_id))
+
+    async def button(self, user_id: int):
+        update = self._callback(user_id, random.choice(MENU_BUTTONS))
+        await self._step("button", update, ("callback", update["callback_query"]["id"]))
+
+    async def mention(self, user_id: int):
+        # Своя группа на каждого виртуального пользователя — ответ не спутать
+        chat = {"id": -1_000_000_000 - user_id, "type": "supergroup", "title": "Эскадрилья"}
+        text = f"@{BOT_USERNAME} ты здесь?"
+        entities = [{"type": "mention", "offset": 0, "length": len(BOT_USERNAME) + 1}]
+        await self._step("mention", self._message(user_id, text, chat, entities), ("chat", chat["id"]))
+
+    async def chatter(self, user_id: int):
+        chat = {"id": -2_000_000_000, "type": "supergroup", "title": "Курилка"}
+        await self._step("chatter", self._message(user_id, "кто сегодня дежурит?", chat), None)
+
+    async def virtual_user(self, index: int, stop_at: float):
+        """Сценарии подряд; пользователи из базы — только свои (id % concurrency == index)"""
+        own = range(index + 1, self.users + 1, self.concurrency) or range(index + 1, index + 2)
+        while time.monotonic() < stop_at:
+            scenario = random.choices(self.scenarios, self.weights)[0]
+            await getattr(self, scenario)(random.choice(own))
+
+    def report(self, elapsed: float) -> dict:
+        scenarios = {}
+        for scenario, samples in sorted(self.latencies.items()):
+            samples.sort()
+            scenarios[scenario] = {
+                "steps": len(samples),
+                "p50_ms": round(_percentile(samples, 0.5) * 1000, 1),
+                "p90_ms": round(_percentile(samples, 0.9) * 1000, 1),
+                "p99_ms": round(_percentile(samples, 0.99) * 1000, 1),
+                "max_ms": round(samples[-1] * 1000, 1),
+            }
+        return {
+            "seconds": round(elapsed, 2),
+            "updates": self.counters["updates"],
+            "updates_per_s": round(self.counters["updates"] / elapsed, 1),
+            "timeouts": self.counters["timeouts"],
+            "rejected": self.counters["rejected"],
+            "http_errors": self.counters["http_errors"],
+            "scenarios": scenarios,
+        }
+
+def _parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if not hasattr(LoadDriver, name.strip()):
+            raise argparse.ArgumentTypeError(f"неизвестный сценарий {name!r}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+async def _wait_http(session: aiohttp.ClientSession, url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status < 500:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не поднялся за {timeout} с")
+
+async def _json(session: aiohttp.ClientSession, url: str) -> dict:
+    try:
+        async with session.get(url) as response:
+            return await response.json() if response.status == 200 else {}
+    except aiohttp.ClientError:
+        return {}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="пользователей в базе")
+    parser.add_argument("--concurrency", type=int, default=50, help="виртуальных пользователей")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX))
+    parser.add_argument("--timeout", type=float, default=10, help="ожидание ответа бота, с")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров gunicorn")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка заглушки Bot API, с")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля случайных ответов 429")
+    parser.add_argument("--rate-limit", type=int, default=0, help="429 сверх стольких сообщений в секунду")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--output", help="записать итог в JSON")
+    args = parser.parse_args()
+
+    import database
+    import roster
+
+    api = FakeBotAPI(latency=args.latency, flood_rate=args.flood_rate,
+                     rate_limit=args.rate_limit, retry_after=args.retry_after)
+    api_port, web_port = _free_port(), _free_port()
+    api_url = await api.start(port=api_port)
+    web_url = f"http://127.0.0.1:{web_port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        roster.generate(os.path.join(tmp, "users.db"), args.users)
+        database.close_connections()
+
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+            BOT_TOKEN=f"{BOT_ID}:FAKE",
+            WEBHOOK_URL=f"{web_url}/webhook",
+            TELEGRAM_API_URL=api_url,
+            WEB_WORKERS=str(args.workers),
+        )
+        log_path = os.path.join(tmp, "gunicorn.log")
+        log = open(log_path, "w")
+        web = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "bot:app",
+             "--bind", f"127.0.0.1:{web_port}",
+             "--worker-class", "aiohttp.GunicornWebWorker",
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=tmp, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            connector = aiohttp.TCPConnector(limit=args.concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await _wait_http(session, f"{web_url}/webhook/queue")
+                # Даём всем воркерам пройти on_startup
+                await asyncio.sleep(2)
+
+                driver = LoadDriver(session, f"{web_url}/webhook", args.users,
+                                    args.concurrency, args.mix, args.timeout)
+                api.listeners.append(driver.on_api_call)
+                stop_at = time.monotonic() + args.warmup + args.duration
+                users = [asyncio.create_task(driver.virtual_user(i, stop_at)) for i in range(args.concurrency)]
+
+                await asyncio.sleep(args.warmup)
+                calls_before = dict(api.calls)
+                floods_before = api.floods
+                driver.recording = True
+                start = time.perf_counter()
+                await asyncio.sleep(args.duration)
+                driver.recording = False
+                elapsed = time.perf_counter() - start
+                calls = {method: count - calls_before.get(method, 0) for method, count in api.calls.items()
+                         if count > calls_before.get(method, 0)}
+                floods = api.floods - floods_before
+                await asyncio.gather(*users)
+
+                result = driver.report(elapsed)
+                result.update(
+                    outbound_calls=calls,
+                    outbound_per_s=round(sum(calls.values()) / elapsed, 1),
+                    floods_429=floods,
+                    queue=await _json(session, f"{web_url}/webhook/queue"),
+                    filter=await _json(session, f"{web_url}/webhook/filter"),
+                    config={k: v for k, v in vars(args).items() if k != "output"},
+                )
+        except Exception:
+            with open(log_path) as f:
+                print(f.read()[-4000:])
+            raise
+        finally:
+            # Сначала бот: при остановке он ещё обращается к Bot API, а заглушка
+            # живёт в этом event loop — ждём в потоке, не блокируя её
+            web.terminate()
+            await asyncio.to_thread(web.wait, 30)
+            log.close()
+            await api.stop()
+
+    print(f"Пользователей в базе {args.users}, виртуальных {args.concurrency}, воркеров {args.workers}, "
+          f"задержка API {args.latency * 1000:.0f} мс, ядер {os.cpu_count()}")
+    print(f"Обновлений: {result['updates']} за {result['seconds']} с — {result['updates_per_s']} обновл./с; "
+          f"таймаутов {result['timeouts']}, 503 {result['rejected']}, ошибок HTTP {result['http_errors']}")
+    print(f"{'сценарий':>10} {'шагов':>7} {'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    for scenario, stats in result["scenarios"].items():
+        print(f"{scenario:>10} {stats['steps']:>7} {stats['p50_ms']:>9} {stats['p90_ms']:>9} "
+              f"{stats['p99_ms']:>9} {stats['max_ms']:>9}")
+    print(f"Исходящие ({result['outbound_per_s']}/с): "
+          + ", ".join(f"{method} {count}" for method, count in sorted(result["outbound_calls"].items()))
+          + f"; ответов 429: {result['floods_429']}")
+    if result["queue"]:
+        print(f"Очередь бота: max_lag {result['queue'].get('max_lag')} с, отклонено {result['queue'].get('rejected')}")
+    if result["filter"]:
+        print(f"Фильтр бота: отброшено {result['filter'].get('dropped')}, пропущено {result['filter'].get('passed')}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Итог: {args.output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Генератор синтетической базы users.db для бенчмарков.
+
+Распределения похожи на живой полк: звания с перекосом в младшие,
+ВЛК у 95% (часть уже просрочена, у части после 180 дней пройдено УМО),
+упражнение 4 у 90% и 7 у 85% с хвостом просроченных, отпуск у 80%
+(у некоторых он ещё идёт). Даты отсчитываются от сегодняшнего дня,
+поэтому каждый прогон видит одинаковую картину сроков.
+
+Данные пишутся через database.add_*, как их пишет бот, так что
+производные столбцы (*_expires, *_day) заполнены так же.
+
+Запуск из корня репозитория:
+    python benchmarks/roster.py --users 10000 --output /tmp/users.db
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+SURNAMES = ("Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов", "Новиков")
+NAMES = ("Александр", "Дмитрий", "Сергей", "Андрей", "Алексей", "Максим", "Иван", "Михаил", "Николай", "Павел")
+PATRONYMICS = ("Александрович", "Дмитриевич", "Сергеевич", "Андреевич", "Игоревич", "Викторович")
+RANKS = (
+    ("лейтенант", 25), ("старший лейтенант", 25), ("капитан", 20),
+    ("майор", 15), ("подполковник", 10), ("полковник", 5),
+)
+
+def _days_ago(today: date, days: int) -> str:
+    return (today - timedelta(days=days)).isoformat()
+
+def roster_rows(users: int, seed: int = 1, today: date = None):
+    """Строки анкет: (telegram_id, ФИО и звание, ВЛК, УМО, упр. 4, упр. 7, отпуск)"""
+    rng = random.Random(seed)
+    today = today or date.today()
+    ranks, weights = zip(*RANKS)
+
+    for telegram_id in range(1, users + 1):
+        user = (
+            rng.choice(SURNAMES) + (f"-{telegram_id}" if rng.random() < 0.3 else ""),
+            rng.choice(NAMES),
+            rng.choice(PATRONYMICS) if rng.random() < 0.9 else None,
+            rng.choices(ranks, weights)[0],
+        )
+
+        vlk = umo = None
+        if rng.random() < 0.95:
+            # ~10% просрочены (старше 365 дней)
+            age = rng.randint(0, 405)
+            vlk = _days_ago(today, age)
+            if age > 180 and rng.random() < 0.6:
+                umo = _days_ago(today, rng.randint(0, age - 150))
+
+        # Упр. 4 действует 6 месяцев, упр. 7 — 12; хвост просроченных
+        ex4 = _days_ago(today, rng.randint(0, 210)) if rng.random() < 0.9 else None
+        ex7 = _days_ago(today, rng.randint(0, 400)) if rng.random() < 0.85 else None
+
+        vacation = None
+        if rng.random() < 0.8:
+            length = rng.choice((15, 15, 30, 30, 30, 45))
+            # 5% ещё в отпуске
+            end = today + timedelta(days=rng.randint(1, length)) if rng.random() < 0.05 \
+                else today - timedelta(days=rng.randint(1, 400))
+            vacation = ((end - timedelta(days=length - 1)).isoformat(), end.isoformat())
+
+        yield telegram_id, user, vlk, umo, ex4, ex7, vacation
+
+def generate(path: str, users: int, seed: int = 1) -> float:
+    """Создаёт базу path с users пользователями; возвращает время генерации, с"""
+    start = time.perf_counter()
+    database.DB_NAME = path
+    database.init_db()
+    for telegram_id, user, vlk, umo, ex4, ex7, vacation in roster_rows(users, seed):
+        database.add_user(telegram_id, *user)
+        if vlk:
+            database.add_medical(telegram_id, vlk, umo)
+        if ex4:
+            database.add_check(telegram_id, 4, ex4)
+        if ex7:
+            database.add_check(telegram_id, 7, ex7)
+        if vacation:
+            database.add_vacation(telegram_id, *vacation)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        sys.exit(f"{args.output} уже существует")
+    elapsed = generate(args.output, args.users, args.seed)
+    print(f"{args.users} пользователей в {args.output} за {elapsed:.1f} с")
+
+if __name__ == "__main__":
+    main()
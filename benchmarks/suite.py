@@ -0,0 +1,337 @@
+"""Набор бенчмарков на синтетических базах с отчётом в JSON.
+
+Для каждого размера (по умолчанию 1k, 10k и 100k пользователей) базу
+строит roster.py, а затем в отдельном процессе (свежие кэши и соединения)
+замеряются:
+- send_daily_reminders с заглушкой вместо Bot и без ограничения темпа;
+- /all: cmd_all (первая страница) и обход всех страниц render_all_page;
+- /profile: cmd_profile для разных пользователей (промахи кэша);
+- функции database.py — чтения и записи по одной, как их зовёт бот.
+
+Отчёт (--output) содержит коммит, версию Python и все замеры; --compare
+сравнивает его с прежним отчётом и отмечает замедления больше --threshold.
+Базы можно переиспользовать между запусками (--roster-dir): имя файла
+содержит дату, так что сроки в них совпадают только в пределах дня.
+
+Запуск из корня репозитория (нужен aiogram):
+    python benchmarks/suite.py --sizes 1000 10000 --output report.json
+    python benchmarks/suite.py --sizes 1000 10000 --compare report.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def _summary(samples) -> dict:
+    """Сводка по замерам в секундах: мкс и операций в секунду"""
+    samples = sorted(samples)
+    quantile = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    mean = statistics.fmean(samples)
+    return {
+        "calls": len(samples),
+        "mean_us": round(mean * 1e6, 1),
+        "p50_us": round(quantile(0.5) * 1e6, 1),
+        "p95_us": round(quantile(0.95) * 1e6, 1),
+        "p99_us": round(quantile(0.99) * 1e6, 1),
+        "ops_per_s": round(1 / mean, 1) if mean else None,
+    }
+
+def _time_calls(calls) -> dict:
+    samples = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+async def _time_async(calls) -> dict:
+    samples = []
+    for call in calls:
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+# ==================== ЗАГЛУШКИ ====================
+
+class _StubBot:
+    """Вместо Bot: считает отправки, ничего не отправляет"""
+
+    def __init__(self):
+        self.calls = {"send_message": 0, "send_document": 0}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls["send_message"] += 1
+
+    async def send_document(self, chat_id, document, **kwargs):
+        self.calls["send_document"] += 1
+
+class _StubUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.first_name = "Bench"
+
+class _StubMessage:
+    """Минимум types.Message для вызова обработчика напрямую"""
+
+    def __init__(self, user_id: int):
+        self.from_user = _StubUser(user_id)
+        self.answers = 0
+
+    async def answer(self, text, **kwargs):
+        self.answers += 1
+
+# ==================== ЗАМЕРЫ ОДНОГО РАЗМЕРА ====================
+
+async def _bench_reminders(users: int) -> dict:
+    import scheduler
+    from sender import MessageSender
+
+    stub = _StubBot()
+    sender = MessageSender(stub, concurrency=20, rate=1e9, per_chat_interval=0)
+    start = time.perf_counter()
+    await scheduler.send_daily_reminders(stub, sender)
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 4),
+        "messages": stub.calls["send_message"],
+        "documents": stub.calls["send_document"],
+        "users_per_s": round(users / elapsed, 1),
+    }
+
+async def _bench_all(repeat: int) -> dict:
+    import bot
+
+    first_page = await _time_async(lambda: bot.cmd_all(_StubMessage(bot.ADMIN_ID)) for _ in range(repeat))
+
+    pages = 0
+    cursor_id = 0
+    start = time.perf_counter()
+    while True:
+        report, markup = await bot.render_all_page(pages + 1, cursor_id)
+        if not report:
+            break
+        pages += 1
+        # Курсор следующей страницы — из кнопки «Далее»
+        next_buttons = [b for row in markup.inline_keyboard for b in row if ":next:" in b.callback_data]
+        if not next_buttons:
+            break
+        cursor_id = int(next_buttons[0].callback_data.rsplit(":", 1)[1])
+    elapsed = time.perf_counter() - start
+    return {
+        "cmd_all": first_page,
+        "all_pages": {"pages": pages, "seconds": round(elapsed, 4),
+                      "pages_per_s": round(pages / elapsed, 1) if elapsed else None},
+    }
+
+async def _bench_profile(users: int, requests: int, rng: random.Random) -> dict:
+    import bot
+
+    ids = rng.sample(range(1, users + 1), min(requests, users))
+    return await _time_async(lambda user_id=user_id: bot.cmd_profile(_StubMessage(user_id)) for user_id in ids)
+
+def _bench_database(users: int, calls: int, scans: int, rng: random.Random) -> dict:
+    """Функции database.py по одной; записи меняют случайных пользователей на те же по виду данные"""
+    import database
+
+    today = date.today()
+    ids = lambda: (rng.randint(1, users) for _ in range(calls))
+    day = lambda: (today.toordinal() - rng.randint(0, 400))
+    iso = lambda: date.fromordinal(day()).isoformat()
+    new_ids = iter(range(users + 1, users + calls + 1))
+    run_day = database.today_day()
+    fsm_keys = [f"42:{i}:{i}:::default" for i in range(calls)]
+
+    def drain(chunks):
+        for _ in chunks:
+            pass
+
+    results = {
+        "get_user": _time_calls(lambda i=i: database.get_user(i) for i in ids()),
+        "get_medical": _time_calls(lambda i=i: database.get_medical(i) for i in ids()),
+        "get_checks": _time_calls(lambda i=i: database.get_checks(i) for i in ids()),
+        "get_vacation": _time_calls(lambda i=i: database.get_vacation(i) for i in ids()),
+        "add_user": _time_calls(lambda: database.add_user(next(new_ids), "Тестов", "Тест", None, "капитан")
+                                for _ in range(calls)),
+        "update_user": _time_calls(lambda i=i: database.update_user(i, rank="майор") for i in ids()),
+        "add_medical": _time_calls(lambda i=i: database.add_medical(i, iso()) for i in ids()),
+        "add_check": _time_calls(lambda i=i: database.add_check(i, rng.choice((4, 7)), iso()) for i in ids()),
+        "add_vacation": _time_calls(lambda i=i: database.add_vacation(i, "2025-01-01", "2025-01-30") for i in ids()),
+        "delete_user": _time_calls(lambda i=i: database.delete_user(i) for i in range(users + 1, users + calls + 1)),
+        "get_snapshot_page": _time_calls(lambda i=i: database.get_snapshot_page(i, 10) for i in ids()),
+        "iter_snapshot_rows_100": _time_calls(
+            lambda: drain(database.iter_snapshot_rows(rng.sample(range(1, users + 1), min(100, users))))
+            for _ in range(max(1, calls // 10))),
+        "get_sent_reminders_100": _time_calls(
+            lambda: database.get_sent_reminders(run_day, rng.sample(range(1, users + 1), min(100, users)))
+            for _ in range(max(1, calls // 10))),
+        "save_fsm_records": _time_calls(
+            lambda key=key: database.save_fsm_records([(key, True, "Form:surname", True, "{}")], time.time())
+            for key in fsm_keys),
+        "get_fsm_record": _time_calls(lambda key=key: database.get_fsm_record(key, 0) for key in fsm_keys),
+        "get_user_changes": _time_calls(lambda: database.get_user_changes(0, 1000) for _ in range(max(1, calls // 10))),
+        # Полные проходы — несколько раз
+        "get_all_users": _time_calls(database.get_all_users for _ in range(scans)),
+        "iter_snapshot": _time_calls(lambda: drain(database.iter_snapshot()) for _ in range(scans)),
+        "iter_due_snapshot": _time_calls(lambda: drain(database.iter_due_snapshot()) for _ in range(scans)),
+        "get_reminder_starts": _time_calls(database.get_reminder_starts for _ in range(scans)),
+    }
+    return results
+
+async def run_single(db_path: str, users: int, calls: int, scans: int, seed: int) -> dict:
+    """Все замеры на одной базе (в этом процессе)"""
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    logging.disable(logging.CRITICAL)
+    import database
+    database.DB_NAME = db_path
+    import async_db
+
+    rng = random.Random(seed)
+    result = {
+        # Напоминания — первыми: следующие замеры меняют данные
+        "send_daily_reminders": await _bench_reminders(users),
+        **await _bench_all(repeat=max(3, min(50, calls // 20))),
+        "cmd_profile": await _bench_profile(users, calls, rng),
+    }
+    async_db.close()
+    result["database"] = _bench_database(users, calls, scans, rng)
+    database.close_connections()
+    return result
+
+# ==================== ОТЧЁТ ====================
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _roster(users: int, seed: int, roster_dir: str, tmp: str) -> str:
+    """Рабочая копия базы нужного размера (из кэша или только что созданная)"""
+    import roster
+
+    name = f"roster-{users}-s{seed}-{date.today().isoformat()}.db"
+    cached = os.path.join(roster_dir or tmp, name)
+    if not os.path.exists(cached):
+        elapsed = roster.generate(cached, users, seed)
+        import database
+        database.close_connections()
+        print(f"  база {users}: создана за {elapsed:.1f} с", file=sys.stderr)
+    work = os.path.join(tmp, f"work-{users}.db")
+    shutil.copyfile(cached, work)
+    return work
+
+def _flatten(node, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1}"""
+    for key, value in node.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, path + ".")
+        else:
+            yield path, value
+
+# Чем меньше, тем лучше — по этим полям ищем замедления
+_LOWER_IS_BETTER = ("seconds", "mean_us", "p50_us", "p95_us")
+
+def compare(old: dict, new: dict, threshold: float) -> int:
+    """Печатает изменения; возвращает число замедлений больше threshold"""
+    old_values = dict(_flatten(old["results"]))
+    regressions = 0
+    print(f"\nСравнение с {old['meta']['commit']} ({old['meta']['created']}):")
+    for path, value in _flatten(new["results"]):
+        if not path.endswith(_LOWER_IS_BETTER) or path not in old_values:
+            continue
+        before = old_values[path]
+        if not before or not value:
+            continue
+        change = value / before - 1
+        mark = ""
+        if change > threshold:
+            mark = "  <-- медленнее"
+            regressions += 1
+        elif change < -threshold:
+            mark = "  быстрее"
+        if mark or abs(change) > threshold / 2:
+            print(f"  {path:60} {before:>12} -> {value:>12} ({change:+.0%}){mark}")
+    print(f"Замедлений больше {threshold:.0%}: {regressions}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--calls", type=int, default=1000, help="вызовов на точечную функцию")
+    parser.add_argument("--scans", type=int, default=3, help="повторов полного прохода по базе")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--roster-dir", help="каталог для переиспользования сгенерированных баз")
+    parser.add_argument("--output", help="куда записать отчёт JSON")
+    parser.add_argument("--compare", help="прежний отчёт JSON для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.1, help="порог замедления, доля")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Дочерний процесс: один размер, результат — JSON в stdout
+        result = asyncio.run(run_single(args.db, args.single, args.calls, args.scans, args.seed))
+        print(json.dumps(result))
+        return
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "calls": args.calls,
+            "scans": args.scans,
+            "seed": args.seed,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for users in args.sizes:
+            db_path = _roster(users, args.seed, args.roster_dir, tmp)
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--single", str(users), "--db", db_path,
+                 "--calls", str(args.calls), "--scans", str(args.scans), "--seed", str(args.seed)],
+                capture_output=True, text=True, cwd=tmp,
+            )
+            if completed.returncode:
+                print(completed.stderr[-4000:], file=sys.stderr)
+                sys.exit(f"Замер на {users} пользователях завершился с ошибкой")
+            result = report["results"][str(users)] = json.loads(completed.stdout.splitlines()[-1])
+
+            reminders = result["send_daily_reminders"]
+            print(f"{users:>7} польз.: напоминания {reminders['seconds']:.2f} с ({reminders['messages']} сообщ.), "
+                  f"/all стр.1 p50 {result['cmd_all']['p50_us'] / 1000:.1f} мс, "
+                  f"все {result['all_pages']['pages']} стр. {result['all_pages']['seconds']:.2f} с, "
+                  f"/profile p50 {result['cmd_profile']['p50_us'] / 1000:.2f} мс, "
+                  f"get_user p50 {result['database']['get_user']['p50_us']} мкс")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Отчёт: {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
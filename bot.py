@@ -1,35 +1,89 @@
 import os
 import asyncio
+import hashlib
+import html
 import logging
+from collections import OrderedDict
 from datetime import datetime
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiogram.webhook.aiohttp_server import setup_application
 from aiohttp import web
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import (
+    InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile,
+    InlineQueryResultArticle, InputTextMessageContent
+)
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+import async_db
+from async_db import (
+    init_db, get_user, add_user, update_user, delete_user,
+    get_medical, add_medical, get_checks, add_check, get_vacation, add_vacation_days,
+    get_snapshot_page, backfill_day_columns, get_due_page, get_ranks
+)
 from database import (
-    init_db, get_user, add_user, update_user, delete_user, get_all_users,
-    get_medical, add_medical, check_vlk_status,
-    get_checks, add_check, check_exercise_status,
-    get_vacation, add_vacation, check_vacation_status
+    check_vlk_status, check_exercise_status, check_vacation_status, batch_row_statuses, to_day,
+    from_day, today_day, DUE_CATEGORIES
 )
-from scheduler import run_scheduler
+from scheduler import run_scheduler_leader, CATEGORIES
+from sender import MessageSender
+from storage import SQLiteStorage, FSM_FLUSH_INTERVAL
+from callback_router import CallbackRoutes
+import roster_import
+import search
+from report_export import ReportFile, FORMATS as EXPORT_FORMATS
+import metrics
+from update_filter import UpdateFilterMiddleware, GROUP_CHATTER_FILTER
+from webhook_queue import register_webhook, UPDATE_WORKERS
 
 # Настройки
 API_TOKEN = os.getenv('BOT_TOKEN')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
 PORT = int(os.getenv('PORT', 8080))
 
+# Сколько процессов обслуживают webhook (задаётся в start.sh для gunicorn)
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', 1))
+
+# Свой сервер Bot API (локальный telegram-bot-api или заглушка из benchmarks/)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
 # ID админа (твой Telegram ID)
 ADMIN_ID = 393293807 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-bot = Bot(token=API_TOKEN)
-dp = Dispatcher()
+if TELEGRAM_API_URL:
+    bot = Bot(token=API_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(token=API_TOKEN)
+# Время и ошибки всех запросов к Bot API — в /metrics
+bot.session.middleware(metrics.RequestMetricsMiddleware())
+# Состояния анкет хранятся в базе: переживают перезапуск и общие для всех процессов.
+# При нескольких процессах следующий шаг анкеты может прийти в другой — поэтому
+# состояние пишется сразу, без буфера (см. также register_webhook ниже).
+# FSM подключаем вручную, после фильтра: отброшенные обновления не читают состояние
+fsm_storage = SQLiteStorage(flush_interval=FSM_FLUSH_INTERVAL if WEB_WORKERS == 1 else 0)
+dp = Dispatcher(storage=fsm_storage, disable_fsm=True)
+# Групповой текст без обращения к боту пропускается, только если автор заполняет анкету.
+# При нескольких процессах анкету мог начать другой — тогда это проверяется по базе
+update_filter = UpdateFilterMiddleware(group_filter=GROUP_CHATTER_FILTER, has_state=fsm_storage.has_state)
+dp.update.outer_middleware(update_filter)
+dp.update.outer_middleware(dp.fsm)
+
+# Все inline-кнопки — один обработчик с поиском по словарю (callback_router.py)
+callbacks = CallbackRoutes()
+dp.callback_query.register(callbacks.dispatch)
+
+# Время обработчиков по командам, шагам анкет и кнопкам
+dp.message.middleware(metrics.HandlerMetricsMiddleware("message"))
+dp.callback_query.middleware(metrics.HandlerMetricsMiddleware("callback_query"))
+
+# Общая очередь исходящих: уведомления админу и рассылка планировщика
+outbound = MessageSender(bot)
 
 # Машина состояний
 class Form(StatesGroup):
@@ -46,6 +100,7 @@ class Form(StatesGroup):
     confirm_delete = State()
     update_field = State()
     update_value = State()
+    import_file = State()
 
 # ==================== КНОПКИ БЫСТРЫХ КОМАНД ====================
 
@@ -89,12 +144,76 @@ def get_group_help_keyboard() -> InlineKeyboardMarkup:
     
     return builder.as_markup()
 
+# ==================== МЕНЮ НА МЕСТЕ ====================
+# Кнопки не присылают новое сообщение, а редактируют то, на котором нажаты.
+# По каждому (чат, сообщение) помним хэш последнего показанного содержимого:
+# если новое совпадает, ограничиваемся answerCallbackQuery без editMessageText.
+# В одном процессе хэши лежат в памяти; при нескольких — в базе (menu_renders),
+# иначе нажатие, попавшее в другой процесс, сверялось бы с устаревшим хэшем.
+
+MENU_HASH_LIMIT = 10000
+
+_menu_hashes: "OrderedDict[tuple, str]" = OrderedDict()
+menu_counters = {"edited": 0, "unchanged": 0, "sent": 0}
+
+def _menu_hash(text: str, reply_markup: InlineKeyboardMarkup = None) -> str:
+    markup = reply_markup.model_dump_json() if reply_markup else ""
+    return hashlib.sha1(f"{text}\x00{markup}".encode("utf-8")).hexdigest()
+
+async def _menu_shown(key: tuple, digest: str) -> bool:
+    if WEB_WORKERS > 1:
+        return await async_db.get_menu_render(*key) == digest
+    if _menu_hashes.get(key) != digest:
+        return False
+    _menu_hashes.move_to_end(key)
+    return True
+
+async def _remember_menu(key: tuple, digest: str):
+    if WEB_WORKERS > 1:
+        await async_db.save_menu_render(*key, digest)
+        return
+    _menu_hashes[key] = digest
+    _menu_hashes.move_to_end(key)
+    if len(_menu_hashes) > MENU_HASH_LIMIT:
+        _menu_hashes.popitem(last=False)
+
+async def render_menu(callback_query: types.CallbackQuery, text: str,
+                      reply_markup: InlineKeyboardMarkup = None):
+    """Показывает text в сообщении с кнопкой; answerCallbackQuery вызывает сам"""
+    message = callback_query.message
+    await callback_query.answer()
+
+    if not isinstance(message, types.Message):
+        # Сообщение недоступно (старое или из inline-режима) — отвечаем новым
+        await bot.send_message(callback_query.from_user.id, text, reply_markup=reply_markup, parse_mode="HTML")
+        menu_counters["sent"] += 1
+        return
+
+    key = (message.chat.id, message.message_id)
+    digest = _menu_hash(text, reply_markup)
+    if await _menu_shown(key, digest):
+        menu_counters["unchanged"] += 1
+        return
+
+    try:
+        await message.edit_text(text, reply_markup=reply_markup, parse_mode="HTML")
+        menu_counters["edited"] += 1
+    except TelegramBadRequest as e:
+        if "not modified" in str(e):
+            # Уже показано (например, после перезапуска бота) — просто запоминаем
+            menu_counters["unchanged"] += 1
+        else:
+            # Редактировать нельзя (сообщение слишком старое и т.п.)
+            new_message = await message.answer(text, reply_markup=reply_markup, parse_mode="HTML")
+            menu_counters["sent"] += 1
+            key = (new_message.chat.id, new_message.message_id)
+    await _remember_menu(key, digest)
+
 # ==================== КОМАНДЫ ====================
 
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message, state: FSMContext):
-    init_db()
-    user = get_user(message.from_user.id)
+    user = await get_user(message.from_user.id)
     
     if user:
         full_name = f"{user[1]} {user[2]}"
@@ -135,7 +254,11 @@ async def cmd_help(message: types.Message):
         "🏖️ <b>Отпуск:</b>\n"
         "/vacation — Добавить отпуск\n\n"
         "👥 <b>Админ:</b>\n"
-        "/all — Список всех пользователей (полные данные)\n\n"
+        "/all — Список всех пользователей (полные данные)\n"
+        "/due — Истёкшие и подходящие сроки (/due влк 7 капитан)\n"
+        "/find — Найти человека (или @бот фамилия в любом чате)\n"
+        "/export — Отчёт о готовности файлом (/export html — таблицей)\n"
+        "/import — Загрузить список из CSV/XLSX\n\n"
         "🔘 <b>Используй кнопки ниже для быстрого доступа!</b>",
         reply_markup=get_main_keyboard(),
         parse_mode="HTML"
@@ -183,7 +306,7 @@ async def process_rank(message: types.Message, state: FSMContext):
     rank = message.text if message.text.lower() != 'нет' else None
     
     data = await state.get_data()
-    success = add_user(
+    success = await add_user(
         telegram_id=message.from_user.id,
         surname=data['surname'],
         name=data['name'],
@@ -214,15 +337,17 @@ async def process_rank(message: types.Message, state: FSMContext):
 
 @dp.message(Command("profile"))
 async def cmd_profile(message: types.Message):
-    user = get_user(message.from_user.id)
+    user = await get_user(message.from_user.id)
     
     if not user:
         await message.answer("❌ Вы ещё не зарегистрированы. Используйте /start")
         return
     
-    medical = get_medical(message.from_user.id)
-    checks = get_checks(message.from_user.id)
-    vacation = get_vacation(message.from_user.id)
+    medical, checks, vacation = await asyncio.gather(
+        get_medical(message.from_user.id),
+        get_checks(message.from_user.id),
+        get_vacation(message.from_user.id)
+    )
     
     vlk_status = ""
     if medical and medical[1]:
@@ -301,90 +426,485 @@ async def cmd_profile(message: types.Message):
 
 # ==================== /all (АДМИН) ====================
 
+# Сколько пользователей показывать на одной странице /all
+ALL_PAGE_SIZE = 10
+
+def format_user_report(row, index: int, statuses: dict) -> str:
+    """Блок отчёта /all по одной строке снимка (statuses — из batch_row_statuses)"""
+    telegram_id = row['telegram_id']
+    full_name = html.escape(f"{row['surname']} {row['name']}")
+    rank = html.escape(row['rank'] or "не указано")
+    
+    report = f"<b>#{index}. {full_name}</b> ({rank})\n"
+    report += f"   ID: <code>{telegram_id}</code>\n"
+    
+    if row['vlk_date']:
+        vlk = statuses['vlk']
+        if vlk['vlk_expired']:
+            report += f"   🔴 <b>ВЛК:</b> ИСТЕКЛА! ({vlk['days_passed']} дн. назад)\n"
+        elif vlk['umo_needed'] and not row['umo_date']:
+            report += f"   🟠 <b>ВЛК:</b> Нужно УМО! ({vlk['days_passed']} дн.)\n"
+        else:
+            report += f"   🟢 <b>ВЛК:</b> {vlk['days_remaining']} дн.\n"
+        
+        if row['umo_date']:
+            report += f"   🟢 <b>УМО:</b> {row['umo_date']}\n"
+        elif vlk['umo_needed']:
+            report += f"   🔴 <b>УМО:</b> НЕ ПРОЙДЕНО!\n"
+    else:
+        report += f"   ⚪ <b>ВЛК:</b> нет данных\n"
+    
+    if row['exercise_4_date'] or row['exercise_7_date']:
+        if row['exercise_4_date']:
+            ex4 = statuses['ex4']
+            if ex4['expired']:
+                report += f"   🔴 <b>Упр.4:</b> ИСТЕКЛО! ({abs(ex4['days_remaining'])} дн.)\n"
+            else:
+                report += f"   🟢 <b>Упр.4:</b> {ex4['days_remaining']} дн.\n"
+        if row['exercise_7_date']:
+            ex7 = statuses['ex7']
+            if ex7['expired']:
+                report += f"   🔴 <b>Упр.7:</b> ИСТЕКЛО! ({abs(ex7['days_remaining'])} дн.)\n"
+            else:
+                report += f"   🟢 <b>Упр.7:</b> {ex7['days_remaining']} дн.\n"
+    else:
+        report += f"   ⚪ <b>КБП:</b> нет данных\n"
+    
+    if row['vacation_end']:
+        vac = statuses['vacation']
+        vac_days = row['vacation_days'] or 0
+        if vac['expired']:
+            report += f"   🔴 <b>Отпуск:</b> ИСТЁК! ({vac_days} дн., {vac['days_passed']} дн. назад)\n"
+        else:
+            report += f"   🟢 <b>Отпуск:</b> {vac_days} дн. (осталось {vac['days_until_next']} дн.)\n"
+    else:
+        report += f"   ⚪ <b>Отпуск:</b> нет данных\n"
+    
+    return report
+
+async def render_all_page(page: int, cursor_id: int, backward: bool = False):
+    """Текст и кнопки одной страницы /all (один JOIN-запрос на страницу)"""
+    rows, has_more = await get_snapshot_page(cursor_id, ALL_PAGE_SIZE, backward)
+    if not rows:
+        return None, None
+    
+    has_prev = has_more if backward else page > 1
+    has_next = True if backward else has_more
+    
+    report = f"👥 <b>ВСЕ ПОЛЬЗОВАТЕЛИ</b> — стр. {page}\n\n"
+    first_index = (page - 1) * ALL_PAGE_SIZE + 1
+    statuses = batch_row_statuses(rows)
+    for i, (row, row_statuses) in enumerate(zip(rows, statuses), first_index):
+        report += format_user_report(row, i, row_statuses) + "\n"
+    
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=callbacks.pack("all", "prev", page - 1, rows[0]['telegram_id'])
+        ))
+    if has_next:
+        buttons.append(InlineKeyboardButton(
+            text="Далее ➡️", callback_data=callbacks.pack("all", "next", page + 1, rows[-1]['telegram_id'])
+        ))
+    
+    builder = InlineKeyboardBuilder()
+    if buttons:
+        builder.row(*buttons)
+    return report, builder.as_markup()
+
 @dp.message(Command("all"))
 async def cmd_all(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         await message.answer("❌ Доступ только для администратора.")
         return
     
-    users = get_all_users()
+    report, markup = await render_all_page(page=1, cursor_id=0)
     
-    if not users:
+    if not report:
         await message.answer("📭 В базе данных нет пользователей.")
         return
     
-    report = f"👥 <b>ВСЕ ПОЛЬЗОВАТЕЛИ ({len(users)} чел.)</b>\n\n"
+    await message.answer(report, reply_markup=markup, parse_mode="HTML")
+
+@callbacks.prefix("all")
+async def process_all_page_callback(callback_query: types.CallbackQuery, direction: str, page: str, cursor_id: str):
+    """Листание страниц /all — редактирует то же сообщение"""
+    if callback_query.from_user.id != ADMIN_ID:
+        await callback_query.answer("❌ Доступ только для администратора.", show_alert=True)
+        return
     
-    for i, user in enumerate(users, 1):
-        telegram_id = user[0]
-        surname = user[1]
-        name = user[2]
-        rank = user[3] or "не указано"
-        
-        full_name = f"{surname} {name}"
-        medical = get_medical(telegram_id)
-        checks = get_checks(telegram_id)
-        vacation = get_vacation(telegram_id)
-        
-        report += f"<b>#{i}. {full_name}</b> ({rank})\n"
-        report += f"   ID: <code>{telegram_id}</code>\n"
-        
-        if medical and medical[1]:
-            vlk = check_vlk_status(medical[1])
-            if vlk['vlk_expired']:
-                report += f"   🔴 <b>ВЛК:</b> ИСТЕКЛА! ({vlk['days_passed']} дн. назад)\n"
-            elif vlk['umo_needed'] and not medical[2]:
-                report += f"   🟠 <b>ВЛК:</b> Нужно УМО! ({vlk['days_passed']} дн.)\n"
-            else:
-                report += f"   🟢 <b>ВЛК:</b> {vlk['days_remaining']} дн.\n"
-            
-            if medical[2]:
-                report += f"   🟢 <b>УМО:</b> {medical[2]}\n"
-            elif vlk['umo_needed']:
-                report += f"   🔴 <b>УМО:</b> НЕ ПРОЙДЕНО!\n"
-        else:
-            report += f"   ⚪ <b>ВЛК:</b> нет данных\n"
-        
-        if checks:
-            if checks[1]:
-                ex4 = check_exercise_status(checks[1], 6)
-                if ex4['expired']:
-                    report += f"   🔴 <b>Упр.4:</b> ИСТЕКЛО! ({abs(ex4['days_remaining'])} дн.)\n"
-                else:
-                    report += f"   🟢 <b>Упр.4:</b> {ex4['days_remaining']} дн.\n"
-            if checks[2]:
-                ex7 = check_exercise_status(checks[2], 12)
-                if ex7['expired']:
-                    report += f"   🔴 <b>Упр.7:</b> ИСТЕКЛО! ({abs(ex7['days_remaining'])} дн.)\n"
-                else:
-                    report += f"   🟢 <b>Упр.7:</b> {ex7['days_remaining']} дн.\n"
-        else:
-            report += f"   ⚪ <b>КБП:</b> нет данных\n"
-        
-        if vacation and vacation[2]:
-            vac = check_vacation_status(vacation[2])
-            vac_days = vacation[3] if len(vacation) > 3 else 0
-            if vac['expired']:
-                report += f"   🔴 <b>Отпуск:</b> ИСТЁК! ({vac_days} дн., {vac['days_passed']} дн. назад)\n"
-            else:
-                report += f"   🟢 <b>Отпуск:</b> {vac_days} дн. (осталось {vac['days_until_next']} дн.)\n"
+    report, markup = await render_all_page(int(page), int(cursor_id), backward=direction == "prev")
+    
+    if not report:
+        await callback_query.answer("📭 Больше пользователей нет.")
+        return
+    
+    await render_menu(callback_query, report, markup)
+
+# ==================== /due (АДМИН) ====================
+
+# Сколько позиций показывать на одной странице /due
+DUE_PAGE_SIZE = 10
+
+# Фильтр категории: ключ -> (категории database.DUE_CATEGORIES, подпись кнопки, слово для /due)
+DUE_FILTERS = {
+    "all": (tuple(DUE_CATEGORIES), "Все", "все"),
+    "vlk": (("vlk",), "ВЛК", "влк"),
+    "umo": (("umo",), "УМО", "умо"),
+    "ex4": (("ex4",), "Упр.4", "упр4"),
+    "ex7": (("ex7",), "Упр.7", "упр7"),
+    "vacation": (("vacation",), "Отпуск", "отпуск"),
+}
+
+# Окно: ключ -> (дней вперёд, None — только истёкшие; подпись кнопки)
+DUE_WINDOWS = {
+    "exp": (None, "Истекло"),
+    "7": (7, "≤ 7 дн."),
+    "15": (15, "≤ 15 дн."),
+    "30": (30, "≤ 30 дн."),
+}
+
+DUE_ITEM_TITLES = dict(CATEGORIES)
+DUE_ITEM_KEYS = list(DUE_CATEGORIES)
+
+def _rank_key(rank: str) -> str:
+    """Короткий ключ звания для callback_data (само звание может не влезть в 64 байта)"""
+    return hashlib.sha1(rank.encode("utf-8")).hexdigest()[:8]
+
+def format_due_item(row, index: int, today: int) -> str:
+    """Строка /due: кто и какой срок"""
+    category = DUE_ITEM_KEYS[row['item']]
+    days = row['due_day'] - today
+    full_name = html.escape(f"{row['surname']} {row['name']}")
+    rank = html.escape(row['rank'] or "не указано")
+    
+    if days <= 0:
+        icon, when = "🔴", f"истекло {'сегодня' if days == 0 else f'{-days} дн. назад'}"
+    else:
+        icon = "🟠" if days <= 7 else "🟡" if days <= 15 else "🟢"
+        when = f"через {days} дн."
+    return (
+        f"<b>{index}. {full_name}</b> ({rank})\n"
+        f"   {icon} {DUE_ITEM_TITLES[category]}: {when} ({from_day(row['due_day'])}), "
+        f"ID <code>{row['telegram_id']}</code>\n"
+    )
+
+async def render_due_page(category: str, window: str, rank_key: str = "-", page: int = 1,
+                          cursor: tuple = None, backward: bool = False):
+    """Текст и кнопки одной страницы /due (по индексным диапазонам сроков, без полного прохода)"""
+    rank = None
+    if rank_key != "-":
+        rank = {_rank_key(r): r for r in await get_ranks()}.get(rank_key)
+        if rank is None:
+            rank_key = "-"
+    categories, category_title, _ = DUE_FILTERS[category]
+    horizon, window_title = DUE_WINDOWS[window]
+    
+    rows, has_more = await get_due_page(list(categories), horizon, rank, cursor, DUE_PAGE_SIZE, backward)
+    if not rows and page > 1:
+        # Позиции, на которые указывала кнопка, уже исчезли — начинаем сначала
+        return await render_due_page(category, window, rank_key)
+    
+    has_prev = has_more if backward else page > 1
+    has_next = True if backward else has_more
+    
+    report = f"⏰ <b>СРОКИ</b>: {category_title}, {window_title.lower()}"
+    if rank:
+        report += f", {html.escape(rank)}"
+    report += f" — стр. {page}\n\n"
+    if rows:
+        today = today_day()
+        first_index = (page - 1) * DUE_PAGE_SIZE + 1
+        for i, row in enumerate(rows, first_index):
+            report += format_due_item(row, i, today)
+    else:
+        report += "✅ Таких сроков нет.\n"
+    
+    def filter_button(text: str, selected: bool, category: str, window: str, rank_key: str):
+        return InlineKeyboardButton(
+            text=f"• {text}" if selected else text,
+            callback_data=callbacks.pack("due", category, window, rank_key, 1, "n", "", "", "")
+        )
+    
+    builder = InlineKeyboardBuilder()
+    filters = [filter_button(title, key == category, key, window, rank_key)
+               for key, (_, title, _) in DUE_FILTERS.items()]
+    builder.row(*filters[:3])
+    builder.row(*filters[3:])
+    builder.row(*[filter_button(title, key == window, category, key, rank_key)
+                  for key, (_, title) in DUE_WINDOWS.items()])
+    builder.row(InlineKeyboardButton(
+        text=f"🎖️ Звание: {rank or 'все'}", callback_data=callbacks.pack("duer", category, window)
+    ))
+    
+    buttons = []
+    if has_prev:
+        first = rows[0]
+        buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=callbacks.pack(
+            "due", category, window, rank_key, page - 1, "p", first['due_day'], first['telegram_id'], first['item']
+        )))
+    if has_next and rows:
+        last = rows[-1]
+        buttons.append(InlineKeyboardButton(text="Далее ➡️", callback_data=callbacks.pack(
+            "due", category, window, rank_key, page + 1, "n", last['due_day'], last['telegram_id'], last['item']
+        )))
+    if buttons:
+        builder.row(*buttons)
+    return report, builder.as_markup()
+
+@dp.message(Command("due"))
+async def cmd_due(message: types.Message, command: CommandObject):
+    """/due [категория] [окно] [звание]: например /due влк 7 или /due истекло капитан"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("❌ Доступ только для администратора.")
+        return
+    
+    category, window, rank_words = "all", "30", []
+    categories_by_word = {word: key for key, (_, _, word) in DUE_FILTERS.items()}
+    for word in (command.args or "").split():
+        lowered = word.lower()
+        if lowered in categories_by_word:
+            category = categories_by_word[lowered]
+        elif lowered in DUE_WINDOWS or lowered == "истекло":
+            window = "exp" if lowered == "истекло" else lowered
         else:
-            report += f"   ⚪ <b>Отпуск:</b> нет данных\n"
-        
-        report += "\n"
-        
-        if len(report) > 3000:
-            await message.answer(report, parse_mode="HTML")
-            report = ""
+            rank_words.append(lowered)
+    
+    rank_key = "-"
+    if rank_words:
+        ranks = await get_ranks()
+        wanted = " ".join(rank_words)
+        rank = next((r for r in ranks if r.lower() == wanted), None)
+        if rank is None:
+            await message.answer(
+                f"❌ Звание «{wanted}» не найдено.\n"
+                f"Категории: {', '.join(word for _, _, word in DUE_FILTERS.values())}\n"
+                f"Окно: истекло, 7, 15, 30\n"
+                f"Звания: {', '.join(ranks) or 'нет'}"
+            )
+            return
+        rank_key = _rank_key(rank)
+    
+    report, markup = await render_due_page(category, window, rank_key)
+    await message.answer(report, reply_markup=markup, parse_mode="HTML")
+
+@callbacks.prefix("due")
+async def process_due_callback(callback_query: types.CallbackQuery, category: str, window: str, rank_key: str,
+                               page: str, direction: str, due: str, telegram_id: str, item: str):
+    """Смена фильтра или страницы /due — редактирует то же сообщение"""
+    if callback_query.from_user.id != ADMIN_ID:
+        await callback_query.answer("❌ Доступ только для администратора.", show_alert=True)
+        return
+    if category not in DUE_FILTERS or window not in DUE_WINDOWS:
+        await callback_query.answer("Кнопка устарела, наберите /due заново.")
+        return
+    
+    cursor = (int(due), int(telegram_id), int(item)) if due else None
+    report, markup = await render_due_page(category, window, rank_key, int(page), cursor, backward=direction == "p")
+    await render_menu(callback_query, report, markup)
+
+@callbacks.prefix("duer")
+async def process_due_ranks_callback(callback_query: types.CallbackQuery, category: str, window: str):
+    """Выбор звания для /due"""
+    if callback_query.from_user.id != ADMIN_ID:
+        await callback_query.answer("❌ Доступ только для администратора.", show_alert=True)
+        return
+    
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(
+        text="Все звания", callback_data=callbacks.pack("due", category, window, "-", 1, "n", "", "", "")
+    ))
+    for rank in await get_ranks():
+        builder.row(InlineKeyboardButton(
+            text=rank, callback_data=callbacks.pack("due", category, window, _rank_key(rank), 1, "n", "", "", "")
+        ))
+    await render_menu(callback_query, "🎖️ <b>Выберите звание:</b>", builder.as_markup())
+
+# ==================== ПОИСК (АДМИН) ====================
+
+# Сколько совпадений показать в ответе /find
+FIND_RESULTS_SHOWN = 10
+
+# Сколько результатов отдавать в inline-режиме (Telegram принимает до 50)
+INLINE_RESULTS = 20
+
+def format_status_line(row, statuses: dict) -> str:
+    """Статусы одной строкой — для описания inline-результата"""
+    vlk = statuses['vlk']
+    if not vlk:
+        parts = ["⚪ ВЛК"]
+    elif vlk['vlk_expired']:
+        parts = ["🔴 ВЛК"]
+    elif vlk['umo_needed'] and not row['umo_date']:
+        parts = ["🟠 УМО"]
+    else:
+        parts = ["🟢 ВЛК"]
+    for key, title in (("ex4", "Упр.4"), ("ex7", "Упр.7"), ("vacation", "Отпуск")):
+        status = statuses[key]
+        icon = "⚪" if not status else "🔴" if status['expired'] else "🟢"
+        parts.append(f"{icon} {title}")
+    return "  ".join(parts)
+
+@dp.message(Command("find"))
+async def cmd_find(message: types.Message, command: CommandObject):
+    """Поиск по фамилии, имени, отчеству и званию"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("❌ Доступ только для администратора.")
+        return
+    
+    if not search.terms(command.args or ""):
+        await message.answer(
+            "🔎 <b>Поиск</b>\n\n"
+            "Используйте: <code>/find Иванов</code> — часть фамилии, имени, отчества "
+            "или звания, от 3 букв.\n"
+            "В любом чате можно набрать <code>@бот Иванов</code>.",
+            parse_mode="HTML"
+        )
+        return
+    
+    rows, total = await search.find(command.args, FIND_RESULTS_SHOWN)
+    if not rows:
+        await message.answer("📭 Никого не нашлось.")
+        return
+    
+    report = f"🔎 <b>Найдено: {total}</b>\n\n"
+    for i, (row, row_statuses) in enumerate(zip(rows, batch_row_statuses(rows)), 1):
+        report += format_user_report(row, i, row_statuses) + "\n"
+    if total > len(rows):
+        report += f"Показаны первые {len(rows)} — уточните запрос."
+    await message.answer(report, parse_mode="HTML")
+
+@dp.inline_query()
+async def inline_search(inline_query: types.InlineQuery):
+    """Inline-режим: @бот фамилия — совпадения со статусами, только для админа"""
+    if inline_query.from_user.id != ADMIN_ID:
+        await inline_query.answer([], cache_time=300, is_personal=True)
+        return
+    
+    rows, _ = await search.find(inline_query.query, INLINE_RESULTS)
+    results = [
+        InlineQueryResultArticle(
+            id=str(row['telegram_id']),
+            title=" ".join(filter(None, (row['surname'], row['name'], row['patronymic']))),
+            description=f"{row['rank'] or 'звание не указано'}\n{format_status_line(row, row_statuses)}",
+            input_message_content=InputTextMessageContent(
+                message_text=format_user_report(row, i, row_statuses), parse_mode="HTML"
+            ),
+        )
+        for i, (row, row_statuses) in enumerate(zip(rows, batch_row_statuses(rows)), 1)
+    ]
+    # Статусы меняются каждый день — Telegram не должен долго хранить выдачу
+    await inline_query.answer(results, cache_time=10, is_personal=True)
+
+# ==================== /export (АДМИН) ====================
+
+@dp.message(Command("export"))
+async def cmd_export(message: types.Message, command: CommandObject):
+    """Полный отчёт одним файлом: /export — CSV, /export html — таблица"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("❌ Доступ только для администратора.")
+        return
+    
+    fmt = (command.args or "csv").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        await message.answer("❌ Формат: /export (CSV) или /export html")
+        return
+    
+    # Файл собирается по ходу загрузки, целиком в памяти не лежит
+    report = ReportFile(fmt)
+    result = await outbound.send_document(
+        message.chat.id, report, caption=f"📊 <b>{report.title}</b>", parse_mode="HTML"
+    )
+    if not result.ok:
+        await message.answer(f"❌ Не удалось отправить отчёт: {result.error or ''}")
+
+# ==================== /import (АДМИН) ====================
+
+# Сколько ошибок показать в ответе; полный список приходит файлом
+IMPORT_ERRORS_SHOWN = 10
+
+# Больше Bot API скачать не даст
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+
+async def import_roster_document(message: types.Message):
+    """Загружает присланный файл в базу и отвечает итогом"""
+    document = message.document
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        await message.answer("❌ Файл больше 20 МБ — разбейте его на части.")
+        return
+    
+    await message.answer("⏳ Загружаю список...")
+    file = await bot.download(document)
+    try:
+        result = await roster_import.import_file(file, document.file_name)
+    except roster_import.RosterFileError as e:
+        await message.answer(
+            f"❌ <b>Файл не принят:</b> {html.escape(str(e))}\nВ базу ничего не записано.", parse_mode="HTML"
+        )
+        return
+    except roster_import.RosterImportError as e:
+        logger.error(f"Импорт прерван: {e}")
+        await message.answer(
+            f"❌ <b>Импорт прерван</b> ошибкой базы.\n"
+            f"Уже записано строк: {e.imported} — после исправления пришлите файл ещё раз.",
+            parse_mode="HTML"
+        )
+        return
     
-    if report:
-        await message.answer(report, parse_mode="HTML")
+    report = (
+        f"✅ <b>Импорт завершён</b>\n\n"
+        f"👥 Записано: {result.imported}\n"
+        f"⚠️ Строк с ошибками: {len(result.errors)}\n"
+        f"⏱️ {result.seconds:.1f} с"
+    )
+    if result.errors:
+        report += "\n\n" + "\n".join(
+            f"• строка {line}: {html.escape(error)}" for line, error in result.errors[:IMPORT_ERRORS_SHOWN]
+        )
+    await message.answer(report, parse_mode="HTML")
+    
+    if len(result.errors) > IMPORT_ERRORS_SHOWN:
+        await outbound.send_document(
+            message.chat.id,
+            BufferedInputFile(roster_import.errors_csv(result.errors), filename="import_errors.csv"),
+            caption=f"📄 Все ошибки импорта: {len(result.errors)}"
+        )
+
+@dp.message(Command("import"))
+async def cmd_import(message: types.Message, state: FSMContext):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer("❌ Доступ только для администратора.")
+        return
+    
+    # Файл можно прислать сразу, с подписью /import
+    if message.document:
+        await import_roster_document(message)
+        return
+    
+    await message.answer(
+        "📥 <b>Импорт списка</b>\n\n"
+        "Отправьте файл <b>.csv</b> или <b>.xlsx</b>. Первая строка — заголовок:\n"
+        "<code>telegram_id, фамилия, имя, отчество, звание, влк, умо, "
+        "упр4, упр7, отпуск с, отпуск по</code>\n\n"
+        "Обязательны telegram_id, фамилия и имя. Даты — ГГГГ-ММ-ДД или ДД.ММ.ГГГГ.\n"
+        "Анкеты из файла перезаписываются, строки с ошибками пропускаются.",
+        parse_mode="HTML"
+    )
+    await state.set_state(Form.import_file)
+
+@dp.message(Form.import_file)
+async def process_import_file(message: types.Message, state: FSMContext):
+    if not message.document:
+        await message.answer("❌ Пришлите файл .csv или .xlsx:")
+        return
+    await state.clear()
+    await import_roster_document(message)
 
 # ==================== /delete ====================
 
 @dp.message(Command("delete"))
 async def cmd_delete(message: types.Message, state: FSMContext):
-    user = get_user(message.from_user.id)
+    user = await get_user(message.from_user.id)
     
     if not user:
         await message.answer("❌ У вас нет данных для удаления.")
@@ -402,7 +922,7 @@ async def cmd_delete(message: types.Message, state: FSMContext):
 @dp.message(Form.confirm_delete)
 async def process_delete_confirm(message: types.Message, state: FSMContext):
     if message.text.upper() == "ДА":
-        delete_user(message.from_user.id)
+        await delete_user(message.from_user.id)
         await message.answer("✅ Ваши данные удалены.")
     else:
         await message.answer("❌ Удаление отменено.")
@@ -412,7 +932,7 @@ async def process_delete_confirm(message: types.Message, state: FSMContext):
 
 @dp.message(Command("update"))
 async def cmd_update(message: types.Message, state: FSMContext):
-    user = get_user(message.from_user.id)
+    user = await get_user(message.from_user.id)
     
     if not user:
         await message.answer("❌ Вы ещё не зарегистрированы.")
@@ -454,7 +974,7 @@ async def process_update_field(message: types.Message, state: FSMContext):
 async def process_update_value(message: types.Message, state: FSMContext):
     data = await state.get_data()
     field = data.get('update_field')
-    update_user(message.from_user.id, **{field: message.text})
+    await update_user(message.from_user.id, **{field: message.text})
     await message.answer(f"✅ Поле <b>{field}</b> обновлено на: {message.text}", parse_mode="HTML")
     await state.clear()
 
@@ -474,13 +994,13 @@ async def cmd_vlk(message: types.Message, state: FSMContext):
 async def process_vlk_date(message: types.Message, state: FSMContext):
     try:
         datetime.strptime(message.text, "%Y-%m-%d")
-        add_medical(message.from_user.id, message.text)
+        await add_medical(message.from_user.id, message.text)
         await message.answer(f"✅ <b>ВЛК сохранена:</b> {message.text}", parse_mode="HTML")
         
-        user = get_user(message.from_user.id)
+        user = await get_user(message.from_user.id)
         if user:
             full_name = f"{user[1]} {user[2]}"
-            await bot.send_message(
+            await outbound.send(
                 ADMIN_ID,
                 f"📝 <b>Пользователь обновил ВЛК</b>\n\n"
                 f"👤 {full_name}\n"
@@ -528,13 +1048,13 @@ async def process_exercise_date(message: types.Message, state: FSMContext):
         data = await state.get_data()
         exercise = data.get('exercise_num')
         datetime.strptime(message.text, "%Y-%m-%d")
-        add_check(message.from_user.id, exercise, message.text)
+        await add_check(message.from_user.id, exercise, message.text)
         await message.answer(f"✅ <b>Упражнение {exercise} сохранено:</b> {message.text}", parse_mode="HTML")
         
-        user = get_user(message.from_user.id)
+        user = await get_user(message.from_user.id)
         if user:
             full_name = f"{user[1]} {user[2]}"
-            await bot.send_message(
+            await outbound.send(
                 ADMIN_ID,
                 f"📝 <b>Пользователь обновил проверку</b>\n\n"
                 f"👤 {full_name}\n"
@@ -561,8 +1081,11 @@ async def cmd_vacation(message: types.Message, state: FSMContext):
 @dp.message(Form.vacation_start)
 async def process_vacation_start(message: types.Message, state: FSMContext):
     try:
-        datetime.strptime(message.text, "%Y-%m-%d")
-        await state.update_data(vac_start=message.text)
+        # Дату разбираем один раз: дальше анкета хранит и текст, и номер дня
+        start_day = to_day(message.text)
+        if start_day is None:
+            raise ValueError("пустая дата")
+        await state.update_data(vac_start=message.text, vac_start_day=start_day)
         await message.answer("Введите дату <b>окончания</b> отпуска (ГГГГ-ММ-ДД):", parse_mode="HTML")
         await state.set_state(Form.vacation_end)
     except ValueError:
@@ -573,12 +1096,12 @@ async def process_vacation_start(message: types.Message, state: FSMContext):
 async def process_vacation_end(message: types.Message, state: FSMContext):
     try:
         data = await state.get_data()
-        datetime.strptime(message.text, "%Y-%m-%d")
-        add_vacation(message.from_user.id, data['vac_start'], message.text)
-        
-        start = datetime.strptime(data['vac_start'], "%Y-%m-%d")
-        end = datetime.strptime(message.text, "%Y-%m-%d")
-        days = (end - start).days + 1
+        end_day = to_day(message.text)
+        if end_day is None:
+            raise ValueError("пустая дата")
+        # Анкеты, начатые до появления vac_start_day, хранят только текст
+        start_day = data['vac_start_day'] if 'vac_start_day' in data else to_day(data['vac_start'])
+        days = await add_vacation_days(message.from_user.id, start_day, end_day)
         
         await message.answer(
             f"✅ <b>Отпуск сохранён!</b>\n\n"
@@ -587,10 +1110,10 @@ async def process_vacation_end(message: types.Message, state: FSMContext):
             parse_mode="HTML"
         )
         
-        user = get_user(message.from_user.id)
+        user = await get_user(message.from_user.id)
         if user:
             full_name = f"{user[1]} {user[2]}"
-            await bot.send_message(
+            await outbound.send(
                 ADMIN_ID,
                 f"📝 <b>Пользователь обновил отпуск</b>\n\n"
                 f"👤 {full_name}\n"
@@ -605,19 +1128,21 @@ async def process_vacation_end(message: types.Message, state: FSMContext):
 
 # ==================== ОБРАБОТКА КНОПОК ====================
 
-@dp.callback_query(lambda c: c.data == "profile")
+@callbacks.button("profile")
 async def process_profile_callback(callback_query: types.CallbackQuery):
     """Обработка кнопки профиля"""
     logger.info(f"Callback profile от {callback_query.from_user.id}")
-    await callback_query.answer()
     
-    user = get_user(callback_query.from_user.id)
+    user = await get_user(callback_query.from_user.id)
     if not user:
-        await callback_query.message.answer("❌ Вы ещё не зарегистрированы. Используйте /start")
+        await render_menu(callback_query, "❌ Вы ещё не зарегистрированы. Используйте /start",
+                          get_main_keyboard())
         return
     
-    medical = get_medical(callback_query.from_user.id)
-    checks = get_checks(callback_query.from_user.id)
+    medical, checks = await asyncio.gather(
+        get_medical(callback_query.from_user.id),
+        get_checks(callback_query.from_user.id)
+    )
     
     vlk_status = ""
     if medical and medical[1]:
@@ -633,20 +1158,20 @@ async def process_profile_callback(callback_query: types.CallbackQuery):
     if user[3]:
         full_name += f" {user[3]}"
     
-    await callback_query.message.answer(
+    await render_menu(
+        callback_query,
         f"📋 <b>{full_name}</b>\n\n"
         f"🎖️ {user[4] or 'не указано'}\n\n"
         f"{vlk_status}",
-        reply_markup=get_main_keyboard(),
-        parse_mode="HTML"
+        get_main_keyboard()
     )
 
-@dp.callback_query(lambda c: c.data == "help")
+@callbacks.button("help")
 async def process_help_callback(callback_query: types.CallbackQuery):
     """Обработка кнопки помощи"""
     logger.info(f"Callback help от {callback_query.from_user.id}")
-    await callback_query.answer()
-    await callback_query.message.answer(
+    await render_menu(
+        callback_query,
         "📖 <b>Доступные команды:</b>\n\n"
         "/start — Регистрация\n"
         "/profile — Мои данные\n"
@@ -656,74 +1181,73 @@ async def process_help_callback(callback_query: types.CallbackQuery):
         "/update — Редактировать\n"
         "/delete — Удалить данные\n"
         "/all — Список пользователей (админ)",
-        reply_markup=get_main_keyboard(),
-        parse_mode="HTML"
+        get_main_keyboard()
     )
 
-@dp.callback_query(lambda c: c.data == "vlk")
+@callbacks.button("vlk")
 async def process_vlk_callback(callback_query: types.CallbackQuery):
     """Обработка кнопки ВЛК"""
     logger.info(f"Callback vlk от {callback_query.from_user.id}")
-    await callback_query.answer()
-    await callback_query.message.answer(
+    await render_menu(
+        callback_query,
         "🏥 <b>ВЛК</b>\n\n"
         "Используйте команду /vlk для добавления даты ВЛК",
-        parse_mode="HTML"
+        get_main_keyboard()
     )
 
-@dp.callback_query(lambda c: c.data == "checks")
+@callbacks.button("checks")
 async def process_checks_callback(callback_query: types.CallbackQuery):
     """Обработка кнопки проверок"""
     logger.info(f"Callback checks от {callback_query.from_user.id}")
-    await callback_query.answer()
-    await callback_query.message.answer(
+    await render_menu(
+        callback_query,
         "✈️ <b>Проверки КБП</b>\n\n"
         "Используйте команду /checks для добавления проверок",
-        parse_mode="HTML"
+        get_main_keyboard()
     )
 
-@dp.callback_query(lambda c: c.data == "vacation")
+@callbacks.button("vacation")
 async def process_vacation_callback(callback_query: types.CallbackQuery):
     """Обработка кнопки отпуска"""
     logger.info(f"Callback vacation от {callback_query.from_user.id}")
-    await callback_query.answer()
-    await callback_query.message.answer(
+    await render_menu(
+        callback_query,
         "🏖️ <b>Отпуск</b>\n\n"
         "Используйте команду /vacation для добавления отпуска",
-        parse_mode="HTML"
+        get_main_keyboard()
     )
 
-@dp.callback_query(lambda c: c.data == "update")
+@callbacks.button("update")
 async def process_update_callback(callback_query: types.CallbackQuery):
     """Обработка кнопки редактирования"""
     logger.info(f"Callback update от {callback_query.from_user.id}")
-    await callback_query.answer()
-    await callback_query.message.answer(
+    await render_menu(
+        callback_query,
         "✏️ <b>Редактирование</b>\n\n"
         "Используйте команду /update",
-        parse_mode="HTML"
+        get_main_keyboard()
     )
 
-@dp.callback_query(lambda c: c.data == "delete")
+@callbacks.button("delete")
 async def process_delete_callback(callback_query: types.CallbackQuery):
     """Обработка кнопки удаления"""
     logger.info(f"Callback delete от {callback_query.from_user.id}")
-    await callback_query.answer()
-    await callback_query.message.answer(
+    await render_menu(
+        callback_query,
         "🗑️ <b>Удаление данных</b>\n\n"
         "Используйте команду /delete",
-        parse_mode="HTML"
+        get_main_keyboard()
     )
 
-@dp.callback_query(lambda c: c.data == "start_reg")
+@callbacks.button("start_reg")
 async def process_start_reg_callback(callback_query: types.CallbackQuery):
     """Обработка кнопки регистрации"""
     logger.info(f"Callback start_reg от {callback_query.from_user.id}")
-    await callback_query.answer()
-    await callback_query.message.answer(
+    await render_menu(
+        callback_query,
         "👋 <b>Регистрация</b>\n\n"
         "Используйте команду /start",
-        parse_mode="HTML"
+        get_main_keyboard()
     )
 
 # ==================== ОБРАБОТКА УПОМИНАНИЙ В ГРУППЕ ====================
@@ -739,10 +1263,12 @@ async def handle_mention(message: types.Message):
         return
     
     if message.entities:
+        # getMe запрошен при запуске, здесь берётся из кэша
+        me = await bot.me()
         for entity in message.entities:
             if entity.type == "mention":
                 mention = message.text[entity.offset:entity.offset+entity.length]
-                if mention.lower() == f"@{bot.username.lower()}":
+                if mention.lower() == f"@{me.username.lower()}":
                     await message.answer(
                         f"👋 {message.from_user.first_name}!\n\n"
                         f"Я здесь! Используйте /menu для команд.",
@@ -754,36 +1280,81 @@ async def handle_mention(message: types.Message):
 # ==================== ВЕБ-СЕРВЕР ====================
 
 app = web.Application()
-SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path="/webhook")
+# /webhook отвечает сразу, обновления разбирает очередь (webhook_queue.py);
+# состояние очереди — GET /webhook/queue. Очередь держит порядок обновлений
+# пользователя только внутри процесса: при нескольких процессах следующее
+# обновление попало бы в другой раньше, чем закончено предыдущее. Поэтому
+# там обрабатываем внутри запроса: Telegram получает ответ только после обработки
+update_pool = register_webhook(app, dp, bot, path="/webhook",
+                               workers=UPDATE_WORKERS if WEB_WORKERS == 1 else 0)
+
+async def filter_stats(request: web.Request) -> web.Response:
+    """GET: сколько обновлений отсеяно до FSM и обработчиков"""
+    return web.json_response(update_filter.stats())
+
+app.router.add_get("/webhook/filter", filter_stats)
+
+# Метрики Prometheus; счётчики модулей читаются в момент запроса
+metrics.add_stats("bot_user_cache", "Кэш чтений по пользователю (async_db)", async_db.cache_stats)
+metrics.add_stats("bot_menu", "Отрисовки inline-меню", lambda: menu_counters)
+metrics.add_stats("bot_update_filter", "Ранний отсев обновлений", update_filter.stats)
+metrics.add_stats("bot_search_cache", "Кэш поиска по составу", search.cache.stats)
+if update_pool:
+    metrics.add_stats("bot_update_queue", "Очередь обработки обновлений", update_pool.stats)
+app.router.add_get("/metrics", metrics.metrics_handler)
 setup_application(app, dp, bot=bot)
 
+async def backfill_dates():
+    """Дозаполняет целочисленные даты после миграции схемы, не останавливая бота"""
+    try:
+        updated = await backfill_day_columns()
+        if updated:
+            logger.info(f"Заполнены целочисленные даты: {updated} строк")
+    except Exception as e:
+        logger.error(f"Ошибка фонового заполнения дат: {e}")
+
 async def on_startup(app: web.Application):
     """Запуск бота: webhook + планировщик"""
-    init_db()
-    
-    # Устанавливаем webhook с ВСЕМИ типами обновлений
-    await bot.set_webhook(
-        WEBHOOK_URL,
-        allowed_updates=[
-            "message",
-            "callback_query",
-            "edited_message",
-            "channel_post",
-            "edited_channel_post",
-            "inline_query",
-            "chosen_inline_result",
-            "chat_member",
-            "my_chat_member"
-        ]
-    )
+    await init_db()
+    asyncio.create_task(backfill_dates())
+    # Анкеты, начатые до перезапуска: ответы на них в группах не должен отсеять фильтр
+    await fsm_storage.load_active()
     
-    asyncio.create_task(run_scheduler(bot, interval_hours=24))
-    logger.info("Планировщик напоминаний запущен!")
+    # getMe и типы обновлений, на которые есть обработчики: остальные
+    # Telegram не пришлёт, а пришедшие по старой подписке отсеет фильтр
+    allowed_updates = await update_filter.setup(bot, dp)
+    await bot.set_webhook(WEBHOOK_URL, allowed_updates=allowed_updates)
+    
+    # Планировщик запустится только в ведущем воркере; лента изменений
+    # доносит до каждого воркера правки, сделанные в остальных
+    app["background_tasks"] = [
+        asyncio.create_task(run_scheduler_leader(bot, sender=outbound)),
+        asyncio.create_task(async_db.watch_changes()),
+    ]
+    logger.info(f"Воркер {os.getpid()} запущен (всего воркеров: {WEB_WORKERS})")
+    if fsm_storage.flush_interval <= 0:
+        logger.warning(
+            f"Буфер записей FSM выключен (воркеров: {WEB_WORKERS}): каждый шаг анкеты "
+            f"пишется в базу сразу"
+        )
+    if update_pool is None:
+        logger.warning(
+            f"Очередь обновлений выключена (воркеров: {WEB_WORKERS}): /webhook отвечает "
+            f"только после обработки. Для быстрого ответа запускайте с WEB_WORKERS=1"
+        )
     logger.info(f"Webhook установлен: {WEBHOOK_URL}")
 
 async def on_shutdown(app: web.Application):
     """Остановка бота"""
-    await bot.delete_webhook()
+    logger.info(f"Фильтр обновлений: {update_filter.stats()}")
+    for task in app.get("background_tasks", []):
+        task.cancel()
+    await asyncio.gather(*app.get("background_tasks", []), return_exceptions=True)
+    # Остальные воркеры продолжают принимать обновления — webhook снимаем,
+    # только если процесс один
+    if WEB_WORKERS == 1:
+        await bot.delete_webhook()
+    async_db.close()
 
 app.on_startup.append(on_startup)
 app.on_shutdown.append(on_shutdown)
@@ -0,0 +1,87 @@
+"""Таблица маршрутов для нажатий inline-кнопок.
+
+Вместо цепочки фильтров `lambda c: c.data == "..."`, которую aiogram
+проверяет по очереди для каждого нажатия, в диспетчере регистрируется
+один обработчик. Он находит нужную функцию поиском в словаре:
+- точное значение callback_data ("profile", "help", ...);
+- префикс до первого «:» для кнопок с параметрами ("all:next:2:123"):
+  обработчик получает остальные части строками.
+
+Параметрические данные собираются через pack(), он же проверяет лимит
+Telegram в 64 байта. Нажатие без маршрута передаётся следующим
+обработчикам диспетчера (SkipHandler).
+"""
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.types import CallbackQuery
+
+# Лимит Telegram на callback_data
+CALLBACK_DATA_LIMIT = 64
+
+SEPARATOR = ":"
+
+Handler = Callable[..., Awaitable[Any]]
+
+def _accepted(func: Handler) -> Tuple[bool, frozenset]:
+    """Принимает ли функция **kwargs и какие именованные аргументы ей нужны"""
+    params = inspect.signature(func).parameters.values()
+    varkw = any(p.kind is inspect.Parameter.VAR_KEYWORD for p in params)
+    names = frozenset(p.name for p in params if p.kind is inspect.Parameter.KEYWORD_ONLY
+                      or p.kind is inspect.Parameter.POSITIONAL_OR_KEYWORD)
+    return varkw, names
+
+class CallbackRoutes:
+    """Маршрутизация callback_data поиском в словаре"""
+
+    def __init__(self):
+        self._exact: Dict[str, Tuple[Handler, bool, frozenset]] = {}
+        self._prefixed: Dict[str, Tuple[Handler, bool, frozenset]] = {}
+
+    def _add(self, table: dict, key: str, func: Handler) -> Handler:
+        if key in self._exact or key in self._prefixed:
+            raise ValueError(f"Маршрут {key!r} уже зарегистрирован")
+        if SEPARATOR in key:
+            raise ValueError(f"В маршруте {key!r} не должно быть {SEPARATOR!r}")
+        table[key] = (func, *_accepted(func))
+        return func
+
+    def button(self, data: str):
+        """Декоратор: обработчик кнопки с callback_data == data"""
+        return lambda func: self._add(self._exact, data, func)
+
+    def prefix(self, name: str):
+        """Декоратор: обработчик кнопок "name:арг1:арг2..." — аргументы приходят строками"""
+        return lambda func: self._add(self._prefixed, name, func)
+
+    @staticmethod
+    def pack(name: str, *args: Any) -> str:
+        """callback_data для кнопки с параметрами"""
+        data = SEPARATOR.join([name, *map(str, args)])
+        if len(data.encode()) > CALLBACK_DATA_LIMIT:
+            raise ValueError(f"callback_data длиннее {CALLBACK_DATA_LIMIT} байт: {data!r}")
+        return data
+
+    def __len__(self) -> int:
+        return len(self._exact) + len(self._prefixed)
+
+    def resolve(self, data: str):
+        """(маршрут, аргументы) или (None, ()) если кнопка не зарегистрирована"""
+        route = self._exact.get(data)
+        if route:
+            return route, ()
+        name, _, rest = data.partition(SEPARATOR)
+        route = self._prefixed.get(name)
+        if route:
+            return route, tuple(rest.split(SEPARATOR)) if rest else ()
+        return None, ()
+
+    async def dispatch(self, callback_query: CallbackQuery, **data: Any) -> Any:
+        """Единственный обработчик callback_query в диспетчере"""
+        route, args = self.resolve(callback_query.data or "")
+        if route is None:
+            raise SkipHandler()
+        func, varkw, names = route
+        kwargs = data if varkw else {k: v for k, v in data.items() if k in names}
+        return await func(callback_query, *args, **kwargs)
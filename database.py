@@ -1,14 +1,89 @@
+import functools
+import os
 import sqlite3
-from datetime import datetime, timedelta
-from typing import Optional, Tuple, List
+import threading
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple, List, Iterator, Sequence
 
 DB_NAME = "users.db"
 
+# Количество потоков-читателей в async_db (писатель всегда один)
+READER_POOL_SIZE = int(os.getenv('DB_READERS', 4))
+
+# Сроки действия (в днях)
+VLK_VALID_DAYS = 365
+UMO_DEADLINE_DAYS = 180
+VACATION_PERIOD_DAYS = 365
+EXERCISE_VALID_MONTHS = {4: 6, 7: 12}
+
+# Напоминания начинаются за столько дней до срока (с запасом на округление
+# в check_exercise_status, где «сегодня» считается вместе со временем)
+REMINDER_HORIZON_DAYS = 31
+
+# ==================== ДАТЫ ====================
+
+_EPOCH = date(1970, 1, 1)
+
+def to_day(value: str) -> Optional[int]:
+    """Дата ГГГГ-ММ-ДД -> номер дня от 1970-01-01"""
+    if not value:
+        return None
+    return (datetime.strptime(value, "%Y-%m-%d").date() - _EPOCH).days
+
+def from_day(day: int) -> str:
+    """Номер дня от 1970-01-01 -> дата ГГГГ-ММ-ДД"""
+    return (_EPOCH + timedelta(days=day)).isoformat()
+
+def today_day() -> int:
+    """Номер сегодняшнего дня"""
+    return (date.today() - _EPOCH).days
+
+# ==================== СОЕДИНЕНИЯ ====================
+
+_local = threading.local()
+_connections: List[sqlite3.Connection] = []
+_connections_lock = threading.Lock()
+_generation = 0
+
+def _connect() -> sqlite3.Connection:
+    """Открывает соединение в режиме WAL"""
+    conn = sqlite3.connect(DB_NAME, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def get_connection() -> sqlite3.Connection:
+    """Возвращает долгоживущее соединение текущего потока"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation or _local.db_name != DB_NAME:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+        _local.db_name = DB_NAME
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+def close_connections():
+    """Закрывает все открытые соединения (при остановке бота)"""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+
+# ==================== СХЕМА ====================
+
 def init_db():
     """Создаёт все таблицы"""
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     
+    # Несколько воркеров стартуют одновременно: схему и миграции
+    # применяет тот, кто первым взял блокировку записи
+    cursor.execute("BEGIN IMMEDIATE")
+    
     # Таблица пользователей
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -27,6 +102,10 @@ def init_db():
             telegram_id INTEGER PRIMARY KEY,
             vlk_date DATE,
             umo_date DATE,
+            vlk_expires INTEGER,
+            umo_due INTEGER,
+            vlk_day INTEGER,
+            umo_day INTEGER,
             FOREIGN KEY (telegram_id) REFERENCES users(telegram_id)
         )
     """)
@@ -37,6 +116,10 @@ def init_db():
             telegram_id INTEGER PRIMARY KEY,
             exercise_4_date DATE,
             exercise_7_date DATE,
+            ex4_expires INTEGER,
+            ex7_expires INTEGER,
+            ex4_day INTEGER,
+            ex7_day INTEGER,
             FOREIGN KEY (telegram_id) REFERENCES users(telegram_id)
         )
     """)
@@ -48,116 +131,346 @@ def init_db():
             start_date DATE,
             end_date DATE,
             days INTEGER,
+            next_due INTEGER,
+            start_day INTEGER,
+            end_day INTEGER,
             FOREIGN KEY (telegram_id) REFERENCES users(telegram_id)
         )
     """)
     
+    # Журнал отправленных напоминаний: повторный запуск за тот же день
+    # не отправит их второй раз
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sent_reminders (
+            telegram_id INTEGER NOT NULL,
+            item TEXT NOT NULL,
+            threshold TEXT NOT NULL,
+            sent_on INTEGER NOT NULL,
+            PRIMARY KEY (sent_on, telegram_id, item, threshold)
+        )
+    """)
+    
+    # Прогоны напоминаний по дням
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reminder_runs (
+            run_day INTEGER PRIMARY KEY,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    
+    # Аренда шардов прогона: какой процесс какой шард обрабатывает,
+    # до какого момента аренда действительна и докуда дошли
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS shard_leases (
+            run_day INTEGER NOT NULL,
+            shard INTEGER NOT NULL,
+            owner TEXT,
+            expires_at REAL,
+            last_telegram_id INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (run_day, shard)
+        )
+    """)
+    
+    # Состояния FSM (storage.SQLiteStorage): незаконченные анкеты
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        )
+    """)
+    
+    # Аренда ролей между процессами (ведущий воркер с планировщиком)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS leader_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+    
+    # Лента изменений пользователей: по ней другие процессы сбрасывают
+    # кэш и перепланируют напоминания. Заполняется триггерами ниже
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            changed_at REAL NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS REAL))
+        )
+    """)
+    
+    # Последнее содержимое меню по (чат, сообщение) — общее для всех процессов
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS menu_renders (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        )
+    """)
+    
+    _apply_migrations(cursor)
+    _create_change_triggers(cursor)
+    _create_search_triggers(cursor)
+    
+    # Индексы по срокам — для выборки только тех, кому пора напоминать
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_medical_vlk_expires ON medical (vlk_expires)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_medical_umo_due ON medical (umo_due)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_checks_ex4_expires ON checks (ex4_expires)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_checks_ex7_expires ON checks (ex7_expires)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_vacation_next_due ON vacation (next_due)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_menu_renders_updated_at ON menu_renders (updated_at)")
+    # Список званий для фильтра /due
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_rank ON users (rank)")
+    
     conn.commit()
-    conn.close()
+
+# ==================== МИГРАЦИИ ====================
+# Версия схемы хранится в PRAGMA user_version. Миграции только добавляют
+# столбцы (ALTER TABLE ADD COLUMN не переписывает таблицу), а заполнение
+# больших таблиц идёт потом, порциями, через backfill_day_columns.
+
+# Текстовые столбцы дат и их целочисленные двойники (номер дня от 1970-01-01)
+DAY_COLUMNS = {
+    "medical": [("vlk_day", "vlk_date"), ("umo_day", "umo_date")],
+    "checks": [("ex4_day", "exercise_4_date"), ("ex7_day", "exercise_7_date")],
+    "vacation": [("start_day", "start_date"), ("end_day", "end_date")],
+}
+
+# Сколько строк заполнять за одну транзакцию
+BACKFILL_CHUNK_SIZE = 1000
+
+def _add_column(cursor: sqlite3.Cursor, table: str, column: str, declaration: str) -> bool:
+    """Добавляет столбец, если его ещё нет. Возвращает True, если добавил"""
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    if column in columns:
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return True
+
+def _migrate_due_columns(cursor: sqlite3.Cursor):
+    """Добавляет в старую базу столбцы сроков и заполняет их по датам"""
+    # julianday(дата) - 2440587.5 = номер дня от 1970-01-01
+    if _add_column(cursor, "medical", "vlk_expires", "INTEGER"):
+        cursor.execute(f"""
+            UPDATE medical SET vlk_expires = CAST(julianday(vlk_date) - 2440587.5 AS INTEGER) + {VLK_VALID_DAYS}
+        """)
+    if _add_column(cursor, "medical", "umo_due", "INTEGER"):
+        cursor.execute(f"""
+            UPDATE medical SET umo_due = CAST(julianday(vlk_date) - 2440587.5 AS INTEGER) + {UMO_DEADLINE_DAYS}
+            WHERE umo_date IS NULL
+        """)
+    if _add_column(cursor, "checks", "ex4_expires", "INTEGER"):
+        cursor.execute(f"""
+            UPDATE checks SET ex4_expires = CAST(julianday(exercise_4_date) - 2440587.5 AS INTEGER) + {EXERCISE_VALID_MONTHS[4] * 30}
+        """)
+    if _add_column(cursor, "checks", "ex7_expires", "INTEGER"):
+        cursor.execute(f"""
+            UPDATE checks SET ex7_expires = CAST(julianday(exercise_7_date) - 2440587.5 AS INTEGER) + {EXERCISE_VALID_MONTHS[7] * 30}
+        """)
+    if _add_column(cursor, "vacation", "next_due", "INTEGER"):
+        cursor.execute(f"""
+            UPDATE vacation SET next_due = CAST(julianday(end_date) - 2440587.5 AS INTEGER) + {VACATION_PERIOD_DAYS}
+        """)
+
+def _migrate_day_columns(cursor: sqlite3.Cursor):
+    """Добавляет целочисленные столбцы дат (заполняются фоном)"""
+    for table, columns in DAY_COLUMNS.items():
+        for day_column, _ in columns:
+            _add_column(cursor, table, day_column, "INTEGER")
+
+def _migrate_search_index(cursor: sqlite3.Cursor):
+    """Создаёт поисковый индекс по ФИО и званию и заполняет его по users"""
+    # Триграммы: поиск по любой части слова, без учёта регистра. Содержимое
+    # не дублируется — индекс ссылается на users через представление
+    # (rank — служебное имя в FTS5, столбец переименован)
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS users_search AS
+        SELECT telegram_id, surname, name, patronymic, rank AS user_rank FROM users
+    """)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            surname, name, patronymic, user_rank,
+            content='users_search', content_rowid='telegram_id', tokenize='trigram'
+        )
+    """)
+    cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+
+# (версия схемы, миграция) — по возрастанию версий, только дописывать в конец
+MIGRATIONS = [
+    (1, _migrate_due_columns),
+    (2, _migrate_day_columns),
+    (3, _migrate_search_index),
+]
+
+def _apply_migrations(cursor: sqlite3.Cursor):
+    """Применяет миграции новее текущей версии схемы"""
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for number, migrate in MIGRATIONS:
+        if number > version:
+            migrate(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+
+def backfill_day_columns(position: Tuple[str, int] = None,
+                         chunk_size: int = BACKFILL_CHUNK_SIZE) -> Tuple[Optional[Tuple[str, int]], int]:
+    """Заполняет целочисленные даты для следующей порции строк одной транзакцией.
+
+    position — (таблица, последний обработанный telegram_id), None — с начала.
+    Возвращает (следующая позиция или None, если всё заполнено; число обновлённых строк).
+    """
+    tables = list(DAY_COLUMNS)
+    table, last_id = position or (tables[0], 0)
+    conn = get_connection()
+
+    with conn:
+        bound = conn.execute(f"""
+            SELECT MAX(telegram_id) FROM (
+                SELECT telegram_id FROM {table} WHERE telegram_id > ? ORDER BY telegram_id LIMIT ?
+            )
+        """, (last_id, chunk_size)).fetchone()[0]
+        if bound is None:
+            index = tables.index(table) + 1
+            return ((tables[index], 0) if index < len(tables) else None), 0
+
+        # julianday(дата) - 2440587.5 = номер дня от 1970-01-01
+        assignments = ", ".join(
+            f"{day_column} = COALESCE({day_column}, CAST(julianday({text_column}) - 2440587.5 AS INTEGER))"
+            for day_column, text_column in DAY_COLUMNS[table]
+        )
+        missing = " OR ".join(
+            f"({day_column} IS NULL AND {text_column} IS NOT NULL)"
+            for day_column, text_column in DAY_COLUMNS[table]
+        )
+        cursor = conn.execute(f"""
+            UPDATE {table} SET {assignments}
+            WHERE telegram_id > ? AND telegram_id <= ? AND ({missing})
+        """, (last_id, bound))
+    return (table, bound), cursor.rowcount
+
+# Столбцы, изменение которых попадает в ленту user_changes
+CHANGE_TRACKED_COLUMNS = {
+    "users": "surname, name, patronymic, rank",
+    "medical": "vlk_date, umo_date",
+    "checks": "exercise_4_date, exercise_7_date",
+    "vacation": "start_date, end_date",
+}
+
+def _create_change_triggers(cursor: sqlite3.Cursor):
+    """Триггеры, пишущие в user_changes при любой правке данных пользователя"""
+    for table, columns in CHANGE_TRACKED_COLUMNS.items():
+        for event, row in (("INSERT", "NEW"), ("DELETE", "OLD"), (f"UPDATE OF {columns}", "NEW")):
+            name = f"trg_{table}_{event.split()[0].lower()}_changes"
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO user_changes (telegram_id) VALUES ({row}.telegram_id);
+                END
+            """)
+
+def _create_search_triggers(cursor: sqlite3.Cursor):
+    """Триггеры, поддерживающие users_fts в соответствии с users"""
+    columns = "surname, name, patronymic, user_rank"
+    old_values = "OLD.telegram_id, OLD.surname, OLD.name, OLD.patronymic, OLD.rank"
+    new_values = "NEW.telegram_id, NEW.surname, NEW.name, NEW.patronymic, NEW.rank"
+    remove = f"INSERT INTO users_fts (users_fts, rowid, {columns}) VALUES ('delete', {old_values});"
+    insert = f"INSERT INTO users_fts (rowid, {columns}) VALUES ({new_values});"
+    for event, body in (("INSERT", insert), ("DELETE", remove),
+                        ("UPDATE OF surname, name, patronymic, rank", remove + insert)):
+        name = f"trg_users_fts_{event.split()[0].lower()}"
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON users
+            BEGIN
+                {body}
+            END
+        """)
 
 # ==================== USERS ====================
 
 def add_user(telegram_id: int, surname: str, name: str, patronymic: str, rank: str) -> bool:
     """Добавляет нового пользователя"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
     try:
-        cursor.execute("""
-            INSERT INTO users (telegram_id, surname, name, patronymic, rank)
-            VALUES (?, ?, ?, ?, ?)
-        """, (telegram_id, surname, name, patronymic, rank))
-        conn.commit()
+        with conn:
+            conn.execute("""
+                INSERT INTO users (telegram_id, surname, name, patronymic, rank)
+                VALUES (?, ?, ?, ?, ?)
+            """, (telegram_id, surname, name, patronymic, rank))
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 def get_user(telegram_id: int) -> Optional[Tuple]:
     """Получает данные пользователя"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    cursor = get_connection().execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+    return cursor.fetchone()
 
 def update_user(telegram_id: int, surname: str = None, name: str = None, 
                 patronymic: str = None, rank: str = None) -> bool:
     """Обновляет данные пользователя"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
     
-    if surname:
-        cursor.execute("UPDATE users SET surname = ? WHERE telegram_id = ?", (surname, telegram_id))
-    if name:
-        cursor.execute("UPDATE users SET name = ? WHERE telegram_id = ?", (name, telegram_id))
-    if patronymic:
-        cursor.execute("UPDATE users SET patronymic = ? WHERE telegram_id = ?", (patronymic, telegram_id))
-    if rank:
-        cursor.execute("UPDATE users SET rank = ? WHERE telegram_id = ?", (rank, telegram_id))
+    with conn:
+        if surname:
+            conn.execute("UPDATE users SET surname = ? WHERE telegram_id = ?", (surname, telegram_id))
+        if name:
+            conn.execute("UPDATE users SET name = ? WHERE telegram_id = ?", (name, telegram_id))
+        if patronymic:
+            conn.execute("UPDATE users SET patronymic = ? WHERE telegram_id = ?", (patronymic, telegram_id))
+        if rank:
+            conn.execute("UPDATE users SET rank = ? WHERE telegram_id = ?", (rank, telegram_id))
     
-    conn.commit()
-    conn.close()
     return True
 
 def delete_user(telegram_id: int) -> bool:
     """Удаляет пользователя и все связанные данные"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    conn = get_connection()
     
-    try:
-        cursor.execute("DELETE FROM users WHERE telegram_id = ?", (telegram_id,))
-        cursor.execute("DELETE FROM medical WHERE telegram_id = ?", (telegram_id,))
-        cursor.execute("DELETE FROM checks WHERE telegram_id = ?", (telegram_id,))
-        cursor.execute("DELETE FROM vacation WHERE telegram_id = ?", (telegram_id,))
-        conn.commit()
-        return True
-    finally:
-        conn.close()
+    with conn:
+        conn.execute("DELETE FROM users WHERE telegram_id = ?", (telegram_id,))
+        conn.execute("DELETE FROM medical WHERE telegram_id = ?", (telegram_id,))
+        conn.execute("DELETE FROM checks WHERE telegram_id = ?", (telegram_id,))
+        conn.execute("DELETE FROM vacation WHERE telegram_id = ?", (telegram_id,))
+    return True
 
 def get_all_users() -> List[Tuple]:
     """Получает всех пользователей (для админа)"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT telegram_id, surname, name, rank, created_at FROM users")
-    result = cursor.fetchall()
-    conn.close()
-    return result
+    cursor = get_connection().execute("SELECT telegram_id, surname, name, rank, created_at FROM users")
+    return cursor.fetchall()
 
 # ==================== MEDICAL (ВЛК/УМО) ====================
 
 def add_medical(telegram_id: int, vlk_date: str, umo_date: str = None) -> bool:
     """Добавляет или обновляет медицинские данные"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            INSERT OR REPLACE INTO medical (telegram_id, vlk_date, umo_date)
-            VALUES (?, ?, ?)
-        """, (telegram_id, vlk_date, umo_date))
-        conn.commit()
-        return True
-    finally:
-        conn.close()
+    vlk_day = to_day(vlk_date)
+    vlk_expires = vlk_day + VLK_VALID_DAYS if vlk_day is not None else None
+    umo_due = vlk_day + UMO_DEADLINE_DAYS if vlk_day is not None and not umo_date else None
+    
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO medical (telegram_id, vlk_date, umo_date, vlk_expires, umo_due, vlk_day, umo_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (telegram_id, vlk_date, umo_date, vlk_expires, umo_due, vlk_day, to_day(umo_date)))
+    return True
 
 def get_medical(telegram_id: int) -> Optional[Tuple]:
     """Получает медицинские данные пользователя"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM medical WHERE telegram_id = ?", (telegram_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    cursor = get_connection().execute("SELECT * FROM medical WHERE telegram_id = ?", (telegram_id,))
+    return cursor.fetchone()
 
 def check_vlk_status(vlk_date: str) -> dict:
     """Проверяет статус ВЛК"""
     vlk = datetime.strptime(vlk_date, "%Y-%m-%d")
     today = datetime.now()
     days_passed = (today - vlk).days
-    vlk_valid_days = 365
+    vlk_valid_days = VLK_VALID_DAYS
     days_remaining = vlk_valid_days - days_passed
-    umo_deadline = 180
+    umo_deadline = UMO_DEADLINE_DAYS
     
     return {
         "days_passed": days_passed,
@@ -173,47 +486,48 @@ def check_vlk_status(vlk_date: str) -> dict:
 
 def get_checks(telegram_id: int) -> Optional[Tuple]:
     """Получает проверки КБП пользователя"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM checks WHERE telegram_id = ?", (telegram_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    cursor = get_connection().execute("SELECT * FROM checks WHERE telegram_id = ?", (telegram_id,))
+    return cursor.fetchone()
 
 def add_check(telegram_id: int, exercise: int, check_date: str) -> bool:
     """Добавляет или обновляет проверку КБП"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    valid_months = EXERCISE_VALID_MONTHS.get(exercise)
+    if valid_months is None:
+        return True
+    check_day = to_day(check_date)
+    expires = check_day + valid_months * 30
     
-    # Сначала проверяем есть ли пользователь
-    cursor.execute("SELECT telegram_id FROM checks WHERE telegram_id = ?", (telegram_id,))
-    existing = cursor.fetchone()
+    conn = get_connection()
     
-    if existing:
-        # Если есть — обновляем нужное поле
-        if exercise == 4:
-            cursor.execute("""
-                UPDATE checks SET exercise_4_date = ? WHERE telegram_id = ?
-            """, (check_date, telegram_id))
-        elif exercise == 7:
-            cursor.execute("""
-                UPDATE checks SET exercise_7_date = ? WHERE telegram_id = ?
-            """, (check_date, telegram_id))
-    else:
-        # Если нет — создаём новую запись
-        if exercise == 4:
-            cursor.execute("""
-                INSERT INTO checks (telegram_id, exercise_4_date, exercise_7_date)
-                VALUES (?, ?, NULL)
-            """, (telegram_id, check_date))
-        elif exercise == 7:
-            cursor.execute("""
-                INSERT INTO checks (telegram_id, exercise_4_date, exercise_7_date)
-                VALUES (?, NULL, ?)
-            """, (telegram_id, check_date))
+    with conn:
+        # Сначала проверяем есть ли пользователь
+        existing = conn.execute(
+            "SELECT telegram_id FROM checks WHERE telegram_id = ?", (telegram_id,)
+        ).fetchone()
+        
+        if existing:
+            # Если есть — обновляем нужное поле
+            if exercise == 4:
+                conn.execute("""
+                    UPDATE checks SET exercise_4_date = ?, ex4_expires = ?, ex4_day = ? WHERE telegram_id = ?
+                """, (check_date, expires, check_day, telegram_id))
+            elif exercise == 7:
+                conn.execute("""
+                    UPDATE checks SET exercise_7_date = ?, ex7_expires = ?, ex7_day = ? WHERE telegram_id = ?
+                """, (check_date, expires, check_day, telegram_id))
+        else:
+            # Если нет — создаём новую запись
+            if exercise == 4:
+                conn.execute("""
+                    INSERT INTO checks (telegram_id, exercise_4_date, exercise_7_date, ex4_expires, ex4_day)
+                    VALUES (?, ?, NULL, ?, ?)
+                """, (telegram_id, check_date, expires, check_day))
+            elif exercise == 7:
+                conn.execute("""
+                    INSERT INTO checks (telegram_id, exercise_4_date, exercise_7_date, ex7_expires, ex7_day)
+                    VALUES (?, NULL, ?, ?, ?)
+                """, (telegram_id, check_date, expires, check_day))
     
-    conn.commit()
-    conn.close()
     return True
 
 def check_exercise_status(check_date: str, valid_months: int) -> dict:
@@ -233,43 +547,671 @@ def check_exercise_status(check_date: str, valid_months: int) -> dict:
 
 def add_vacation(telegram_id: int, start_date: str, end_date: str) -> bool:
     """Добавляет или обновляет отпуск"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    add_vacation_days(telegram_id, to_day(start_date), to_day(end_date))
+    return True
+
+def add_vacation_days(telegram_id: int, start_day: int, end_day: int) -> int:
+    """Добавляет или обновляет отпуск по номерам дней. Возвращает длину отпуска в днях"""
+    conn = get_connection()
     
-    start = datetime.strptime(start_date, "%Y-%m-%d")
-    end = datetime.strptime(end_date, "%Y-%m-%d")
-    days = (end - start).days + 1
+    days = end_day - start_day + 1
+    next_due = end_day + VACATION_PERIOD_DAYS
     
-    cursor.execute("""
-        INSERT OR REPLACE INTO vacation (telegram_id, start_date, end_date, days)
-        VALUES (?, ?, ?, ?)
-    """, (telegram_id, start_date, end_date, days))
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO vacation (telegram_id, start_date, end_date, days, next_due, start_day, end_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (telegram_id, from_day(start_day), from_day(end_day), days, next_due, start_day, end_day))
     
-    conn.commit()
-    conn.close()
-    return True
+    return days
 
 def get_vacation(telegram_id: int) -> Optional[Tuple]:
     """Получает данные об отпуске пользователя"""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM vacation WHERE telegram_id = ?", (telegram_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    cursor = get_connection().execute("SELECT * FROM vacation WHERE telegram_id = ?", (telegram_id,))
+    return cursor.fetchone()
 
 def check_vacation_status(end_date: str) -> dict:
     """Проверяет статус отпуска"""
     end = datetime.strptime(end_date, "%Y-%m-%d")
     today = datetime.now()
     days_passed = (today - end).days
-    days_until_year = 365 - days_passed
+    days_until_year = VACATION_PERIOD_DAYS - days_passed
     
     return {
         "days_passed": days_passed,
         "days_until_next": days_until_year,
-        "expired": days_passed >= 365,
+        "expired": days_passed >= VACATION_PERIOD_DAYS,
         "remind_30": 0 < days_until_year <= 30,
         "remind_15": 0 < days_until_year <= 15,
         "remind_7": 0 < days_until_year <= 7,
     }
+
+# ==================== ИМПОРТ СПИСКА ====================
+
+def import_roster(rows: Sequence[Tuple]) -> int:
+    """Записывает пачку строк списка одной транзакцией. Возвращает число строк.
+
+    Строка — (telegram_id, фамилия, имя, отчество, звание, ВЛК, УМО, упр. 4,
+    упр. 7, начало отпуска, конец отпуска); даты ГГГГ-ММ-ДД или None.
+    Анкета перезаписывается целиком; ВЛК/УМО и отпуск — если дата есть,
+    упражнения — каждое по отдельности, как в add_check.
+    """
+    users, medical, checks, vacation = [], [], [], []
+    for telegram_id, surname, name, patronymic, rank, vlk_date, umo_date, ex4_date, ex7_date, \
+            vacation_start, vacation_end in rows:
+        users.append((telegram_id, surname, name, patronymic, rank))
+
+        if vlk_date:
+            vlk_day = to_day(vlk_date)
+            umo_due = vlk_day + UMO_DEADLINE_DAYS if not umo_date else None
+            medical.append((telegram_id, vlk_date, umo_date, vlk_day + VLK_VALID_DAYS, umo_due,
+                            vlk_day, to_day(umo_date)))
+
+        if ex4_date or ex7_date:
+            ex4_day, ex7_day = to_day(ex4_date), to_day(ex7_date)
+            checks.append((
+                telegram_id, ex4_date, ex7_date,
+                ex4_day + EXERCISE_VALID_MONTHS[4] * 30 if ex4_day is not None else None,
+                ex7_day + EXERCISE_VALID_MONTHS[7] * 30 if ex7_day is not None else None,
+                ex4_day, ex7_day,
+            ))
+
+        if vacation_start:
+            start_day, end_day = to_day(vacation_start), to_day(vacation_end)
+            vacation.append((telegram_id, vacation_start, vacation_end, end_day - start_day + 1,
+                             end_day + VACATION_PERIOD_DAYS, start_day, end_day))
+
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO users (telegram_id, surname, name, patronymic, rank) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET
+                surname = excluded.surname, name = excluded.name,
+                patronymic = excluded.patronymic, rank = excluded.rank
+        """, users)
+        conn.executemany("""
+            INSERT OR REPLACE INTO medical (telegram_id, vlk_date, umo_date, vlk_expires, umo_due, vlk_day, umo_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, medical)
+        # Упражнение, которого нет в файле, остаётся прежним
+        conn.executemany("""
+            INSERT INTO checks (telegram_id, exercise_4_date, exercise_7_date, ex4_expires, ex7_expires, ex4_day, ex7_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(telegram_id) DO UPDATE SET
+                exercise_4_date = COALESCE(excluded.exercise_4_date, exercise_4_date),
+                ex4_expires = COALESCE(excluded.ex4_expires, ex4_expires),
+                ex4_day = COALESCE(excluded.ex4_day, ex4_day),
+                exercise_7_date = COALESCE(excluded.exercise_7_date, exercise_7_date),
+                ex7_expires = COALESCE(excluded.ex7_expires, ex7_expires),
+                ex7_day = COALESCE(excluded.ex7_day, ex7_day)
+        """, checks)
+        conn.executemany("""
+            INSERT OR REPLACE INTO vacation (telegram_id, start_date, end_date, days, next_due, start_day, end_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, vacation)
+    return len(users)
+
+# ==================== ПАКЕТНАЯ ПРОВЕРКА СРОКОВ ====================
+# Те же проверки, что check_*_status, но сразу для столбца дат (номера дней
+# от 1970-01-01) и с одним «сегодня» на весь столбец: без strptime и
+# datetime.now() на каждую дату. Результат — список словарей с теми же
+# ключами (None там, где даты нет).
+
+def _day_values(rows: Sequence, day_key: str, text_key: str) -> List[Optional[int]]:
+    """Столбец номеров дней из строк снимка; строки, до которых ещё не дошло
+    фоновое заполнение, разбираются из текста"""
+    epoch = _EPOCH.toordinal()
+    return [
+        row[day_key] if row[day_key] is not None
+        else date.fromisoformat(row[text_key]).toordinal() - epoch if row[text_key]
+        else None
+        for row in rows
+    ]
+
+@functools.lru_cache(maxsize=4096)
+def _format_day(day: int) -> str:
+    """Номер дня -> ДД.ММ.ГГГГ (даты в базе часто повторяются)"""
+    return (_EPOCH + timedelta(days=day)).strftime("%d.%m.%Y")
+
+def batch_vlk_status(vlk_days: Sequence[Optional[int]], today: int = None) -> List[Optional[dict]]:
+    """check_vlk_status для столбца дат ВЛК"""
+    today = today_day() if today is None else today
+    passed = [today - d if d is not None else None for d in vlk_days]
+    return [
+        None if p is None else {
+            "days_passed": p,
+            "days_remaining": VLK_VALID_DAYS - p,
+            "umo_needed": p >= UMO_DEADLINE_DAYS,
+            "vlk_expired": p >= VLK_VALID_DAYS,
+            "remind_30": 0 < VLK_VALID_DAYS - p <= 30,
+            "remind_15": 0 < VLK_VALID_DAYS - p <= 15,
+            "remind_7": 0 < VLK_VALID_DAYS - p <= 7,
+        }
+        for p in passed
+    ]
+
+def batch_exercise_status(check_days: Sequence[Optional[int]], valid_months: int,
+                          today: int = None) -> List[Optional[dict]]:
+    """check_exercise_status для столбца дат проверок"""
+    today = today_day() if today is None else today
+    valid_days = valid_months * 30
+    # check_exercise_status считает от datetime.now() с временем суток,
+    # поэтому целых дней до срока на один меньше разницы дат
+    remaining = [d + valid_days - today - 1 if d is not None else None for d in check_days]
+    return [
+        None if r is None else {
+            "days_remaining": r,
+            "expired": r < 0,
+            "valid_until": _format_day(d + valid_days),
+        }
+        for d, r in zip(check_days, remaining)
+    ]
+
+def batch_vacation_status(end_days: Sequence[Optional[int]], today: int = None) -> List[Optional[dict]]:
+    """check_vacation_status для столбца дат окончания отпуска"""
+    today = today_day() if today is None else today
+    passed = [today - d if d is not None else None for d in end_days]
+    return [
+        None if p is None else {
+            "days_passed": p,
+            "days_until_next": VACATION_PERIOD_DAYS - p,
+            "expired": p >= VACATION_PERIOD_DAYS,
+            "remind_30": 0 < VACATION_PERIOD_DAYS - p <= 30,
+            "remind_15": 0 < VACATION_PERIOD_DAYS - p <= 15,
+            "remind_7": 0 < VACATION_PERIOD_DAYS - p <= 7,
+        }
+        for p in passed
+    ]
+
+def batch_row_statuses(rows: Sequence, today: int = None) -> List[dict]:
+    """Статусы ВЛК, упражнений и отпуска для пачки строк снимка.
+
+    Возвращает по словарю на строку: {"vlk": ..., "ex4": ..., "ex7": ..., "vacation": ...}
+    """
+    today = today_day() if today is None else today
+    vlk = batch_vlk_status(_day_values(rows, 'vlk_day', 'vlk_date'), today)
+    ex4 = batch_exercise_status(_day_values(rows, 'ex4_day', 'exercise_4_date'),
+                                EXERCISE_VALID_MONTHS[4], today)
+    ex7 = batch_exercise_status(_day_values(rows, 'ex7_day', 'exercise_7_date'),
+                                EXERCISE_VALID_MONTHS[7], today)
+    vacation = batch_vacation_status(_day_values(rows, 'vacation_end_day', 'vacation_end'), today)
+    return [
+        {"vlk": v, "ex4": e4, "ex7": e7, "vacation": vac}
+        for v, e4, e7, vac in zip(vlk, ex4, ex7, vacation)
+    ]
+
+# ==================== СНИМОК ДЛЯ РАССЫЛКИ ====================
+
+SNAPSHOT_QUERY = """
+    SELECT u.telegram_id, u.surname, u.name, u.patronymic, u.rank,
+           m.vlk_date, m.umo_date,
+           c.exercise_4_date, c.exercise_7_date,
+           v.start_date AS vacation_start, v.end_date AS vacation_end, v.days AS vacation_days,
+           m.vlk_day, c.ex4_day, c.ex7_day, v.end_day AS vacation_end_day
+    FROM users u
+    LEFT JOIN medical m ON m.telegram_id = u.telegram_id
+    LEFT JOIN checks c ON c.telegram_id = u.telegram_id
+    LEFT JOIN vacation v ON v.telegram_id = u.telegram_id
+"""
+
+# Пользователи, у которых хотя бы один срок попадает в окно напоминаний.
+# Каждая ветка UNION — диапазонный поиск по своему индексу, поэтому стоимость
+# зависит от числа «должников», а не от размера базы.
+DUE_QUERY = """
+    WITH due AS (
+        SELECT telegram_id FROM medical WHERE vlk_expires <= :horizon
+        UNION SELECT telegram_id FROM medical WHERE umo_due <= :horizon
+        UNION SELECT telegram_id FROM checks WHERE ex4_expires <= :horizon
+        UNION SELECT telegram_id FROM checks WHERE ex7_expires <= :horizon
+        UNION SELECT telegram_id FROM vacation WHERE next_due <= :horizon
+    )
+""" + SNAPSHOT_QUERY.replace("FROM users u", "FROM due JOIN users u ON u.telegram_id = due.telegram_id")
+
+def _iter_rows(query: str, params, chunk_size: int) -> Iterator[List[sqlite3.Row]]:
+    """Выполняет запрос и отдаёт строки пачками по chunk_size"""
+    # Отдельное соединение: курсор живёт между вызовами из разных потоков пула
+    conn = _connect()
+    try:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def iter_snapshot(chunk_size: int = 500) -> Iterator[List[sqlite3.Row]]:
+    """Отдаёт пачками пользователей вместе с ВЛК, КБП и отпуском — одним запросом"""
+    return _iter_rows(SNAPSHOT_QUERY + " ORDER BY u.telegram_id", (), chunk_size)
+
+def iter_due_snapshot(horizon_days: int = REMINDER_HORIZON_DAYS, chunk_size: int = 500,
+                      shard: int = None) -> Iterator[List[sqlite3.Row]]:
+    """Как iter_snapshot, но только пользователи со сроками в окне напоминаний
+    (и, если задан shard, только из этого шарда)"""
+    params = {"horizon": today_day() + horizon_days}
+    query = DUE_QUERY
+    if shard is not None:
+        query += " WHERE u.telegram_id % :shards = :shard"
+        params.update(shards=SHARD_COUNT, shard=shard)
+    return _iter_rows(query + " ORDER BY u.telegram_id", params, chunk_size)
+
+def get_snapshot_page(cursor_id: int = 0, limit: int = 10, backward: bool = False) -> Tuple[List[sqlite3.Row], bool]:
+    """Страница снимка по ключу telegram_id (keyset-пагинация).
+
+    Вперёд — строки с telegram_id > cursor_id, назад — с telegram_id < cursor_id.
+    Возвращает строки по возрастанию telegram_id и признак, есть ли ещё
+    строки дальше в том же направлении.
+    """
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    if backward:
+        cursor.execute(SNAPSHOT_QUERY + " WHERE u.telegram_id < ? ORDER BY u.telegram_id DESC LIMIT ?",
+                       (cursor_id, limit + 1))
+    else:
+        cursor.execute(SNAPSHOT_QUERY + " WHERE u.telegram_id > ? ORDER BY u.telegram_id LIMIT ?",
+                       (cursor_id, limit + 1))
+    rows = cursor.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    return rows, has_more
+
+def iter_snapshot_rows(telegram_ids: List[int], chunk_size: int = 500) -> Iterator[List[sqlite3.Row]]:
+    """Строки снимка для заданных пользователей, пачками по chunk_size"""
+    for i in range(0, len(telegram_ids), chunk_size):
+        chunk = telegram_ids[i:i + chunk_size]
+        cursor = get_connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(
+            SNAPSHOT_QUERY + f" WHERE u.telegram_id IN ({placeholders}) ORDER BY u.telegram_id", chunk
+        )
+        yield cursor.fetchall()
+
+# ==================== СРОКИ ПО КАТЕГОРИЯМ (/due) ====================
+
+# Категория -> (таблица, столбец срока). Порядок задаёт номер позиции (item)
+# при равных сроках. Истекло, если срок <= сегодня — так же, как в batch_*_status
+DUE_CATEGORIES = {
+    "vlk": ("medical", "vlk_expires"),
+    "umo": ("medical", "umo_due"),
+    "ex4": ("checks", "ex4_expires"),
+    "ex7": ("checks", "ex7_expires"),
+    "vacation": ("vacation", "next_due"),
+}
+
+def get_due_page(categories: Sequence[str], horizon_days: Optional[int], rank: str = None,
+                 cursor: Tuple[int, int, int] = None, limit: int = 10, backward: bool = False,
+                 today: int = None) -> Tuple[List[sqlite3.Row], bool]:
+    """Страница позиций со сроками: истёкшие (horizon_days=None) или истёкшие и
+    наступающие в ближайшие horizon_days дней, по возрастанию срока.
+
+    Позиция — пользователь и категория: строка снимка плюс item (номер
+    категории в DUE_CATEGORIES) и due_day (срок). Ключ пагинации —
+    (due_day, telegram_id, item): вперёд — позиции после cursor, назад — до него.
+    Каждая категория — диапазон по своему индексу срока с LIMIT, поэтому
+    стоимость страницы не зависит от размера базы.
+    Возвращает позиции по возрастанию ключа и признак, есть ли ещё дальше.
+    """
+    today = today_day() if today is None else today
+    order = "DESC" if backward else ""
+    compare = "<=" if backward else ">="
+    if cursor is None:
+        cursor = (-_NEVER, 0, -1)
+
+    branches = []
+    params = {"limit": limit + 1, "rank": rank, "due": cursor[0], "id": cursor[1], "item": cursor[2]}
+    for item, category in enumerate(DUE_CATEGORIES):
+        if category not in categories:
+            continue
+        table, column = DUE_CATEGORIES[category]
+        params[f"bound_{item}"] = today + (horizon_days or 0)
+        rank_join = "JOIN users r ON r.telegram_id = t.telegram_id AND r.rank = :rank" if rank else ""
+        # Позиции с тем же (срок, telegram_id), что у курсора, отсекаются снаружи по item
+        branches.append(f"""
+            SELECT * FROM (
+                SELECT t.telegram_id, {item} AS item, t.{column} AS due_day FROM {table} t {rank_join}
+                WHERE t.{column} <= :bound_{item} AND (t.{column}, t.telegram_id) {compare} (:due, :id)
+                ORDER BY t.{column} {order}, t.telegram_id {order} LIMIT :limit + 1
+            )""")
+    if not branches:
+        return [], False
+
+    compare = "<" if backward else ">"
+    query = f"""
+        WITH picked AS (
+            SELECT * FROM ({" UNION ALL ".join(branches)})
+            WHERE (due_day, telegram_id, item) {compare} (:due, :id, :item)
+            ORDER BY due_day {order}, telegram_id {order}, item {order} LIMIT :limit
+        )
+    """ + SNAPSHOT_QUERY.replace(
+        "SELECT u.telegram_id", "SELECT picked.item, picked.due_day, u.telegram_id", 1
+    ).replace(
+        "FROM users u", "FROM picked JOIN users u ON u.telegram_id = picked.telegram_id", 1
+    ) + f" ORDER BY picked.due_day {order}, picked.telegram_id {order}, picked.item {order}"
+
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    rows = cursor.execute(query, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    return rows, has_more
+
+def get_ranks() -> List[str]:
+    """Все звания, что есть в базе"""
+    cursor = get_connection().execute("SELECT DISTINCT rank FROM users WHERE rank IS NOT NULL ORDER BY rank")
+    return [row[0] for row in cursor.fetchall()]
+
+# ==================== ПОИСК ====================
+
+# Строки снимка для найденных по users_fts; :query — выражение FTS5
+SEARCH_QUERY = """
+    WITH found AS (
+        SELECT rowid AS telegram_id FROM users_fts WHERE users_fts MATCH :query LIMIT :limit
+    )
+""" + SNAPSHOT_QUERY.replace("FROM users u", "FROM found JOIN users u ON u.telegram_id = found.telegram_id")
+
+def search_users(terms: Sequence[str], limit: int) -> Tuple[List[sqlite3.Row], bool]:
+    """Пользователи, у которых каждое из terms (не короче 3 символов) входит
+    в фамилию, имя, отчество или звание. Не больше limit строк снимка;
+    второй элемент — True, если найдены все совпадения"""
+    # Каждое слово — отдельная фраза в кавычках: спецсимволы FTS5 не работают
+    query = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row
+    rows = cursor.execute(SEARCH_QUERY, {"query": query, "limit": limit + 1}).fetchall()
+    return rows[:limit], len(rows) <= limit
+
+# ==================== НАЧАЛО НАПОМИНАНИЙ ====================
+
+# Первый день, когда по пользователю может прийти напоминание:
+# минимум по всем срокам за вычетом окна напоминаний
+_NEVER = 10 ** 9
+REMINDER_START_QUERY = f"""
+    SELECT u.telegram_id, MIN(
+        COALESCE(m.vlk_expires - 30, {_NEVER}),
+        COALESCE(m.umo_due, {_NEVER}),
+        COALESCE(c.ex4_expires - {REMINDER_HORIZON_DAYS}, {_NEVER}),
+        COALESCE(c.ex7_expires - {REMINDER_HORIZON_DAYS}, {_NEVER}),
+        COALESCE(v.next_due - 30, {_NEVER})
+    ) AS start_day
+    FROM users u
+    LEFT JOIN medical m ON m.telegram_id = u.telegram_id
+    LEFT JOIN checks c ON c.telegram_id = u.telegram_id
+    LEFT JOIN vacation v ON v.telegram_id = u.telegram_id
+"""
+
+def get_reminder_starts(telegram_ids: List[int] = None) -> List[Tuple[int, Optional[int]]]:
+    """(telegram_id, первый день напоминаний) — по всем пользователям одним запросом
+    или по заданным. None — у пользователя нет ни одной даты или его нет в базе."""
+    conn = get_connection()
+    if telegram_ids is None:
+        rows = conn.execute(REMINDER_START_QUERY).fetchall()
+    else:
+        rows = []
+        for i in range(0, len(telegram_ids), 500):
+            chunk = telegram_ids[i:i + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            rows += conn.execute(REMINDER_START_QUERY + f" WHERE u.telegram_id IN ({placeholders})", chunk).fetchall()
+        found = {row[0] for row in rows}
+        rows += [(telegram_id, None) for telegram_id in telegram_ids if telegram_id not in found]
+    return [(telegram_id, start if start != _NEVER else None) for telegram_id, start in rows]
+
+# ==================== ЖУРНАЛ НАПОМИНАНИЙ ====================
+
+# Сколько дней хранить журнал отправленных напоминаний
+LEDGER_KEEP_DAYS = 30
+
+# Число шардов прогона (по telegram_id % SHARD_COUNT); одинаковое во всех процессах
+SHARD_COUNT = int(os.getenv('REMINDER_SHARDS', 8))
+
+# Псевдо-шард сводки для админа: выдаётся, когда все обычные шарды готовы
+DIGEST_SHARD = -1
+
+def start_reminder_run(run_day: int) -> bool:
+    """Открывает прогон за день и его шарды. Возвращает True, если прогон уже завершён"""
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO reminder_runs (run_day) VALUES (?)", (run_day,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO shard_leases (run_day, shard) VALUES (?, ?)",
+            [(run_day, shard) for shard in [*range(SHARD_COUNT), DIGEST_SHARD]]
+        )
+        finished_at = conn.execute(
+            "SELECT finished_at FROM reminder_runs WHERE run_day = ?", (run_day,)
+        ).fetchone()[0]
+    return finished_at is not None
+
+def get_reminder_run(run_day: int) -> Optional[Tuple]:
+    """Прогон за день: (run_day, started_at, finished_at)"""
+    cursor = get_connection().execute(
+        "SELECT run_day, started_at, finished_at FROM reminder_runs WHERE run_day = ?", (run_day,)
+    )
+    return cursor.fetchone()
+
+def claim_shard(run_day: int, owner: str, lease_seconds: float, now: float = None) -> Optional[Tuple[int, int]]:
+    """Берёт в аренду свободный (или просроченный) шард.
+
+    Возвращает (шард, точка продолжения) или None, если брать нечего.
+    Шард сводки DIGEST_SHARD выдаётся только после завершения всех обычных.
+    """
+    now = now if now is not None else datetime.now().timestamp()
+    conn = get_connection()
+    with conn:
+        # Сразу берём блокировку записи, чтобы два процесса не взяли один шард
+        conn.execute("BEGIN IMMEDIATE")
+        free = """
+            SELECT shard, last_telegram_id FROM shard_leases
+            WHERE run_day = ? AND done = 0 AND (owner IS NULL OR expires_at < ?)
+        """
+        row = conn.execute(free + " AND shard >= 0 ORDER BY shard LIMIT 1", (run_day, now)).fetchone()
+        if row is None:
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM shard_leases WHERE run_day = ? AND shard >= 0 AND done = 0", (run_day,)
+            ).fetchone()[0]
+            if remaining == 0:
+                row = conn.execute(free + " AND shard = ?", (run_day, now, DIGEST_SHARD)).fetchone()
+        if row is None:
+            return None
+        conn.execute("""
+            UPDATE shard_leases SET owner = ?, expires_at = ? WHERE run_day = ? AND shard = ?
+        """, (owner, now + lease_seconds, run_day, row[0]))
+    return row[0], row[1]
+
+def next_shard_expiry(run_day: int) -> Optional[float]:
+    """Когда истекает ближайшая аренда незавершённого шарда (0 — арендованных нет).
+    None — все шарды прогона, включая сводку, готовы"""
+    remaining, expires_at = get_connection().execute("""
+        SELECT COUNT(*), MIN(expires_at) FROM shard_leases WHERE run_day = ? AND done = 0
+    """, (run_day,)).fetchone()
+    return (expires_at or 0.0) if remaining else None
+
+def renew_shard(run_day: int, shard: int, owner: str, lease_seconds: float, now: float = None) -> bool:
+    """Продлевает аренду. False — аренду уже перехватил другой процесс"""
+    now = now if now is not None else datetime.now().timestamp()
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("""
+            UPDATE shard_leases SET expires_at = ?
+            WHERE run_day = ? AND shard = ? AND owner = ? AND done = 0
+        """, (now + lease_seconds, run_day, shard, owner))
+    return cursor.rowcount == 1
+
+def complete_shard(run_day: int, shard: int, owner: str) -> bool:
+    """Отмечает шард готовым. Готовый шард сводки завершает весь прогон"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("""
+            UPDATE shard_leases SET done = 1 WHERE run_day = ? AND shard = ? AND owner = ?
+        """, (run_day, shard, owner))
+        if cursor.rowcount != 1:
+            return False
+        if shard == DIGEST_SHARD:
+            conn.execute("UPDATE reminder_runs SET finished_at = CURRENT_TIMESTAMP WHERE run_day = ?", (run_day,))
+            conn.execute("DELETE FROM sent_reminders WHERE sent_on < ?", (run_day - LEDGER_KEEP_DAYS,))
+            conn.execute("DELETE FROM shard_leases WHERE run_day < ?", (run_day - LEDGER_KEEP_DAYS,))
+            conn.execute("DELETE FROM reminder_runs WHERE run_day < ?", (run_day - LEDGER_KEEP_DAYS,))
+    return True
+
+def get_sent_reminders(run_day: int, telegram_ids: List[int]) -> set:
+    """Уже отправленные за день напоминания: множество (telegram_id, item, threshold)"""
+    conn = get_connection()
+    sent = set()
+    for i in range(0, len(telegram_ids), 500):
+        chunk = telegram_ids[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        sent.update(conn.execute(f"""
+            SELECT telegram_id, item, threshold FROM sent_reminders
+            WHERE sent_on = ? AND telegram_id IN ({placeholders})
+        """, (run_day, *chunk)).fetchall())
+    return sent
+
+def record_sent_reminders(run_day: int, entries: List[Tuple[int, str, str]],
+                          shard: int = None, last_telegram_id: int = None) -> bool:
+    """Записывает отправленные напоминания и (если задано) сдвигает точку продолжения шарда"""
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO sent_reminders (telegram_id, item, threshold, sent_on)
+            VALUES (?, ?, ?, ?)
+        """, [(telegram_id, item, threshold, run_day) for telegram_id, item, threshold in entries])
+        if shard is not None and last_telegram_id is not None:
+            conn.execute("""
+                UPDATE shard_leases SET last_telegram_id = MAX(last_telegram_id, ?)
+                WHERE run_day = ? AND shard = ?
+            """, (last_telegram_id, run_day, shard))
+    return True
+
+# ==================== ВЕДУЩИЙ ПРОЦЕСС ====================
+
+def acquire_leadership(name: str, owner: str, lease_seconds: float, now: float = None) -> bool:
+    """Берёт или продлевает аренду роли name. False — роль у другого живого процесса"""
+    now = now if now is not None else datetime.now().timestamp()
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT owner, expires_at FROM leader_leases WHERE name = ?", (name,)).fetchone()
+        if row is not None and row[0] != owner and row[1] >= now:
+            return False
+        conn.execute("""
+            INSERT OR REPLACE INTO leader_leases (name, owner, expires_at) VALUES (?, ?, ?)
+        """, (name, owner, now + lease_seconds))
+    return True
+
+def release_leadership(name: str, owner: str) -> bool:
+    """Отдаёт роль, чтобы другой процесс подхватил её сразу, не дожидаясь истечения аренды"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("DELETE FROM leader_leases WHERE name = ? AND owner = ?", (name, owner))
+    return cursor.rowcount == 1
+
+# ==================== ЛЕНТА ИЗМЕНЕНИЙ ====================
+
+# Сколько хранить ленту изменений (секунд)
+CHANGES_KEEP_SECONDS = 24 * 60 * 60
+
+def get_last_change_seq() -> int:
+    """Номер последней записи ленты изменений"""
+    row = get_connection().execute("SELECT MAX(seq) FROM user_changes").fetchone()
+    return row[0] or 0
+
+def get_user_changes(after_seq: int, limit: int = 1000) -> List[Tuple[int, int]]:
+    """(seq, telegram_id) изменений после after_seq"""
+    cursor = get_connection().execute(
+        "SELECT seq, telegram_id FROM user_changes WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+    )
+    return cursor.fetchall()
+
+def prune_user_changes(keep_seconds: float = CHANGES_KEEP_SECONDS) -> int:
+    """Удаляет старые записи ленты. Возвращает число удалённых"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            "DELETE FROM user_changes WHERE changed_at < ?", (datetime.now().timestamp() - keep_seconds,)
+        )
+    return cursor.rowcount
+
+# ==================== МЕНЮ НА МЕСТЕ ====================
+
+# Сообщения старше 48 часов Telegram всё равно не даёт редактировать
+MENU_RENDER_KEEP_SECONDS = 48 * 60 * 60
+
+def get_menu_render(chat_id: int, message_id: int) -> Optional[str]:
+    """Хэш последнего показанного в сообщении меню"""
+    row = get_connection().execute(
+        "SELECT digest FROM menu_renders WHERE chat_id = ? AND message_id = ?", (chat_id, message_id)
+    ).fetchone()
+    return row[0] if row else None
+
+def save_menu_render(chat_id: int, message_id: int, digest: str) -> bool:
+    """Запоминает хэш меню и удаляет записи о сообщениях, которые уже нельзя редактировать"""
+    now = datetime.now().timestamp()
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            INSERT INTO menu_renders (chat_id, message_id, digest, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(chat_id, message_id) DO UPDATE SET
+                digest = excluded.digest, updated_at = excluded.updated_at
+        """, (chat_id, message_id, digest, now))
+        conn.execute("DELETE FROM menu_renders WHERE updated_at < ?", (now - MENU_RENDER_KEEP_SECONDS,))
+    return True
+
+# ==================== СОСТОЯНИЯ FSM ====================
+
+def get_fsm_record(key: str, not_before: float) -> Optional[Tuple[Optional[str], str]]:
+    """(state, data в JSON) по ключу, если запись обновлялась не раньше not_before"""
+    cursor = get_connection().execute(
+        "SELECT state, data FROM fsm_states WHERE key = ? AND updated_at >= ?", (key, not_before)
+    )
+    return cursor.fetchone()
+
+def get_fsm_state_keys(not_before: float) -> List[str]:
+    """Ключи записей с незаконченной анкетой (state задан), обновлявшихся не раньше not_before"""
+    cursor = get_connection().execute(
+        "SELECT key FROM fsm_states WHERE state IS NOT NULL AND updated_at >= ?", (not_before,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+def has_fsm_state(key_prefix: str, not_before: float) -> bool:
+    """Есть ли незаконченная анкета среди записей с ключом на key_prefix (оканчивается на ':')"""
+    # Диапазон по первичному ключу: ';' идёт сразу за ':'
+    row = get_connection().execute(
+        "SELECT 1 FROM fsm_states WHERE key >= ? AND key < ? AND state IS NOT NULL AND updated_at >= ? LIMIT 1",
+        (key_prefix, key_prefix[:-1] + ";", not_before)
+    ).fetchone()
+    return row is not None
+
+def save_fsm_records(records: List[Tuple[str, bool, Optional[str], bool, str]], updated_at: float) -> bool:
+    """Записывает пачку изменений одной транзакцией.
+
+    records — (key, менять ли state, state, менять ли data, data в JSON).
+    Пустые записи (нет состояния и данных) удаляются.
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state = CASE WHEN ? THEN excluded.state ELSE state END,
+                data = CASE WHEN ? THEN excluded.data ELSE data END,
+                updated_at = excluded.updated_at
+        """, [(key, state, data, updated_at, set_state, set_data)
+              for key, set_state, state, set_data, data in records])
+        conn.executemany(
+            "DELETE FROM fsm_states WHERE key = ? AND state IS NULL AND data = '{}'",
+            [(record[0],) for record in records]
+        )
+    return True
+
+def evict_fsm_records(older_than: float) -> int:
+    """Удаляет состояния, не менявшиеся с older_than. Возвращает число удалённых"""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (older_than,))
+    return cursor.rowcount
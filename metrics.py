@@ -0,0 +1,185 @@
+"""Метрики в текстовом формате Prometheus: GET /metrics.
+
+Счётчики и гистограммы живут в памяти процесса и обновляются только из
+event loop, поэтому блокировки не нужны. Гистограмма хранит заранее
+выделенный список корзин на каждый набор меток: наблюдение — это bisect и
+два сложения, без новых объектов. Текст собирается только при запросе
+/metrics. Готовые счётчики модулей (кэш, меню, очередь, фильтр)
+подключаются через add_stats и читаются в момент запроса.
+
+При нескольких воркерах gunicorn у каждого свои метрики: запрос
+/metrics попадает в один из них (метка pid в bot_process_info).
+"""
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from aiogram.dispatcher.event.bases import CancelHandler, SkipHandler
+from aiohttp import web
+
+from callback_router import CallbackRoutes
+
+# Корзины по умолчанию, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+RUN_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+_metrics: List["_Metric"] = []
+_stats: List[Tuple[str, str, Callable[[], Dict[str, Any]]]] = []
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._children: Dict[tuple, Any] = {}
+        _metrics.append(self)
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        self._render_samples(lines)
+
+class Counter(_Metric):
+    """Монотонный счётчик; значения меток передаются позиционно"""
+    kind = "counter"
+
+    def inc(self, *values: Any, amount: float = 1):
+        self._children[values] = self._children.get(values, 0) + amount
+
+    def _render_samples(self, lines: List[str]):
+        for values, count in self._children.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {count}")
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *values: Any):
+        child = self._children.get(values)
+        if child is None:
+            # [счётчики по корзинам (последняя — +Inf), сумма]
+            child = self._children[values] = [[0] * (len(self.buckets) + 1), 0.0]
+        child[0][bisect_left(self.buckets, value)] += 1
+        child[1] += value
+
+    def _render_samples(self, lines: List[str]):
+        for values, (counts, total) in self._children.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}")
+
+def add_stats(prefix: str, help: str, func: Callable[[], Dict[str, Any]]):
+    """Отдаёт числовые поля func() как gauge prefix_<поле> при каждом запросе /metrics"""
+    _stats.append((prefix, help, func))
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = [
+        "# HELP bot_process_info Процесс, ответивший на запрос",
+        "# TYPE bot_process_info gauge",
+        f'bot_process_info{{pid="{os.getpid()}"}} 1',
+    ]
+    for metric in _metrics:
+        metric.render(lines)
+    for prefix, help, func in _stats:
+        for key, value in func().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# HELP {prefix}_{key} {help}")
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+    lines.append("")
+    return "\n".join(lines)
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """GET /metrics"""
+    return web.Response(
+        body=render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+# ==================== МЕТРИКИ БОТА ====================
+
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время обработчика команды, шага анкеты или кнопки", ("event", "handler"))
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ("event", "handler", "error"))
+
+DB_SECONDS = Histogram(
+    "bot_db_query_seconds", "Запросы database.py из async_db, включая ожидание потока",
+    ("func", "kind"), buckets=DB_BUCKETS)
+DB_ERRORS = Counter("bot_db_errors_total", "Исключения в запросах database.py", ("func",))
+
+TELEGRAM_SECONDS = Histogram(
+    "bot_telegram_request_seconds", "Исходящие запросы к Bot API", ("method",))
+TELEGRAM_ERRORS = Counter(
+    "bot_telegram_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+
+SCHEDULER_RUN_SECONDS = Histogram(
+    "bot_scheduler_run_seconds", "Длительность прогона напоминаний", buckets=RUN_BUCKETS)
+SCHEDULER_USERS_SCANNED = Counter("bot_scheduler_users_scanned_total", "Пользователей проверено планировщиком")
+SCHEDULER_MESSAGES = Counter(
+    "bot_scheduler_messages_total", "Напоминания по итогу отправки", ("result",))
+
+class HandlerMetricsMiddleware:
+    """Внутренняя middleware aiogram: время и ошибки сработавшего обработчика.
+    Регистрируется на каждый тип событий: dp.message.middleware(HandlerMetricsMiddleware("message"))"""
+
+    def __init__(self, event: str):
+        self.event = event
+
+    async def __call__(self, handler, event, data):
+        kind = self.event
+        callback = data["handler"].callback
+        routes = getattr(callback, "__self__", None)
+        if isinstance(routes, CallbackRoutes):
+            # Все кнопки идут через один dispatch — метка по найденному маршруту
+            route, _ = routes.resolve(event.data or "")
+            name = route[0].__name__ if route else "unrouted"
+        else:
+            name = callback.__name__
+
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except (SkipHandler, CancelHandler):
+            raise
+        except Exception as e:
+            HANDLER_ERRORS.inc(kind, name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, kind, name)
+
+class RequestMetricsMiddleware:
+    """Middleware сессии бота: время и ошибки каждого запроса к Bot API"""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - start, name)
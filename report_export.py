@@ -0,0 +1,161 @@
+"""Выгрузка полного отчёта о готовности одним файлом (команда /export).
+
+Строки снимка читаются пачками (async_db.iter_snapshot), статусы
+считаются по пачке (batch_row_statuses), текст копится в буфере и
+уходит в загрузку кусками по EXPORT_BUFFER_SIZE. ReportFile — это
+InputFile aiogram, чей read() и есть этот генератор: файл не собирается
+в памяти целиком ни в боте, ни в aiohttp, поэтому память не зависит от
+размера списка. При повторе отправки (sender.py) снимок читается заново.
+"""
+import csv
+import html
+import io
+import os
+from datetime import datetime
+from typing import AsyncIterator, List, Tuple
+
+from aiogram.types import InputFile
+
+from async_db import iter_snapshot
+from database import batch_row_statuses
+
+# Сколько текста копить перед отправкой куска, символов
+EXPORT_BUFFER_SIZE = int(os.getenv('EXPORT_BUFFER_SIZE', 64 * 1024))
+
+# Строк снимка на одно чтение из базы
+EXPORT_CHUNK_SIZE = 500
+
+FORMATS = ("csv", "html")
+
+COLUMNS = (
+    "ID", "Фамилия", "Имя", "Отчество", "Звание",
+    "ВЛК", "ВЛК: статус", "ВЛК: осталось дн.", "УМО",
+    "Упр.4", "Упр.4: статус", "Упр.4: осталось дн.",
+    "Упр.7", "Упр.7: статус", "Упр.7: осталось дн.",
+    "Отпуск с", "Отпуск по", "Отпуск, дн.", "Отпуск: статус", "До следующего отпуска, дн.",
+)
+
+# ==================== СТРОКИ ОТЧЁТА ====================
+# Ячейка — (значение, уровень): "bad" — истекло, "warn" — меньше 30 дней
+# или нужно УМО, "ok" — в порядке, "" — нет данных. Уровень нужен только HTML.
+
+def _level(days_remaining: int, expired: bool) -> str:
+    if expired:
+        return "bad"
+    return "warn" if days_remaining <= 30 else "ok"
+
+def _exercise_cells(check_date, status) -> List[Tuple[object, str]]:
+    if not check_date:
+        return [("", ""), ("нет данных", ""), ("", "")]
+    level = _level(status['days_remaining'], status['expired'])
+    return [
+        (check_date, ""),
+        ("ИСТЕКЛО" if status['expired'] else "действует", level),
+        (status['days_remaining'], level),
+    ]
+
+def row_cells(row, statuses: dict) -> List[Tuple[object, str]]:
+    """Ячейки одной строки снимка в порядке COLUMNS"""
+    cells = [
+        (row['telegram_id'], ""), (row['surname'], ""), (row['name'], ""),
+        (row['patronymic'] or "", ""), (row['rank'] or "", ""),
+    ]
+
+    vlk = statuses['vlk']
+    if vlk:
+        if vlk['vlk_expired']:
+            text, level = "ИСТЕКЛА", "bad"
+        elif vlk['umo_needed'] and not row['umo_date']:
+            text, level = "нужно УМО", "warn"
+        else:
+            text, level = "действует", _level(vlk['days_remaining'], False)
+        cells += [(row['vlk_date'], ""), (text, level), (vlk['days_remaining'], level)]
+        if row['umo_date']:
+            cells.append((row['umo_date'], "ok"))
+        else:
+            cells.append(("НЕ ПРОЙДЕНО", "bad") if vlk['umo_needed'] else ("", ""))
+    else:
+        cells += [("", ""), ("нет данных", ""), ("", ""), ("", "")]
+
+    cells += _exercise_cells(row['exercise_4_date'], statuses['ex4'])
+    cells += _exercise_cells(row['exercise_7_date'], statuses['ex7'])
+
+    vacation = statuses['vacation']
+    if vacation:
+        level = _level(vacation['days_until_next'], vacation['expired'])
+        cells += [
+            (row['vacation_start'], ""), (row['vacation_end'], ""), (row['vacation_days'] or 0, ""),
+            ("ИСТЁК" if vacation['expired'] else "действует", level), (vacation['days_until_next'], level),
+        ]
+    else:
+        cells += [("", ""), ("", ""), ("", ""), ("нет данных", ""), ("", "")]
+    return cells
+
+async def iter_report_rows() -> AsyncIterator[List[Tuple[object, str]]]:
+    """Ячейки всех пользователей по порядку telegram_id"""
+    async for rows in iter_snapshot(EXPORT_CHUNK_SIZE):
+        for row, statuses in zip(rows, batch_row_statuses(rows)):
+            yield row_cells(row, statuses)
+
+# ==================== ФОРМАТЫ ====================
+
+async def iter_csv(buffer_size: int = EXPORT_BUFFER_SIZE) -> AsyncIterator[bytes]:
+    """CSV (UTF-8 с BOM и «;», чтобы Excel открыл его без мастера импорта) кусками"""
+    buffer = io.StringIO()
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer, delimiter=";")
+    writer.writerow(COLUMNS)
+    async for cells in iter_report_rows():
+        writer.writerow([value for value, _ in cells])
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; font-size: 13px; }}
+table {{ border-collapse: collapse; }}
+th, td {{ border: 1px solid #ccc; padding: 2px 6px; white-space: nowrap; }}
+th {{ background: #eee; position: sticky; top: 0; }}
+.bad {{ background: #f8c6c6; }} .warn {{ background: #fbe3b5; }} .ok {{ background: #d6f0d0; }}
+</style></head><body>
+<h2>{title}</h2>
+<table><thead><tr>{header}</tr></thead><tbody>
+"""
+HTML_TAIL = "</tbody></table></body></html>\n"
+
+async def iter_html(title: str, buffer_size: int = EXPORT_BUFFER_SIZE) -> AsyncIterator[bytes]:
+    """Самодостаточная HTML-таблица с подсветкой сроков, кусками"""
+    header = "".join(f"<th>{html.escape(column)}</th>" for column in COLUMNS)
+    parts = [HTML_HEAD.format(title=html.escape(title), header=header)]
+    size = len(parts[0])
+    async for cells in iter_report_rows():
+        line = "<tr>" + "".join(
+            f'<td class="{level}">{html.escape(str(value))}</td>' if level
+            else f"<td>{html.escape(str(value))}</td>"
+            for value, level in cells
+        ) + "</tr>\n"
+        parts.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            yield "".join(parts).encode("utf-8")
+            parts, size = [], 0
+    parts.append(HTML_TAIL)
+    yield "".join(parts).encode("utf-8")
+
+class ReportFile(InputFile):
+    """Отчёт как файл для send_document: строится заново при каждом чтении"""
+
+    def __init__(self, fmt: str = "csv", today: datetime = None):
+        today = today or datetime.now()
+        super().__init__(filename=f"readiness_{today.strftime('%Y-%m-%d')}.{fmt}")
+        self.fmt = fmt
+        self.title = f"Готовность на {today.strftime('%d.%m.%Y')}"
+
+    async def read(self, bot) -> AsyncIterator[bytes]:
+        chunks = iter_html(self.title) if self.fmt == "html" else iter_csv()
+        async for chunk in chunks:
+            yield chunk
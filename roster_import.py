@@ -0,0 +1,261 @@
+"""Импорт списка личного состава из CSV или XLSX (команда /import).
+
+Файл читается в потоке двумя проходами. Первый только проверяет его
+целиком: ошибка кодировки или структуры в конце файла отклоняет его до
+того, как в базу попала хоть одна строка. Второй проход пишет: каждая
+строка проверяется и попадает в текущую пачку, ошибочная — в список
+ошибок с номером строки. Пачка из IMPORT_BATCH_SIZE строк пишется одной
+транзакцией (executemany в database.import_roster); между пачками
+проходят обычные записи бота. В памяти держится одна пачка и ошибки.
+
+Первая строка — заголовок, колонки узнаются по именам из COLUMNS в
+любом порядке. Обязательны telegram_id, фамилия и имя. Даты —
+ГГГГ-ММ-ДД или ДД.ММ.ГГГГ, в XLSX можно ячейками-датами.
+"""
+import asyncio
+import csv
+import io
+import os
+import time
+from datetime import date, datetime
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import async_db
+
+# Строк в одной транзакции
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 2000))
+
+# Поле -> допустимые имена колонки (без учёта регистра)
+COLUMNS = {
+    "telegram_id": ("telegram_id", "id", "telegram id"),
+    "surname": ("surname", "фамилия"),
+    "name": ("name", "имя"),
+    "patronymic": ("patronymic", "отчество"),
+    "rank": ("rank", "звание"),
+    "vlk_date": ("vlk_date", "влк"),
+    "umo_date": ("umo_date", "умо"),
+    "exercise_4_date": ("exercise_4_date", "упр4", "упр. 4", "упражнение 4"),
+    "exercise_7_date": ("exercise_7_date", "упр7", "упр. 7", "упражнение 7"),
+    "vacation_start": ("vacation_start", "отпуск с", "начало отпуска"),
+    "vacation_end": ("vacation_end", "отпуск по", "конец отпуска"),
+}
+REQUIRED_COLUMNS = ("telegram_id", "surname", "name")
+
+class RosterRow(NamedTuple):
+    """Строка списка в порядке столбцов database.import_roster"""
+    telegram_id: int
+    surname: str
+    name: str
+    patronymic: Optional[str]
+    rank: Optional[str]
+    vlk_date: Optional[str]
+    umo_date: Optional[str]
+    exercise_4_date: Optional[str]
+    exercise_7_date: Optional[str]
+    vacation_start: Optional[str]
+    vacation_end: Optional[str]
+
+class ImportResult(NamedTuple):
+    """Итог импорта: записано строк, ошибки (номер строки, текст), время, с"""
+    imported: int
+    errors: List[Tuple[int, str]]
+    seconds: float
+
+class RosterFileError(ValueError):
+    """Файл нельзя разобрать целиком: формат, кодировка, нет обязательных колонок"""
+
+class RosterImportError(RuntimeError):
+    """Запись прервалась на середине: imported строк уже в базе"""
+
+    def __init__(self, imported: int, error: Exception):
+        super().__init__(f"записано {imported} строк, затем ошибка: {error}")
+        self.imported = imported
+
+# ==================== ЧТЕНИЕ ФАЙЛА ====================
+
+def _header_map(header) -> Dict[str, int]:
+    """Поле -> номер колонки по строке заголовка"""
+    names = {}
+    for field, aliases in COLUMNS.items():
+        names.update((alias, field) for alias in aliases)
+    positions = {}
+    for index, title in enumerate(header):
+        field = names.get(str(title or "").strip().lower())
+        if field and field not in positions:
+            positions[field] = index
+    missing = [field for field in REQUIRED_COLUMNS if field not in positions]
+    if missing:
+        raise RosterFileError(f"нет обязательных колонок: {', '.join(missing)}")
+    return positions
+
+def _iter_csv(stream: BinaryIO) -> Iterator[Tuple[int, list]]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        header = text.readline()
+        # Excel с русской локалью сохраняет CSV через точку с запятой
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        yield 1, next(csv.reader([header], delimiter=delimiter), [])
+        reader = csv.reader(text, delimiter=delimiter)
+        for values in reader:
+            yield reader.line_num + 1, values
+    except UnicodeDecodeError:
+        raise RosterFileError("CSV должен быть в кодировке UTF-8")
+    finally:
+        text.detach()
+
+def _iter_xlsx(stream: BinaryIO) -> Iterator[Tuple[int, list]]:
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise RosterFileError(f"не удалось открыть XLSX: {e}")
+    try:
+        for line, values in enumerate(workbook.active.iter_rows(values_only=True), 1):
+            yield line, values
+    finally:
+        workbook.close()
+
+def iter_records(stream: BinaryIO, filename: str) -> Iterator[Tuple[int, Dict[str, object]]]:
+    """(номер строки, поле -> значение ячейки) по строкам файла, без заголовка и пустых строк"""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv":
+        rows = _iter_csv(stream)
+    elif extension == ".xlsx":
+        rows = _iter_xlsx(stream)
+    else:
+        raise RosterFileError("поддерживаются только .csv и .xlsx")
+
+    _, header = next(rows, (1, []))
+    positions = _header_map(header)
+    for line, values in rows:
+        if not any(value not in (None, "") for value in values):
+            continue
+        yield line, {field: values[index] if index < len(values) else None
+                     for field, index in positions.items()}
+
+# ==================== ПРОВЕРКА СТРОК ====================
+
+def _text(value) -> Optional[str]:
+    """Ячейка -> строка; пусто и «нет», как в анкете, -> None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value if value and value.lower() != "нет" else None
+
+def _date(value, title: str) -> Optional[str]:
+    """Ячейка -> дата ГГГГ-ММ-ДД"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    value = _text(value)
+    if value is None:
+        return None
+    # Разбор вручную: strptime на десятках тысяч дат заметно медленнее
+    try:
+        if len(value) == 10 and value[4] == value[7] == "-":
+            return date(int(value[:4]), int(value[5:7]), int(value[8:])).isoformat()
+        if len(value) == 10 and value[2] == value[5] == ".":
+            return date(int(value[6:]), int(value[3:5]), int(value[:2])).isoformat()
+    except ValueError:
+        pass
+    raise ValueError(f"{title}: неверная дата «{value}», нужен ГГГГ-ММ-ДД или ДД.ММ.ГГГГ")
+
+def parse_row(values: Dict[str, object]) -> RosterRow:
+    """Проверяет строку файла; ValueError — с текстом для отчёта"""
+    telegram_id = values.get("telegram_id")
+    try:
+        # XLSX отдаёт числа как float
+        if isinstance(telegram_id, float) and telegram_id.is_integer():
+            telegram_id = int(telegram_id)
+        telegram_id = int(str(telegram_id).strip())
+    except ValueError:
+        raise ValueError(f"telegram_id: не число «{telegram_id}»")
+    if telegram_id <= 0:
+        raise ValueError(f"telegram_id: должен быть положительным, а не {telegram_id}")
+
+    surname, name = _text(values.get("surname")), _text(values.get("name"))
+    if not surname or len(surname) < 2:
+        raise ValueError("фамилия слишком короткая")
+    if not name or len(name) < 2:
+        raise ValueError("имя слишком короткое")
+
+    vlk_date = _date(values.get("vlk_date"), "ВЛК")
+    umo_date = _date(values.get("umo_date"), "УМО")
+    if umo_date and not vlk_date:
+        raise ValueError("УМО без даты ВЛК")
+
+    vacation_start = _date(values.get("vacation_start"), "начало отпуска")
+    vacation_end = _date(values.get("vacation_end"), "конец отпуска")
+    if bool(vacation_start) != bool(vacation_end):
+        raise ValueError("у отпуска нужны обе даты")
+    if vacation_start and vacation_start > vacation_end:
+        raise ValueError("отпуск заканчивается раньше, чем начинается")
+
+    return RosterRow(
+        telegram_id, surname, name, _text(values.get("patronymic")), _text(values.get("rank")),
+        vlk_date, umo_date,
+        _date(values.get("exercise_4_date"), "упр. 4"), _date(values.get("exercise_7_date"), "упр. 7"),
+        vacation_start, vacation_end,
+    )
+
+def iter_batches(stream: BinaryIO, filename: str, errors: List[Tuple[int, str]],
+                 batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[List[RosterRow]]:
+    """Пачки проверенных строк; ошибки дописываются в errors"""
+    seen: Dict[int, int] = {}
+    batch = []
+    for line, values in iter_records(stream, filename):
+        try:
+            row = parse_row(values)
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+        if row.telegram_id in seen:
+            errors.append((line, f"telegram_id {row.telegram_id} уже был в строке {seen[row.telegram_id]}"))
+            continue
+        seen[row.telegram_id] = line
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ==================== ИМПОРТ ====================
+
+def _check_file(stream: BinaryIO, filename: str, errors: List[Tuple[int, str]]):
+    """Первый проход: разбирает файл целиком, ничего не записывая"""
+    for _ in iter_batches(stream, filename, errors):
+        pass
+
+async def import_file(stream: BinaryIO, filename: str, batch_size: int = IMPORT_BATCH_SIZE) -> ImportResult:
+    """Проверяет файл целиком и записывает его пачками. stream читается дважды
+    (нужен seek). RosterFileError — файл не разобрать, в базу ничего не записано;
+    RosterImportError — запись прервалась. Строки с ошибками пропускаются"""
+    start = time.perf_counter()
+    errors: List[Tuple[int, str]] = []
+    # Разбор — в потоке, чтобы не держать event loop
+    await asyncio.to_thread(_check_file, stream, filename, errors)
+
+    stream.seek(0)
+    # Ошибки строк уже собраны первым проходом
+    batches = iter_batches(stream, filename, [], batch_size)
+    imported = 0
+    while True:
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            break
+        try:
+            imported += await async_db.import_roster(batch)
+        except Exception as e:
+            raise RosterImportError(imported, e) from e
+    return ImportResult(imported, errors, time.perf_counter() - start)
+
+def errors_csv(errors: List[Tuple[int, str]]) -> bytes:
+    """Отчёт об ошибках для отправки файлом"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(("строка", "ошибка"))
+    writer.writerows(errors)
+    return out.getvalue().encode("utf-8-sig")
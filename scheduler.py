@@ -1,12 +1,27 @@
 import asyncio
+import heapq
+import html
 import logging
-from datetime import datetime
+import os
+import re
+import socket
+import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
 from aiogram import Bot
+from aiogram.types import BufferedInputFile
 
+from async_db import (
+    add_change_listener, remove_change_listener, acquire_leadership, release_leadership,
+    prune_user_changes, get_reminder_starts, iter_due_snapshot, watch_changes,
+    start_reminder_run, get_reminder_run, claim_shard, next_shard_expiry, renew_shard, complete_shard,
+    get_sent_reminders, record_sent_reminders
+)
 from database import (
-    get_all_users, get_medical, get_checks, get_vacation,
-    check_vlk_status, check_exercise_status, check_vacation_status
+    batch_row_statuses, from_day, today_day, DIGEST_SHARD
 )
+from sender import MessageSender
+import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,251 +29,625 @@ logger = logging.getLogger(__name__)
 # ID админа
 ADMIN_ID = 393293807
 
-async def send_daily_reminders(bot: Bot):
-    """Ежедневная рассылка напоминаний"""
-    logger.info("Запуск проверки напоминаний...")
-    
-    users = get_all_users()
-    
-    if not users:
-        logger.info("Пользователей в базе нет")
+# Час ежедневных напоминаний (по местному времени сервера)
+REMINDER_HOUR = int(os.getenv('REMINDER_HOUR', 9))
+
+# Срок аренды шарда; пока шард в работе, аренда продлевается каждую треть срока
+LEASE_SECONDS = 300
+
+# Как часто проверять, не освободился ли чужой шард: держатель может как
+# закончить его раньше срока аренды, так и упасть
+SHARD_POLL_SECONDS = 5
+
+# Размер пачки внутри шарда: после каждой пачки журнал и точка продолжения
+# сохраняются, поэтому при падении повторно может уйти не больше одной пачки
+SHARD_CHUNK_SIZE = 100
+
+# Лимит Telegram на длину сообщения
+MESSAGE_LIMIT = 4096
+
+# Если сводка не помещается в столько сообщений — отправляем её файлом
+DIGEST_MAX_MESSAGES = 5
+
+# Категории и окна сводки в порядке вывода
+CATEGORIES = (
+    ("vlk", "🏥 ВЛК"),
+    ("umo", "🩺 УМО"),
+    ("ex4", "✈️ Упр.4"),
+    ("ex7", "✈️ Упр.7"),
+    ("vacation", "🏖️ Отпуск"),
+)
+WINDOWS = (
+    ("expired", "🔴 ИСТЕКЛО"),
+    ("7", "🟠 В ближайшие 7 дней"),
+    ("15", "🟡 В ближайшие 15 дней"),
+    ("30", "🟢 В ближайшие 30 дней"),
+)
+
+class Finding(NamedTuple):
+    """Одна позиция сводки для админа"""
+    category: str
+    window: str
+    telegram_id: int
+    full_name: str
+    detail: str
+
+def _window(days_remaining: int) -> str:
+    """Окно сводки по числу оставшихся дней"""
+    if days_remaining <= 7:
+        return "7"
+    if days_remaining <= 15:
+        return "15"
+    return "30"
+
+# ==================== ТЕКСТЫ НАПОМИНАНИЙ ====================
+# Каждая функция возвращает (категория, окно, сообщение пользователю, пояснение для сводки)
+# или None, если напоминать не о чем.
+
+def _vlk_reminder(status: dict, vlk_date: str, umo_date: str) -> Optional[Tuple[str, str, str, str]]:
+    """Напоминание по ВЛК и УМО"""
+    if status['vlk_expired']:
+        return (
+            "vlk", "expired",
+            f"⛔ <b>СРОЧНО! ВЛК ИСТЕКЛА!</b>\n\n"
+            f"У вас истёк срок действия ВЛК!\n"
+            f"📅 Прошло дней: {status['days_passed']}\n\n"
+            f"❌ <b>ПОЛЁТЫ ЗАПРЕЩЕНЫ!</b>",
+            f"{status['days_passed']} дн. назад, полёты запрещены"
+        )
+
+    if status['umo_needed'] and not umo_date:
+        return (
+            "umo", "expired",
+            f"⚠️ <b>ТРЕБУЕТСЯ УМО!</b>\n\n"
+            f"Прошло более 6 месяцев с ВЛК.\n"
+            f"📅 Дата ВЛК: {vlk_date}\n\n"
+            f"Необходимо пройти УМО для продления ВЛК!",
+            f"{status['days_passed']} дн. с ВЛК"
+        )
+
+    if status['remind_30']:
+        return (
+            "vlk", _window(status['days_remaining']),
+            f"⏰ <b>ВЛК истекает через 30 дней!</b>\n\n"
+            f"Напоминаем о необходимости пройти ВЛК.\n"
+            f"📅 Осталось дней: {status['days_remaining']}",
+            f"через {status['days_remaining']} дн."
+        )
+
+    if status['remind_15']:
+        return (
+            "vlk", _window(status['days_remaining']),
+            f"⏰ <b>ВЛК истекает через 15 дней!</b>\n\n"
+            f"Осталось мало времени.\n"
+            f"📅 Осталось дней: {status['days_remaining']}",
+            f"через {status['days_remaining']} дн."
+        )
+
+    if status['remind_7']:
+        return (
+            "vlk", _window(status['days_remaining']),
+            f"🚨 <b>ВЛК истекает через 7 дней!</b>\n\n"
+            f"СРОЧНО пройдите ВЛК!\n"
+            f"📅 Осталось дней: {status['days_remaining']}",
+            f"через {status['days_remaining']} дн."
+        )
+
+    return None
+
+def _exercise_reminder(exercise: int, status: dict) -> Optional[Tuple[str, str, str, str]]:
+    """Напоминание по упражнению КБП"""
+    if status['expired']:
+        return (
+            f"ex{exercise}", "expired",
+            f"⛔ <b>Упражнение {exercise} ИСТЕКЛО!</b>\n\n"
+            f"Срок действия упражнения {exercise} истёк.\n"
+            f"📅 Истекло дней назад: {abs(status['days_remaining'])}\n\n"
+            f"❌ <b>ПОЛЁТЫ ЗАПРЕЩЕНЫ!</b>",
+            f"{abs(status['days_remaining'])} дн. назад, полёты запрещены"
+        )
+
+    if status['days_remaining'] <= 30:
+        return (
+            f"ex{exercise}", _window(status['days_remaining']),
+            f"⏰ <b>Упражнение {exercise} истекает!</b>\n\n"
+            f"Осталось {status['days_remaining']} дн.\n"
+            f"📅 Действительно до: {status['valid_until']}",
+            f"через {status['days_remaining']} дн. (до {status['valid_until']})"
+        )
+
+    return None
+
+def _vacation_reminder(status: dict, vac_days: int) -> Optional[Tuple[str, str, str, str]]:
+    """Напоминание по отпуску"""
+    if status['expired']:
+        return (
+            "vacation", "expired",
+            f"⚠️ <b>Отпуск истёк!</b>\n\n"
+            f"С момента окончания отпуска прошло больше года.\n"
+            f"📅 Прошло дней: {status['days_passed']}\n"
+            f"📊 Дней отпуска было: {vac_days}\n\n"
+            f"Необходимо оформить новый отпуск!",
+            f"{status['days_passed']} дн. после отпуска ({vac_days} дн.)"
+        )
+
+    if status['remind_30']:
+        return (
+            "vacation", _window(status['days_until_next']),
+            f"⏰ <b>До отпуска 30 дней!</b>\n\n"
+            f"Через {status['days_until_next']} дн. нужен новый отпуск.\n"
+            f"📊 Прошлый отпуск: {vac_days} дн.",
+            f"через {status['days_until_next']} дн."
+        )
+
+    if status['remind_15']:
+        return (
+            "vacation", _window(status['days_until_next']),
+            f"⏰ <b>До отпуска 15 дней!</b>\n\n"
+            f"Через {status['days_until_next']} дн. нужен новый отпуск.",
+            f"через {status['days_until_next']} дн."
+        )
+
+    if status['remind_7']:
+        return (
+            "vacation", _window(status['days_until_next']),
+            f"🚨 <b>До отпуска 7 дней!</b>\n\n"
+            f"Через {status['days_until_next']} дн. нужен новый отпуск.",
+            f"через {status['days_until_next']} дн."
+        )
+
+    return None
+
+def build_reminders(row, statuses: dict = None) -> Tuple[List[Tuple[int, str, str, str]], List[Finding]]:
+    """Собирает по строке снимка сообщения пользователю (chat_id, категория, окно, текст)
+    и позиции сводки. statuses — готовый результат batch_row_statuses для этой строки"""
+    if statuses is None:
+        statuses = batch_row_statuses([row])[0]
+    telegram_id = row['telegram_id']
+    full_name = f"{row['surname']} {row['name']}"
+
+    reminders = []
+    if statuses['vlk']:
+        reminders.append(_vlk_reminder(statuses['vlk'], row['vlk_date'], row['umo_date']))
+    if statuses['ex4']:
+        reminders.append(_exercise_reminder(4, statuses['ex4']))
+    if statuses['ex7']:
+        reminders.append(_exercise_reminder(7, statuses['ex7']))
+    if statuses['vacation']:
+        reminders.append(_vacation_reminder(statuses['vacation'], row['vacation_days'] or 0))
+
+    messages = []
+    findings = []
+    for reminder in reminders:
+        if not reminder:
+            continue
+        category, window, user_msg, detail = reminder
+        messages.append((telegram_id, category, window, user_msg))
+        findings.append(Finding(category, window, telegram_id, full_name, detail))
+    return messages, findings
+
+# ==================== СВОДКА ДЛЯ АДМИНА ====================
+
+def _digest_lines(findings: List[Finding], today: datetime) -> List[str]:
+    """Строки сводки (HTML), сгруппированные по окну и категории"""
+    lines = [f"📊 <b>Сводка на {today.strftime('%d.%m.%Y')}</b> ({len(findings)} поз.)"]
+    for window, window_title in WINDOWS:
+        in_window = [f for f in findings if f.window == window]
+        if not in_window:
+            continue
+        lines.append("")
+        lines.append(f"<b>{window_title}</b>")
+        for category, category_title in CATEGORIES:
+            items = [f for f in in_window if f.category == category]
+            if not items:
+                continue
+            lines.append(f"<b>{category_title}</b> ({len(items)}):")
+            for f in items:
+                lines.append(f"  • {html.escape(f.full_name)} (<code>{f.telegram_id}</code>) — {f.detail}")
+    return lines
+
+def split_messages(lines: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Склеивает строки в как можно меньшее число сообщений не длиннее limit"""
+    messages = []
+    current = ""
+    for line in lines:
+        if current and len(current) + len(line) + 1 > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+async def send_admin_digest(sender: MessageSender, findings: List[Finding]) -> bool:
+    """Отправляет админу сводку: несколько сообщений или один файл. True — доставлена"""
+    today = datetime.now()
+    lines = _digest_lines(findings, today)
+    messages = split_messages(lines)
+
+    if len(messages) <= DIGEST_MAX_MESSAGES:
+        # По одному, чтобы части сводки пришли по порядку
+        delivered = True
+        for text in messages:
+            result = await sender.send(ADMIN_ID, text, parse_mode="HTML")
+            delivered = delivered and result.ok
+        return delivered
+
+    plain = html.unescape(re.sub(r"</?(b|code)>", "", "\n".join(lines)))
+    document = BufferedInputFile(plain.encode("utf-8"), filename=f"digest_{today.strftime('%Y-%m-%d')}.txt")
+    result = await sender.send_document(
+        ADMIN_ID, document,
+        caption=f"📊 <b>Сводка на {today.strftime('%d.%m.%Y')}</b>: {len(findings)} поз.",
+        parse_mode="HTML"
+    )
+    return result.ok
+
+# ==================== РАССЫЛКА ====================
+
+async def _process_shard(sender: MessageSender, run_day: int, shard: int, checkpoint: int,
+                         owner: str) -> Tuple[int, int, int, int, bool]:
+    """Рассылает напоминания одного шарда.
+    Возвращает (строк, отправлено, ошибок, пропущено, шард пройден до конца)"""
+    # Состав шарда — всегда из базы: очередь планировщика, взявшего шард, может
+    # не знать о свежих изменениях, а готовый шард повторно не обрабатывается
+    chunks = iter_due_snapshot(chunk_size=SHARD_CHUNK_SIZE, shard=shard)
+
+    lost = asyncio.Event()
+
+    async def keep_lease():
+        # Продлеваем аренду, пока идёт отправка, иначе медленная пачка отдаст шард другому
+        while not lost.is_set():
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                renewed = await renew_shard(run_day, shard, owner, LEASE_SECONDS)
+            except Exception as e:
+                # Без продления аренда истечёт: дальше шард может взять другой
+                logger.error(f"Не удалось продлить аренду шарда {shard}: {e}")
+                renewed = False
+            if not renewed:
+                lost.set()
+
+    heartbeat = asyncio.create_task(keep_lease())
+    try:
+        stats = await _send_shard_chunks(sender, run_day, shard, checkpoint, chunks, lost)
+        return stats + (not lost.is_set(),)
+    finally:
+        heartbeat.cancel()
+
+async def _send_shard_chunks(sender: MessageSender, run_day: int, shard: int, checkpoint: int,
+                             chunks, lost: asyncio.Event) -> Tuple[int, int, int, int]:
+    """Отправляет пачки шарда, пока аренда за нами"""
+    scanned = sent = failed = skipped = 0
+    # Точка продолжения не заходит за первого, кому отправить не удалось:
+    # тот, кто доделает шард после нас, попробует отправить ему снова
+    first_failed = None
+    async for rows in chunks:
+        if not rows:
+            continue
+        pending = []
+        # Сроки считаем сразу для всей пачки, с одним «сегодня»
+        statuses = batch_row_statuses(rows)
+        for row, row_statuses in zip(rows, statuses):
+            scanned += 1
+            if row['telegram_id'] <= checkpoint:
+                continue
+            try:
+                user_messages, _ = build_reminders(row, row_statuses)
+            except Exception as e:
+                logger.error(f"Ошибка при проверке пользователя {row['telegram_id']}: {e}")
+                continue
+            pending.extend(user_messages)
+
+        if pending:
+            already_sent = await get_sent_reminders(run_day, sorted({m[0] for m in pending}))
+            skipped += len(pending)
+            pending = [m for m in pending if m[:3] not in already_sent]
+            skipped -= len(pending)
+
+        results = await sender.send_many([(m[0], m[3]) for m in pending], parse_mode="HTML")
+        delivered = [m[:3] for m, result in zip(pending, results) if result.ok]
+        sent += len(delivered)
+        failed += len(results) - len(delivered)
+        if first_failed is None and len(delivered) < len(results):
+            first_failed = min(m[0] for m, result in zip(pending, results) if not result.ok)
+        last_done = rows[-1]['telegram_id'] if first_failed is None else first_failed - 1
+        await record_sent_reminders(run_day, delivered, shard, last_done)
+
+        if lost.is_set():
+            logger.warning(f"Аренда шарда {shard} потеряна — останавливаемся")
+            break
+
+    return scanned, sent, failed, skipped
+
+async def _process_digest(sender: MessageSender, run_day: int):
+    """Собирает сводку по всем должникам и отправляет её админу (один раз за день)"""
+    digest_key = (ADMIN_ID, "digest", "all")
+    if digest_key in await get_sent_reminders(run_day, [ADMIN_ID]):
         return
-    
-    for user in users:
-        telegram_id = user[0]
-        surname = user[1]
-        name = user[2]
-        rank = user[3] if len(user) > 3 else ""
-        full_name = f"{surname} {name}"
-        
-        try:
-            # ===== ПРОВЕРКА ВЛК =====
-            medical = get_medical(telegram_id)
-            if medical and medical[1]:
-                vlk_date = medical[1]
-                umo_date = medical[2]
-                status = check_vlk_status(vlk_date)
-                
-                # Формируем сообщение для пользователя
-                user_msg = ""
-                admin_msg = f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                
-                if status['vlk_expired']:
-                    user_msg = (
-                        f"⛔ <b>СРОЧНО! ВЛК ИСТЕКЛА!</b>\n\n"
-                        f"У вас истёк срок действия ВЛК!\n"
-                        f"📅 Прошло дней: {status['days_passed']}\n\n"
-                        f"❌ <b>ПОЛЁТЫ ЗАПРЕЩЕНЫ!</b>"
-                    )
-                    admin_msg += f"🔴 <b>ВЛК:</b> ИСТЕКЛА! ({status['days_passed']} дн. назад)\n"
-                    admin_msg += f"❌ ПОЛЁТЫ ЗАПРЕЩЕНЫ!"
-                
-                elif status['umo_needed'] and not umo_date:
-                    user_msg = (
-                        f"⚠️ <b>ТРЕБУЕТСЯ УМО!</b>\n\n"
-                        f"Прошло более 6 месяцев с ВЛК.\n"
-                        f"📅 Дата ВЛК: {vlk_date}\n\n"
-                        f"Необходимо пройти УМО для продления ВЛК!"
-                    )
-                    admin_msg += f"🟠 <b>ВЛК:</b> Требуется УМО! ({status['days_passed']} дн.)"
-                
-                elif status['remind_30']:
-                    user_msg = (
-                        f"⏰ <b>ВЛК истекает через 30 дней!</b>\n\n"
-                        f"Напоминаем о необходимости пройти ВЛК.\n"
-                        f"📅 Осталось дней: {status['days_remaining']}"
-                    )
-                    admin_msg += f"🟡 <b>ВЛК:</b> Через {status['days_remaining']} дн."
-                
-                elif status['remind_15']:
-                    user_msg = (
-                        f"⏰ <b>ВЛК истекает через 15 дней!</b>\n\n"
-                        f"Осталось мало времени.\n"
-                        f"📅 Осталось дней: {status['days_remaining']}"
-                    )
-                    admin_msg += f"🟠 <b>ВЛК:</b> Через {status['days_remaining']} дн.!"
-                
-                elif status['remind_7']:
-                    user_msg = (
-                        f"🚨 <b>ВЛК истекает через 7 дней!</b>\n\n"
-                        f"СРОЧНО пройдите ВЛК!\n"
-                        f"📅 Осталось дней: {status['days_remaining']}"
-                    )
-                    admin_msg += f"🔴 <b>ВЛК:</b> Через {status['days_remaining']} дн.!!"
-                
-                # Отправляем сообщения
-                if user_msg:
-                    try:
-                        await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                    except Exception as e:
-                        logger.error(f"Не удалось отправить пользователю {telegram_id}: {e}")
-                
-                if admin_msg and not admin_msg.endswith("нет"):
-                    try:
-                        await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                    except Exception as e:
-                        logger.error(f"Не удалось отправить админу: {e}")
-            
-            # ===== ПРОВЕРКА КБП =====
-            checks = get_checks(telegram_id)
-            if checks:
-                # Упражнение 4 (6 месяцев)
-                if checks[1]:
-                    ex4_status = check_exercise_status(checks[1], 6)
-                    
-                    if ex4_status['expired']:
-                        user_msg = (
-                            f"⛔ <b>Упражнение 4 ИСТЕКЛО!</b>\n\n"
-                            f"Срок действия упражнения 4 истёк.\n"
-                            f"📅 Истекло дней назад: {abs(ex4_status['days_remaining'])}\n\n"
-                            f"❌ <b>ПОЛЁТЫ ЗАПРЕЩЕНЫ!</b>"
-                        )
-                        admin_msg = (
-                            f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                            f"🔴 <b>Упр.4:</b> ИСТЕКЛО! ({abs(ex4_status['days_remaining'])} дн. назад)\n"
-                            f"❌ ПОЛЁТЫ ЗАПРЕЩЕНЫ!"
-                        )
-                        try:
-                            await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                            await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки Упр.4: {e}")
-                    
-                    elif ex4_status['days_remaining'] <= 30:
-                        user_msg = (
-                            f"⏰ <b>Упражнение 4 истекает!</b>\n\n"
-                            f"Осталось {ex4_status['days_remaining']} дн.\n"
-                            f"📅 Действительно до: {ex4_status['valid_until']}"
-                        )
-                        admin_msg = (
-                            f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                            f"🟡 <b>Упр.4:</b> Через {ex4_status['days_remaining']} дн."
-                        )
-                        try:
-                            await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                            await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки Упр.4: {e}")
-                
-                # Упражнение 7 (12 месяцев)
-                if checks[2]:
-                    ex7_status = check_exercise_status(checks[2], 12)
-                    
-                    if ex7_status['expired']:
-                        user_msg = (
-                            f"⛔ <b>Упражнение 7 ИСТЕКЛО!</b>\n\n"
-                            f"Срок действия упражнения 7 истёк.\n"
-                            f"📅 Истекло дней назад: {abs(ex7_status['days_remaining'])}\n\n"
-                            f"❌ <b>ПОЛЁТЫ ЗАПРЕЩЕНЫ!</b>"
-                        )
-                        admin_msg = (
-                            f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                            f"🔴 <b>Упр.7:</b> ИСТЕКЛО! ({abs(ex7_status['days_remaining'])} дн. назад)\n"
-                            f"❌ ПОЛЁТЫ ЗАПРЕЩЕНЫ!"
-                        )
-                        try:
-                            await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                            await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки Упр.7: {e}")
-                    
-                    elif ex7_status['days_remaining'] <= 30:
-                        user_msg = (
-                            f"⏰ <b>Упражнение 7 истекает!</b>\n\n"
-                            f"Осталось {ex7_status['days_remaining']} дн.\n"
-                            f"📅 Действительно до: {ex7_status['valid_until']}"
-                        )
-                        admin_msg = (
-                            f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                            f"🟡 <b>Упр.7:</b> Через {ex7_status['days_remaining']} дн."
-                        )
-                        try:
-                            await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                            await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                        except Exception as e:
-                            logger.error(f"Ошибка отправки Упр.7: {e}")
-            
-            # ===== ПРОВЕРКА ОТПУСКА =====
-            vacation = get_vacation(telegram_id)
-            if vacation and vacation[2]:
-                vac_status = check_vacation_status(vacation[2])
-                vac_days = vacation[3] if len(vacation) > 3 else 0
-                
-                if vac_status['expired']:
-                    user_msg = (
-                        f"⚠️ <b>Отпуск истёк!</b>\n\n"
-                        f"С момента окончания отпуска прошло больше года.\n"
-                        f"📅 Прошло дней: {vac_status['days_passed']}\n"
-                        f"📊 Дней отпуска было: {vac_days}\n\n"
-                        f"Необходимо оформить новый отпуск!"
-                    )
-                    admin_msg = (
-                        f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                        f"🔴 <b>Отпуск:</b> ИСТЁК! ({vac_days} дн., {vac_status['days_passed']} дн. назад)"
-                    )
-                    try:
-                        await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                        await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки отпуск: {e}")
-                
-                elif vac_status['remind_30']:
-                    user_msg = (
-                        f"⏰ <b>До отпуска 30 дней!</b>\n\n"
-                        f"Через {vac_status['days_until_next']} дн. нужен новый отпуск.\n"
-                        f"📊 Прошлый отпуск: {vac_days} дн."
-                    )
-                    admin_msg = (
-                        f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                        f"🟡 <b>Отпуск:</b> Через {vac_status['days_until_next']} дн."
-                    )
-                    try:
-                        await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                        await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки отпуск: {e}")
-                
-                elif vac_status['remind_15']:
-                    user_msg = (
-                        f"⏰ <b>До отпуска 15 дней!</b>\n\n"
-                        f"Через {vac_status['days_until_next']} дн. нужен новый отпуск."
-                    )
-                    admin_msg = (
-                        f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                        f"🟠 <b>Отпуск:</b> Через {vac_status['days_until_next']} дн.!"
-                    )
-                    try:
-                        await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                        await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки отпуск: {e}")
-                
-                elif vac_status['remind_7']:
-                    user_msg = (
-                        f"🚨 <b>До отпуска 7 дней!</b>\n\n"
-                        f"Через {vac_status['days_until_next']} дн. нужен новый отпуск."
-                    )
-                    admin_msg = (
-                        f"📊 <b>Напоминание: {full_name}</b> (ID: {telegram_id})\n\n"
-                        f"🔴 <b>Отпуск:</b> Через {vac_status['days_until_next']} дн.!!"
-                    )
-                    try:
-                        await bot.send_message(telegram_id, user_msg, parse_mode="HTML")
-                        await bot.send_message(ADMIN_ID, admin_msg, parse_mode="HTML")
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки отпуск: {e}")
-        
-        except Exception as e:
-            logger.error(f"Ошибка при проверке пользователя {telegram_id}: {e}")
-    
-    logger.info("Проверка напоминаний завершена")
-
-async def run_scheduler(bot: Bot, interval_hours: int = 24):
-    """Запуск планировщика"""
+
+    findings = []
+    async for rows in iter_due_snapshot():
+        for row, row_statuses in zip(rows, batch_row_statuses(rows)):
+            try:
+                findings.extend(build_reminders(row, row_statuses)[1])
+            except Exception as e:
+                logger.error(f"Ошибка при проверке пользователя {row['telegram_id']}: {e}")
+
+    if findings and await send_admin_digest(sender, findings):
+        await record_sent_reminders(run_day, [digest_key])
+
+async def _run_reminders(sender: MessageSender) -> int:
+    """Прогон напоминаний за сегодня по всем, у кого сроки в окне.
+
+    Прогон разбит на шарды по telegram_id % SHARD_COUNT. Процессы (в том числе
+    на разных узлах с общей базой) берут шарды в аренду и обрабатывают разные
+    части; аренда упавшего процесса истекает через LEASE_SECONDS, и его шард
+    доделывает другой — поэтому, пока в прогоне есть чужие незавершённые
+    шарды, процесс не уходит, а ждёт. Отправленное записывается в журнал
+    sent_reminders, поэтому повтор не отправляет уже ушедшее. Сводку админу
+    отправляет тот, кто возьмёт шард сводки после всех остальных.
+    Возвращает число строк.
+    """
+    started = datetime.now()
+    run_day = today_day()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    if await start_reminder_run(run_day):
+        logger.info("Прогон за сегодня уже завершён — отправим только новое")
+
+    scanned = sent = failed = skipped = 0
     while True:
+        claim = await claim_shard(run_day, owner, LEASE_SECONDS)
+        if claim is None:
+            # Свободных нет: либо прогон готов, либо шарды в аренде у других.
+            # Живые продлевают аренду, аренду упавшего после истечения заберём мы
+            expires_at = await next_shard_expiry(run_day)
+            if expires_at is None:
+                break
+            delay = max(expires_at - datetime.now().timestamp(), 0) + 0.1
+            await asyncio.sleep(min(delay, SHARD_POLL_SECONDS))
+            continue
+        shard, checkpoint = claim
+
+        if shard == DIGEST_SHARD:
+            await _process_digest(sender, run_day)
+        else:
+            if checkpoint:
+                logger.info(f"Продолжаем шард {shard} после ID {checkpoint}")
+            stats = await _process_shard(sender, run_day, shard, checkpoint, owner)
+            scanned += stats[0]
+            sent += stats[1]
+            failed += stats[2]
+            skipped += stats[3]
+            if not stats[4]:
+                # Остановились без аренды: шард доделает тот, кто возьмёт его после истечения
+                continue
+        await complete_shard(run_day, shard, owner)
+
+    metrics.SCHEDULER_RUN_SECONDS.observe((datetime.now() - started).total_seconds())
+    metrics.SCHEDULER_USERS_SCANNED.inc(amount=scanned)
+    metrics.SCHEDULER_MESSAGES.inc("sent", amount=sent)
+    metrics.SCHEDULER_MESSAGES.inc("failed", amount=failed)
+    metrics.SCHEDULER_MESSAGES.inc("skipped", amount=skipped)
+    logger.info(f"Проверка напоминаний завершена ({scanned} польз., отправлено {sent}, "
+                f"ошибок {failed}, уже было отправлено {skipped})")
+    return scanned
+
+async def send_daily_reminders(bot: Bot, sender: MessageSender = None):
+    """Разовая рассылка напоминаний всем, у кого сроки в окне"""
+    logger.info("Запуск проверки напоминаний...")
+    sender = sender or MessageSender(bot)
+
+    if not await _run_reminders(sender):
+        logger.info("Напоминать некому")
+
+# ==================== ПЛАНИРОВЩИК ====================
+
+class ReminderScheduler:
+    """Планировщик на куче (момент напоминания, telegram_id).
+
+    Для каждого пользователя хранится ближайший момент напоминания —
+    REMINDER_HOUR первого дня, когда какой-либо срок входит в окно.
+    Планировщик спит ровно до вершины кучи; изменения дат пользователя
+    перепланируют только его. Устаревшие записи кучи отбрасываются
+    по номеру версии.
+    """
+
+    def __init__(self, bot: Bot, sender: MessageSender = None):
+        self.bot = bot
+        self.sender = sender or MessageSender(bot)
+        self._heap: List[Tuple[float, int, int]] = []
+        self._versions: Dict[int, int] = {}
+        self._pending: Set[int] = set()
+        self._reschedule_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    @staticmethod
+    def next_instant(start_day: int, now: datetime = None, catch_up: bool = False) -> datetime:
+        """Момент напоминания: REMINDER_HOUR дня start_day, но не раньше ближайшего будущего.
+        catch_up — сегодняшний прогон не завершён, его момент подходит, даже если прошёл."""
+        now = now or datetime.now()
+        first = datetime.combine(now.date(), time(REMINDER_HOUR))
+        if first <= now and not catch_up:
+            first += timedelta(days=1)
+        start = datetime.combine(date.fromisoformat(from_day(start_day)), time(REMINDER_HOUR))
+        return max(first, start)
+
+    def schedule(self, telegram_id: int, start_day: Optional[int]):
+        """Ставит (или снимает, если start_day is None) пользователя в очередь"""
+        if start_day is None:
+            self._versions.pop(telegram_id, None)
+            return
+        version = self._versions.get(telegram_id, 0) + 1
+        self._versions[telegram_id] = version
+        instant = self.next_instant(start_day).timestamp()
+        if not self._heap or instant < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (instant, telegram_id, version))
+        if len(self._heap) > 2 * len(self._versions) + 1000:
+            # Слишком много устаревших записей — пересобираем кучу
+            self._heap = [entry for entry in self._heap if self._versions.get(entry[1]) == entry[2]]
+            heapq.heapify(self._heap)
+
+    async def rebuild(self):
+        """Заполняет кучу по базе одним запросом"""
+        # Если сегодняшний прогон не начинался или прервался — доделываем его сразу
+        run = await get_reminder_run(today_day())
+        catch_up = run is None or run[2] is None
+
+        self._heap = []
+        self._versions = {}
+        now = datetime.now()
+        for telegram_id, start_day in await get_reminder_starts():
+            if start_day is not None:
+                self._versions[telegram_id] = 1
+                instant = self.next_instant(start_day, now, catch_up)
+                self._heap.append((instant.timestamp(), telegram_id, 1))
+        heapq.heapify(self._heap)
+        logger.info(f"Очередь напоминаний: {len(self._heap)} польз.")
+
+    async def reschedule(self, telegram_ids: List[int]):
+        """Перечитывает сроки пользователей и ставит их в очередь заново"""
+        for telegram_id, start_day in await get_reminder_starts(telegram_ids):
+            self.schedule(telegram_id, start_day)
+
+    def on_user_changed(self, telegram_id: int):
+        """Подписчик async_db: даты пользователя изменились"""
+        # Новая версия сразу делает старую запись кучи недействительной
+        self._versions[telegram_id] = self._versions.get(telegram_id, 0) + 1
+        # Изменения, пришедшие пачкой (импорт, лента), перечитываются одним запросом
+        if not self._pending:
+            self._reschedule_task = asyncio.create_task(self._reschedule_pending())
+            self._reschedule_task.add_done_callback(self._reschedule_done)
+        self._pending.add(telegram_id)
+
+    async def _reschedule_pending(self):
+        ids, self._pending = list(self._pending), set()
+        await self.reschedule(ids)
+
+    @staticmethod
+    def _reschedule_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Ошибка перепланирования изменённых пользователей: {task.exception()}")
+
+    def _pop_due(self, now: float) -> List[int]:
+        """Снимает с кучи всех, чей момент наступил"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, telegram_id, version = heapq.heappop(self._heap)
+            if self._versions.get(telegram_id) == version:
+                due.append(telegram_id)
+        return due
+
+    def _drop_stale(self):
+        while self._heap and self._versions.get(self._heap[0][1]) != self._heap[0][2]:
+            heapq.heappop(self._heap)
+
+    async def _sleep_until_due(self):
+        """Спит до вершины кучи или до более раннего перепланирования"""
+        self._drop_stale()
+        self._wakeup.clear()
+        if not self._heap:
+            await self._wakeup.wait()
+            return
+        delay = self._heap[0][0] - datetime.now().timestamp()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        """Основной цикл"""
+        await self.rebuild()
+        while True:
+            await self._sleep_until_due()
+            due = self._pop_due(datetime.now().timestamp())
+            if not due:
+                continue
+
+            logger.info(f"Запуск напоминаний: {len(due)} польз.")
+            try:
+                await _run_reminders(self.sender)
+            except Exception as e:
+                logger.error(f"Ошибка в планировщике: {e}")
+            # Следующее напоминание — по актуальным датам из базы
+            await self.reschedule(due)
+
+async def run_scheduler(bot: Bot, sender: MessageSender = None):
+    """Запуск планировщика"""
+    scheduler = ReminderScheduler(bot, sender)
+    add_change_listener(scheduler.on_user_changed)
+    try:
+        while True:
+            try:
+                await scheduler.run()
+            except Exception as e:
+                logger.error(f"Ошибка в планировщике: {e}")
+                await asyncio.sleep(60)
+    finally:
+        remove_change_listener(scheduler.on_user_changed)
+
+# ==================== ВЕДУЩИЙ ВОРКЕР ====================
+
+# Роль ведущего: планировщик работает только в процессе, который её держит
+LEADER_ROLE = "scheduler"
+
+# Срок аренды роли: столько ждут остальные воркеры, если ведущий упал
+LEADER_LEASE_SECONDS = int(os.getenv('LEADER_LEASE_SECONDS', 30))
+
+# Как часто ведущий чистит ленту изменений
+CHANGES_PRUNE_INTERVAL = 60 * 60
+
+async def run_scheduler_leader(bot: Bot, sender: MessageSender = None):
+    """Планировщик для нескольких воркеров веб-сервера: каждый воркер держит эту
+    задачу, но run_scheduler работает только у того, кто арендовал роль ведущего.
+    Ведущий продлевает аренду каждые LEADER_LEASE_SECONDS / 3; если он упал,
+    роль после истечения аренды забирает другой воркер."""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    task = None
+    last_prune = 0.0
+    try:
+        while True:
+            try:
+                leader = await acquire_leadership(LEADER_ROLE, owner, LEADER_LEASE_SECONDS)
+            except Exception as e:
+                logger.error(f"Не удалось продлить роль ведущего: {e}")
+                leader = False
+
+            if leader and task is None:
+                logger.info(f"Воркер {owner} стал ведущим: запускаем планировщик")
+                task = asyncio.create_task(run_scheduler(bot, sender))
+            elif not leader and task is not None:
+                # Роль уже может быть у другого — не рассылаем вдвоём
+                # (журнал напоминаний всё равно не даст отправить дважды)
+                logger.warning(f"Воркер {owner} потерял роль ведущего: останавливаем планировщик")
+                task.cancel()
+                task = None
+
+            if leader and datetime.now().timestamp() - last_prune >= CHANGES_PRUNE_INTERVAL:
+                last_prune = datetime.now().timestamp()
+                try:
+                    await prune_user_changes()
+                except Exception as e:
+                    logger.error(f"Ошибка очистки ленты изменений: {e}")
+
+            await asyncio.sleep(LEADER_LEASE_SECONDS / 3)
+    finally:
+        if task is not None:
+            task.cancel()
+            await release_leadership(LEADER_ROLE, owner)
+
+if __name__ == "__main__":
+    # Отдельный процесс-обработчик напоминаний: можно запустить несколько
+    # (на одном или разных узлах с общей базой) — шарды они поделят сами
+    async def _worker():
+        bot = Bot(token=os.getenv('BOT_TOKEN'))
+        # Изменения из бота приходят через ленту — иначе очередь этого процесса устареет
+        watcher = asyncio.create_task(watch_changes())
         try:
-            await send_daily_reminders(bot)
-            await asyncio.sleep(interval_hours * 3600)
-        except Exception as e:
-            logger.error(f"Ошибка в планировщике: {e}")
-            await asyncio.sleep(3600)
+            await run_scheduler(bot)
+        finally:
+            watcher.cancel()
+            await bot.session.close()
+
+    asyncio.run(_worker())
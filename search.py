@@ -0,0 +1,115 @@
+"""Поиск по личному составу для /find и inline-режима.
+
+Кандидаты берутся из триграммного индекса users_fts (database.search_users):
+каждое слово запроса должно входить в фамилию, имя, отчество или звание.
+Ранжирование — здесь, по простому правилу (см. _score), поэтому выдача не
+зависит от того, пришла она из базы или из кэша.
+
+Кэш результатов по запросам: при наборе в inline-режиме каждый следующий
+запрос продолжает предыдущий («ива» → «иван» → «иванов»). Если у
+кэшированного начала запроса найдены все совпадения (их не больше
+SEARCH_CANDIDATES), то совпадения продолжения — их подмножество, и оно
+отбирается из кэша без запроса к базе. Любое изменение данных
+пользователей сбрасывает кэш целиком (подписка async_db).
+"""
+import os
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import async_db
+
+# Слова короче не ищутся: у триграммного индекса нет для них ключей
+MIN_TERM_LENGTH = 3
+
+# Сколько совпадений брать из базы для ранжирования
+SEARCH_CANDIDATES = 200
+
+# Сколько запросов помнить
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', 256))
+
+_COLUMNS = ("surname", "name", "patronymic", "rank")
+
+def terms(query: str) -> Tuple[str, ...]:
+    """Слова запроса в нижнем регистре, без коротких"""
+    return tuple(word for word in query.lower().split() if len(word) >= MIN_TERM_LENGTH)
+
+def _matches(row, query_terms: Tuple[str, ...]) -> bool:
+    values = [(row[column] or "").lower() for column in _COLUMNS]
+    return all(any(term in value for value in values) for term in query_terms)
+
+def _score(row, query_terms: Tuple[str, ...]) -> tuple:
+    """Меньше — выше: совпадение в фамилии важнее имени, отчества и звания,
+    совпадение с начала слова — важнее середины"""
+    values = [(row[column] or "").lower() for column in _COLUMNS]
+    score = 0
+    for term in query_terms:
+        score += min(
+            (2 * index + (0 if value.startswith(term) else 1)
+             for index, value in enumerate(values) if term in value),
+            default=2 * len(values),
+        )
+    return score, row['surname'], row['name'], row['telegram_id']
+
+class SearchCache:
+    """LRU запросов: слова запроса -> (совпадения, найдены ли все)"""
+
+    def __init__(self, size: int = SEARCH_CACHE_SIZE):
+        self.size = size
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[list, bool]]" = OrderedDict()
+        self.counters = {"hits": 0, "prefix_hits": 0, "misses": 0, "resets": 0}
+        # Растёт при каждом сбросе: результат запроса, начатого до правки, не кэшируется
+        self.generation = 0
+
+    def get(self, query: str, query_terms: Tuple[str, ...]) -> Optional[list]:
+        """Совпадения из кэша: точный запрос или отбор из полного результата его начала"""
+        entry = self._entries.get(query_terms)
+        if entry is not None:
+            self._entries.move_to_end(query_terms)
+            self.counters["hits"] += 1
+            return entry[0]
+        # Самое длинное начало запроса с полным результатом
+        for cut in range(len(query) - 1, MIN_TERM_LENGTH - 1, -1):
+            prefix_terms = terms(query[:cut])
+            entry = self._entries.get(prefix_terms) if prefix_terms else None
+            if entry is not None and entry[1]:
+                rows = sorted((row for row in entry[0] if _matches(row, query_terms)),
+                              key=lambda row: _score(row, query_terms))
+                self.put(query_terms, rows, True)
+                self.counters["prefix_hits"] += 1
+                return rows
+        self.counters["misses"] += 1
+        return None
+
+    def put(self, query_terms: Tuple[str, ...], rows: list, complete: bool):
+        self._entries[query_terms] = (rows, complete)
+        self._entries.move_to_end(query_terms)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def on_user_changed(self, telegram_id: int):
+        """Подписчик async_db: любая правка может изменить любую выдачу"""
+        self.generation += 1
+        if self._entries:
+            self._entries.clear()
+            self.counters["resets"] += 1
+
+    def stats(self) -> dict:
+        return dict(self.counters, size=len(self._entries))
+
+cache = SearchCache()
+async_db.add_change_listener(cache.on_user_changed)
+
+async def find(query: str, limit: int) -> Tuple[List, int]:
+    """Лучшие limit совпадений (строки снимка) и сколько всего найдено.
+    Если совпадений больше SEARCH_CANDIDATES, «всего» — это нижняя граница"""
+    query_terms = terms(query)
+    if not query_terms:
+        return [], 0
+    rows = cache.get(query, query_terms)
+    if rows is None:
+        generation = cache.generation
+        rows, complete = await async_db.search_users(list(query_terms), SEARCH_CANDIDATES)
+        rows = sorted(rows, key=lambda row: _score(row, query_terms))
+        if cache.generation == generation:
+            cache.put(query_terms, rows, complete)
+    return rows[:limit], len(rows)
@@ -0,0 +1,142 @@
+"""Общая очередь исходящих сообщений.
+
+Ограничивает число одновременных запросов, общий темп (token bucket,
+по умолчанию 28 сообщений в секунду — чуть ниже лимита Telegram ~30,
+чтобы не упираться в него вплотную) и темп в каждый отдельный чат,
+а на ответ Telegram 429 ставит все отправки на паузу retry_after.
+"""
+import asyncio
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest,
+    TelegramNetworkError, TelegramServerError
+)
+
+logger = logging.getLogger(__name__)
+
+class SendResult(NamedTuple):
+    """Итог отправки одного сообщения"""
+    chat_id: int
+    ok: bool
+    attempts: int
+    error: Optional[str] = None
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = None
+
+    async def acquire(self):
+        """Забирает токен; при нехватке ждёт своей очереди"""
+        now = asyncio.get_running_loop().time()
+        if self._updated is None:
+            self._updated = now
+        elif now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+        # Уходим в минус — это бронь: следующий вызов будет ждать дольше.
+        # _updated может быть в будущем (см. drain) — тогда ждём и его
+        self._tokens -= 1
+        wait = self._updated - now + max(0.0, -self._tokens / self.rate)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def drain(self, until: float):
+        """Опустошает ведро: до момента until токены не копятся"""
+        self._tokens = min(self._tokens, 0.0)
+        self._updated = max(self._updated or until, until)
+
+class MessageSender:
+    """Отправка сообщений с ограничением темпа и повторами"""
+
+    def __init__(self, bot: Bot, concurrency: int = 20, rate: float = 28,
+                 per_chat_interval: float = 1.0, max_attempts: int = 3):
+        self.bot = bot
+        self.max_attempts = max_attempts
+        self.per_chat_interval = per_chat_interval
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Без запаса на всплеск: с capacity=rate за любую секунду уходило
+        # до 2×rate сообщений, и сервер отвечал 429
+        self._bucket = TokenBucket(rate, capacity=1)
+        self._concurrency = concurrency
+        self._chat_next: Dict[int, float] = {}
+        self._paused_until = 0.0
+
+    async def _wait_turn(self, chat_id: int):
+        """Ждёт глобальную паузу, лимит чата и общий token bucket"""
+        loop = asyncio.get_running_loop()
+
+        now = loop.time()
+        if self._paused_until > now:
+            await asyncio.sleep(self._paused_until - now)
+
+        now = loop.time()
+        slot = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = slot + self.per_chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {cid: t for cid, t in self._chat_next.items() if t > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+        await self._bucket.acquire()
+
+    async def _deliver(self, chat_id: int, call) -> SendResult:
+        """Выполняет call() с ограничениями темпа и повторами"""
+        loop = asyncio.get_running_loop()
+        attempts = 0
+        error = None
+
+        async with self._semaphore:
+            while attempts < self.max_attempts:
+                attempts += 1
+                await self._wait_turn(chat_id)
+                try:
+                    await call()
+                    return SendResult(chat_id, True, attempts)
+                except TelegramRetryAfter as e:
+                    # Флуд-контроль касается всего бота — тормозим все отправки
+                    self._paused_until = max(self._paused_until, loop.time() + e.retry_after)
+                    # За паузу ведро не должно наполниться — иначе после неё снова всплеск
+                    self._bucket.drain(self._paused_until)
+                    error = str(e)
+                    logger.warning(f"Флуд-контроль: пауза {e.retry_after} с")
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    error = str(e)
+                    await asyncio.sleep(2 ** attempts)
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    # Пользователь заблокировал бота или чат не найден — повтор не поможет
+                    error = str(e)
+                    break
+                except Exception as e:
+                    error = str(e)
+                    break
+
+        logger.error(f"Не удалось отправить {chat_id}: {error}")
+        return SendResult(chat_id, False, attempts, error)
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> SendResult:
+        """Отправляет одно сообщение с повторами"""
+        return await self._deliver(chat_id, lambda: self.bot.send_message(chat_id, text, **kwargs))
+
+    async def send_document(self, chat_id: int, document, **kwargs) -> SendResult:
+        """Отправляет файл с теми же ограничениями"""
+        return await self._deliver(chat_id, lambda: self.bot.send_document(chat_id, document, **kwargs))
+
+    async def send_many(self, messages: Sequence[Tuple[int, str]], **kwargs) -> List[SendResult]:
+        """Рассылает пачку сообщений (chat_id, текст) параллельно с ограничениями.
+        Результаты — в том же порядке, что и messages."""
+        results: List[Optional[SendResult]] = [None] * len(messages)
+        pending = iter(enumerate(messages))
+
+        async def worker():
+            for index, (chat_id, text) in pending:
+                results[index] = await self.send(chat_id, text, **kwargs)
+
+        await asyncio.gather(*(worker() for _ in range(min(self._concurrency, len(messages)))))
+        return results
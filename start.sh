@@ -1,3 +1,15 @@
 #!/bin/bash
-python bot.py &
-gunicorn app:app
\ No newline at end of file
+# Процессы aiohttp на одном порту (gunicorn).
+# По умолчанию один: только в нём работают очередь обновлений с быстрым
+# ответом webhook (webhook_queue.py) и буфер записей FSM (storage.py) —
+# их порядок и буфер не общие между процессами. WEB_WORKERS=2 и больше
+# масштабирует приём webhook ценой этих двух оптимизаций.
+# Планировщик напоминаний работает только в одном из процессов — в том,
+# кто держит аренду роли ведущего в базе (см. scheduler.run_scheduler_leader).
+export WEB_WORKERS=${WEB_WORKERS:-1}
+
+exec gunicorn bot:app \
+    --bind 0.0.0.0:${PORT:-8080} \
+    --worker-class aiohttp.GunicornWebWorker \
+    --workers "$WEB_WORKERS" \
+    --graceful-timeout 30
@@ -0,0 +1,176 @@
+"""Хранилище состояний FSM в SQLite-базе бота.
+
+Незаконченные анкеты (/start, /vlk, /vacation, /update) переживают
+перезапуск и видны всем процессам, работающим с той же базой.
+Записи копятся в буфере и уходят в базу одной транзакцией раз в
+flush_interval; чтение сначала смотрит в буфер, потом в базу. При
+flush_interval = 0 запись уходит в базу до возврата из set_state/set_data —
+так нужно, если обновления одного пользователя обрабатывают разные процессы.
+Состояния, не менявшиеся дольше ttl, удаляются.
+
+Кроме того, хранилище помнит в памяти, у кого из (чат, пользователь) идёт
+анкета (has_state): по этому фильтр групповых сообщений (update_filter.py)
+пропускает ответы на вопросы анкеты, не читая базу. При flush_interval = 0
+анкету мог начать другой процесс, поэтому has_state спрашивает базу.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import async_db
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранить брошенные анкеты (по умолчанию сутки)
+FSM_TTL_SECONDS = int(os.getenv('FSM_TTL_SECONDS', 24 * 60 * 60))
+
+# Как часто сбрасывать буфер записей в базу
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', 0.05))
+
+# Как часто удалять устаревшие состояния
+FSM_EVICT_INTERVAL = 60 * 60
+
+_UNSET = object()
+
+def _key(key: StorageKey) -> str:
+    """Ключ записи: бот, чат, пользователь, тема, бизнес-подключение, назначение"""
+    return ":".join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id,
+        getattr(key, "thread_id", None) or "",
+        getattr(key, "business_connection_id", None) or "",
+        key.destiny,
+    ))
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states с пакетной записью"""
+
+    def __init__(self, ttl: float = FSM_TTL_SECONDS, flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # key -> {"state": ..., "data": ...}; отсутствующее поле не меняется
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Пачка, которая сейчас записывается: пока запись не закончилась, читаем её отсюда
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_evict = time.time()
+        # (чат, пользователь) с незаконченной анкетой -> когда состояние задано
+        self._active: Dict[Tuple[int, int], float] = {}
+
+    # ---------- незаконченные анкеты ----------
+
+    async def has_state(self, bot_id: int, chat_id: int, user_id: int) -> bool:
+        """Идёт ли у пользователя в чате анкета: по записям этого процесса и load_active,
+        а при записи без буфера (несколько процессов) — по базе"""
+        if self.flush_interval <= 0:
+            return await async_db.has_fsm_state(f"{bot_id}:{chat_id}:{user_id}:", time.time() - self.ttl)
+        started = self._active.get((chat_id, user_id))
+        return started is not None and time.time() - started < self.ttl
+
+    def _track(self, key: StorageKey, state: Optional[str]):
+        if state is None:
+            self._active.pop((key.chat_id, key.user_id), None)
+        else:
+            self._active[(key.chat_id, key.user_id)] = time.time()
+
+    async def load_active(self):
+        """Подхватывает анкеты, начатые до перезапуска"""
+        now = time.time()
+        for key in await async_db.get_fsm_state_keys(now - self.ttl):
+            _, chat_id, user_id = key.split(":", 3)[:3]
+            self._active.setdefault((int(chat_id), int(user_id)), now)
+
+    # ---------- чтение ----------
+
+    async def _load(self, key: str):
+        """(state, data) с учётом ещё не записанного буфера"""
+        pending = {**self._inflight.get(key, {}), **self._pending.get(key, {})}
+        if "state" in pending and "data" in pending:
+            return pending["state"], pending["data"]
+
+        record = await async_db.get_fsm_record(key, time.time() - self.ttl)
+        state, data = (record[0], json.loads(record[1])) if record else (None, {})
+        return pending.get("state", state), pending.get("data", data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(_key(key))
+        return state
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(_key(key))
+        return dict(data)
+
+    # ---------- запись ----------
+
+    def _put(self, key: str, state: Any = _UNSET, data: Any = _UNSET):
+        pending = self._pending.setdefault(key, {})
+        if state is not _UNSET:
+            pending["state"] = state
+        if data is not _UNSET:
+            pending["data"] = data
+        if self.flush_interval <= 0:
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        self._track(key, state)
+        self._put(_key(key), state=state)
+        if self.flush_interval <= 0:
+            await self.flush()
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._put(_key(key), data=dict(data))
+        if self.flush_interval <= 0:
+            await self.flush()
+
+    async def _flush_later(self):
+        """Ждёт flush_interval, собирая записи в пачку, и сбрасывает её;
+        повторяет, пока во время записи появляются новые"""
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Записывает буфер одной транзакцией"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._inflight = batch
+        records = [
+            (key, "state" in change, change.get("state"),
+             "data" in change, json.dumps(change.get("data", {}), ensure_ascii=False))
+            for key, change in batch.items()
+        ]
+        try:
+            await async_db.save_fsm_records(records, time.time())
+        except Exception as e:
+            logger.error(f"Не удалось сохранить состояния FSM: {e}")
+            # Возвращаем в буфер то, что не перезаписали за время попытки
+            for key, change in batch.items():
+                self._pending[key] = {**change, **self._pending.get(key, {})}
+            return
+        finally:
+            self._inflight = {}
+
+        if time.time() - self._last_evict >= FSM_EVICT_INTERVAL:
+            self._last_evict = time.time()
+            try:
+                evicted = await async_db.evict_fsm_records(time.time() - self.ttl)
+                self._active = {chat: started for chat, started in self._active.items()
+                                if time.time() - started < self.ttl}
+                if evicted:
+                    logger.info(f"Удалено устаревших состояний FSM: {evicted}")
+            except Exception as e:
+                logger.error(f"Ошибка очистки состояний FSM: {e}")
+
+    async def close(self) -> None:
+        if self._flusher and not self._flusher.done():
+            await self._flusher
+        await self.flush()
@@ -0,0 +1,152 @@
+"""Шардированный прогон напоминаний: несколько процессов, каждое напоминание — ровно один раз.
+
+Процессы-обработчики запускаются как в scheduler.py (__main__), но с
+фиктивной отправкой: каждая доставка пишется в таблицу deliveries той же
+базы. Проверяется журнал sent_reminders, сами доставки и закрытие прогона.
+"""
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import sys
+from collections import Counter
+from datetime import date, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+import scheduler  # noqa: E402
+
+USERS = 300
+
+class _RecordingSender:
+    """Вместо Telegram пишет доставки в deliveries.
+
+    fail_first — первое сообщение «не доставлено» (как заблокировавший бота);
+    exit_on — номер пачки (вызова send_many), на которой процесс падает, ничего не отправив.
+    """
+
+    def __init__(self, db_path: str, worker: int, fail_first: bool = False, exit_on: int = None):
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.worker = worker
+        self.fail_first = fail_first
+        self.exit_on = exit_on
+        self.calls = self.batches = 0
+
+    async def send(self, chat_id, text, **kwargs):
+        from sender import SendResult
+        self.calls += 1
+        if self.fail_first and self.calls == 1:
+            return SendResult(chat_id, False, 1, "Forbidden: bot was blocked by the user")
+        self.conn.execute("INSERT INTO deliveries (worker, chat_id, text) VALUES (?, ?, ?)",
+                          (self.worker, chat_id, text))
+        return SendResult(chat_id, True, 1)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        return await self.send(chat_id, "<digest file>")
+
+    async def send_many(self, messages, **kwargs):
+        self.batches += 1
+        if self.batches == self.exit_on:
+            os._exit(1)
+        return [await self.send(chat_id, text) for chat_id, text in messages]
+
+def _worker(db_path: str, worker: int, lease: float, fail_first: bool = False, exit_on: int = None):
+    database.DB_NAME = db_path
+    scheduler.LEASE_SECONDS = lease
+    scheduler.SHARD_POLL_SECONDS = 0.2
+    scheduler.SHARD_CHUNK_SIZE = 20
+    asyncio.run(scheduler._run_reminders(_RecordingSender(db_path, worker, fail_first, exit_on)))
+
+def _start(db_path: str, worker: int, lease: float, **kwargs):
+    proc = multiprocessing.get_context("spawn").Process(
+        target=_worker, args=(db_path, worker, lease), kwargs=kwargs
+    )
+    proc.start()
+    return proc
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """База на USERS пользователей, у каждого что-то из сроков в окне напоминаний"""
+    path = str(tmp_path / "users.db")
+    monkeypatch.setattr(database, "DB_NAME", path)
+    database.init_db()
+    today = date.today()
+    for telegram_id in range(1, USERS + 1):
+        database.add_user(telegram_id, f"Фамилия{telegram_id}", "Имя", None, "капитан")
+        database.add_medical(telegram_id, (today - timedelta(days=300 + telegram_id % 100)).isoformat())
+        database.add_check(telegram_id, 4, (today - timedelta(days=telegram_id % 200)).isoformat())
+        database.add_vacation(telegram_id, "2025-01-01", (today - timedelta(days=telegram_id % 400)).isoformat())
+    database.get_connection().execute("CREATE TABLE deliveries (worker INTEGER, chat_id INTEGER, text TEXT)")
+    yield path
+    database.close_connections()
+
+def _expected() -> Counter:
+    """(telegram_id, item, threshold, текст) всех напоминаний на сегодня"""
+    expected = Counter()
+    for rows in database.iter_due_snapshot():
+        for row in rows:
+            expected.update(scheduler.build_reminders(row)[0])
+    return expected
+
+def _check_run(db_path: str, expected: Counter):
+    conn = sqlite3.connect(db_path)
+    run_day = database.today_day()
+    ledger = Counter(conn.execute(
+        "SELECT telegram_id, item, threshold FROM sent_reminders WHERE sent_on = ?", (run_day,)
+    ).fetchall())
+    deliveries = Counter(conn.execute(
+        "SELECT chat_id, text FROM deliveries WHERE text NOT LIKE '📊%' AND text != '<digest file>'"
+    ).fetchall())
+    digests = conn.execute(
+        "SELECT COUNT(*) FROM deliveries WHERE text LIKE '📊%' OR text = '<digest file>'"
+    ).fetchone()[0]
+    finished_at = conn.execute("SELECT finished_at FROM reminder_runs WHERE run_day = ?", (run_day,)).fetchone()[0]
+    conn.close()
+
+    assert expected
+    assert ledger == Counter([key[:3] for key in expected] + [(scheduler.ADMIN_ID, "digest", "all")])
+    assert deliveries == Counter({(key[0], key[3]): count for key, count in expected.items()})
+    assert digests >= 1
+    assert finished_at is not None
+
+def test_workers_cover_every_reminder_once(db_path):
+    expected = _expected()
+    database.close_connections()
+
+    procs = [_start(db_path, worker, lease=300) for worker in range(4)]
+    for proc in procs:
+        proc.join(timeout=120)
+        assert proc.exitcode == 0
+
+    _check_run(db_path, expected)
+
+def test_shard_of_dead_worker_is_taken_over(db_path):
+    """Процесс 0 не доставляет первое сообщение, записывает первую пачку и падает
+    на второй, не отправив её. Его шард после истечения аренды доделывают
+    другие, начиная с недоставленного — оно тоже должно уйти"""
+    expected = _expected()
+    database.close_connections()
+
+    crashed = _start(db_path, 0, lease=1.0, fail_first=True, exit_on=2)
+    crashed.join(timeout=120)
+    assert crashed.exitcode == 1
+
+    conn = sqlite3.connect(db_path)
+    shard, checkpoint = conn.execute(
+        "SELECT shard, last_telegram_id FROM shard_leases WHERE owner IS NOT NULL AND done = 0"
+    ).fetchone()
+    conn.close()
+    # Точка продолжения остановилась перед первым, кому отправить не удалось
+    failed_user = min(key[0] for key in expected if key[0] % database.SHARD_COUNT == shard)
+    assert checkpoint == failed_user - 1
+
+    procs = [_start(db_path, worker, lease=1.0) for worker in range(1, 4)]
+    for proc in procs:
+        proc.join(timeout=120)
+        assert proc.exitcode == 0
+
+    _check_run(db_path, expected)
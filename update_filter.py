@@ -0,0 +1,117 @@
+"""Ранний отсев обновлений, которые бот всё равно не обработает.
+
+Внешняя middleware на dp.update стоит до FSM: отброшенное обновление не
+читает состояние из базы и не перебирает обработчики. Отсеиваются:
+- типы обновлений, на которые нет ни одного обработчика
+  (тот же список уходит в allowed_updates при установке webhook);
+- болтовня в группах: сообщения без команды этому боту, без упоминания
+  бота, не в ответ на его сообщение и не от того, кто сейчас заполняет
+  анкету в этом чате (ответы на вопросы анкеты — обычный текст).
+
+getMe запрашивается один раз при запуске (setup) и дальше берётся из кэша бота.
+"""
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Message, TelegramObject, Update, User
+
+logger = logging.getLogger(__name__)
+
+# Отсеивать ли групповые сообщения, не обращённые к боту (0 — пропускать всё)
+GROUP_CHATTER_FILTER = os.getenv('GROUP_CHATTER_FILTER', '1') != '0'
+
+GROUP_CHATS = ("group", "supergroup")
+
+class UpdateFilterMiddleware(BaseMiddleware):
+    """Отбрасывает необрабатываемые типы обновлений и групповую болтовню"""
+
+    def __init__(self, group_filter: bool = GROUP_CHATTER_FILTER,
+                 has_state: Callable[[int, int, int], Awaitable[bool]] = None):
+        self.group_filter = group_filter
+        # await has_state(bot_id, chat_id, user_id): идёт ли у пользователя анкета —
+        # его текст пропускаем
+        self.has_state = has_state
+        # До setup() ничего не отсеиваем
+        self.allowed: Optional[Set[str]] = None
+        self.me: Optional[User] = None
+        self.counters = {"passed": 0, "dropped_type": 0, "dropped_group": 0}
+        # Суммарное время самой проверки, с
+        self.check_time = 0.0
+
+    async def setup(self, bot: Bot, dispatcher: Dispatcher) -> list:
+        """Кэширует getMe и список обрабатываемых типов; возвращает его для allowed_updates"""
+        self.me = await bot.me()
+        allowed = dispatcher.resolve_used_update_types()
+        self.allowed = set(allowed)
+        logger.info(f"Бот @{self.me.username}, обрабатываемые обновления: {', '.join(allowed)}")
+        return allowed
+
+    def _addressed_to_bot(self, message: Message) -> bool:
+        """Команда без @другого_бота, упоминание бота или ответ на его сообщение"""
+        me = self.me
+        reply = message.reply_to_message
+        if reply and reply.from_user and reply.from_user.id == me.id:
+            return True
+
+        text = message.text or message.caption
+        if not text:
+            return False
+        if text.startswith("/"):
+            command = text.split(maxsplit=1)[0]
+            _, _, mention = command.partition("@")
+            return not mention or mention.lower() == me.username.lower()
+
+        for entity in message.entities or message.caption_entities or ():
+            if entity.type == "mention":
+                if text[entity.offset + 1:entity.offset + entity.length].lower() == me.username.lower():
+                    return True
+            elif entity.type == "text_mention" and entity.user and entity.user.id == me.id:
+                return True
+        return False
+
+    async def drop_reason(self, update: Update) -> Optional[str]:
+        """None — обновление нужно обработать, иначе ключ счётчика"""
+        if self.allowed is None:
+            return None
+        try:
+            event_type = update.event_type
+        except LookupError:
+            # Тип, которого не знает aiogram
+            return "dropped_type"
+        if event_type not in self.allowed:
+            return "dropped_type"
+        if self.group_filter and event_type == "message":
+            message = update.message
+            if message.chat.type in GROUP_CHATS and not self._addressed_to_bot(message):
+                user = message.from_user
+                if not (self.has_state and user and await self.has_state(self.me.id, message.chat.id, user.id)):
+                    return "dropped_group"
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        start = time.perf_counter()
+        reason = await self.drop_reason(event)
+        self.check_time += time.perf_counter() - start
+        if reason:
+            self.counters[reason] += 1
+            return UNHANDLED
+        self.counters["passed"] += 1
+        return await handler(event, data)
+
+    def stats(self) -> dict:
+        """Сколько обновлений отброшено и во что обошлась проверка"""
+        total = sum(self.counters.values())
+        return dict(
+            self.counters,
+            dropped=self.counters["dropped_type"] + self.counters["dropped_group"],
+            check_us_per_update=round(self.check_time / total * 1e6, 2) if total else 0.0,
+        )
@@ -0,0 +1,187 @@
+"""Webhook с мгновенным ответом и очередью обработки.
+
+/webhook сразу отвечает Telegram 200, а обновление уходит в ограниченную
+очередь. Её разбирают UPDATE_WORKERS задач; обновления одного пользователя
+обрабатываются строго по порядку и никогда параллельно (шаги анкеты FSM не
+гоняются друг с другом), разные пользователи — параллельно. Порядок держится
+только внутри процесса: если webhook обслуживают несколько процессов, очередь
+не подходит — register_webhook с workers=0 обрабатывает внутри запроса.
+
+Если в очереди уже UPDATE_QUEUE_SIZE обновлений, запрос ждёт места до
+UPDATE_ENQUEUE_TIMEOUT секунд (Telegram держит не больше max_connections
+запросов, так что это тормозит и его), а потом отвечает 503 — Telegram
+доставит обновление повторно.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений обрабатывается одновременно
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', 16))
+
+# Сколько обновлений может ждать в очереди (вместе с обрабатываемыми)
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 1000))
+
+# Сколько ждать места в полной очереди, прежде чем ответить 503
+UPDATE_ENQUEUE_TIMEOUT = float(os.getenv('UPDATE_ENQUEUE_TIMEOUT', 5))
+
+def update_key(update: Dict[str, Any]) -> Any:
+    """Ключ упорядочивания: пользователь, иначе чат, иначе само обновление"""
+    for name, body in update.items():
+        if isinstance(body, dict):
+            user = body.get("from") or body.get("user")
+            if isinstance(user, dict) and "id" in user:
+                return ("user", user["id"])
+            chat = body.get("chat") or (body.get("message") or {}).get("chat")
+            if isinstance(chat, dict) and "id" in chat:
+                return ("chat", chat["id"])
+    return ("update", update.get("update_id"))
+
+class UpdatePool:
+    """Ограниченная очередь обновлений с порядком внутри ключа"""
+
+    def __init__(self, dispatcher: Dispatcher, workers: int = UPDATE_WORKERS,
+                 max_pending: int = UPDATE_QUEUE_SIZE, **data: Any):
+        self.dispatcher = dispatcher
+        self.data = data
+        self.workers = workers
+        self.max_pending = max_pending
+        # Ключ есть в _pending, пока у него есть необработанные обновления;
+        # в _ready каждый такой ключ стоит не больше одного раза
+        self._pending: Dict[Any, Deque[Tuple[float, Bot, Dict[str, Any]]]] = {}
+        self._ready: "asyncio.Queue[Any]" = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max_pending)
+        self._tasks: List[asyncio.Task] = []
+        self._size = 0
+        self._busy = 0
+        self.counters = {"accepted": 0, "processed": 0, "failed": 0, "rejected": 0}
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def start(self):
+        """Запускает обработчики (в работающем event loop)"""
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, bot: Bot, update: Dict[str, Any], timeout: float = UPDATE_ENQUEUE_TIMEOUT) -> bool:
+        """Ставит обновление в очередь. False — очередь полна дольше timeout"""
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.counters["rejected"] += 1
+            return False
+
+        key = update_key(update)
+        queue = self._pending.get(key)
+        if queue is None:
+            queue = self._pending[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((time.monotonic(), bot, update))
+        self._size += 1
+        self.counters["accepted"] += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            enqueued_at, bot, update = queue.popleft()
+            self.last_lag = time.monotonic() - enqueued_at
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self._busy += 1
+            try:
+                result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(bot=bot, result=result)
+                self.counters["processed"] += 1
+            except Exception as e:
+                self.counters["failed"] += 1
+                logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+            finally:
+                self._busy -= 1
+                self._size -= 1
+                self._slots.release()
+                # Следующее обновление того же ключа — в конец очереди ключей,
+                # чтобы один активный пользователь не занимал обработчик целиком
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+
+    def stats(self) -> dict:
+        """Глубина очереди, задержка до начала обработки и счётчики"""
+        return dict(
+            self.counters,
+            depth=self._size,
+            waiting=self._size - self._busy,
+            busy=self._busy,
+            keys=len(self._pending),
+            capacity=self.max_pending,
+            last_lag=round(self.last_lag, 4),
+            max_lag=round(self.max_lag, 4),
+        )
+
+    async def close(self, timeout: float = 10):
+        """Дожидается разбора очереди (не дольше timeout) и останавливает обработчики"""
+        deadline = time.monotonic() + timeout
+        while self._size and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._size:
+            logger.warning(f"Остановка с необработанными обновлениями: {self._size}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler, который отвечает сразу и отдаёт обновление в UpdatePool"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, pool: UpdatePool, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, **data)
+        self.pool = pool
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        if not await self.pool.submit(bot, update):
+            # Telegram повторит доставку позже
+            return web.Response(status=503, text="Update queue is full")
+        return web.json_response({})
+
+    async def close(self) -> None:
+        await self.pool.close()
+        await super().close()
+
+    async def queue_stats(self, request: web.Request) -> web.Response:
+        """GET: состояние очереди в JSON"""
+        return web.json_response(self.pool.stats())
+
+def register_webhook(app: web.Application, dispatcher: Dispatcher, bot: Bot, path: str,
+                     workers: int = UPDATE_WORKERS, **data: Any) -> Optional[UpdatePool]:
+    """Подключает /webhook: через очередь, а при workers == 0 — как раньше,
+    обработка внутри запроса. Возвращает очередь (или None)"""
+    if workers <= 0:
+        SimpleRequestHandler(dispatcher=dispatcher, bot=bot, handle_in_background=False, **data).register(app, path=path)
+        return None
+    pool = UpdatePool(dispatcher, workers=workers, **data)
+    handler = QueuedRequestHandler(dispatcher=dispatcher, bot=bot, pool=pool, **data)
+    handler.register(app, path=path)
+    app.router.add_get(f"{path}/queue", handler.queue_stats)
+
+    async def start_pool(app: web.Application):
+        pool.start()
+
+    app.on_startup.append(start_pool)
+    return pool